@@ -7,6 +7,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import func
 from database.models import User, Card, Group, Category, Tag, card_tags
 from database.session import get_session
+from database.catalog_cache import catalog_cache
 from bot.utils.image_utils import ensure_photo_file_id, is_document_image
 import logging
 import re
@@ -93,26 +94,32 @@ async def add_card(message: types.Message):
 
         # Extract the image and convert if necessary
         photo_file_id = None
+        # "photo" (proporção verificada), "document" ou None (pendente para a rotina de normalização)
+        image_kind = None
         try:
             if message.reply_to_message.photo:
                 # É uma foto - usar a versão de maior resolução
-                photo_file_id = await ensure_photo_file_id(
+                photo_file_id, verified = await ensure_photo_file_id(
                     bot=message.bot, 
                     content=message.reply_to_message.photo[-1],
                     user_id=user_id,
                     force_aspect_ratio=True
                 )
+                # Sem verificação (ex.: falha temporária), a rotina em segundo plano tenta de novo
+                image_kind = "photo" if verified else None
             elif message.reply_to_message.document:
                 # Verificar se o documento é uma imagem válida
                 document = message.reply_to_message.document
                 if await is_document_image(document):
                     # Converter documento para foto com proporção correta
-                    photo_file_id = await ensure_photo_file_id(
+                    photo_file_id, verified = await ensure_photo_file_id(
                         bot=message.bot, 
                         content=document,
                         user_id=user_id,
                         force_aspect_ratio=True
                     )
+                    # Se a conversão falhou, o card continua como documento
+                    image_kind = "photo" if verified else "document"
                 else:
                     if user_id in pending_card_additions:
                         del pending_card_additions[user_id]
@@ -274,6 +281,8 @@ async def add_card(message: types.Message):
                         name=card_name,
                         rarity=rarity,
                         image_file_id=photo_file_id,
+                        image_kind=image_kind,
+                        image_normalized=1 if image_kind == "photo" else 0,
                         group_id=group.id
                     )
                     session.add(new_card)
@@ -286,6 +295,9 @@ async def add_card(message: types.Message):
                     if tag:
                         await session.execute(card_tags.insert().values(card_id=new_card.id, tag_id=tag.id))
 
+            # O catálogo em memória precisa enxergar o novo card (e grupo/categoria)
+            catalog_cache.invalidate()
+
             # Limpar transação pendente após sucesso
             if user_id in pending_card_additions:
                 del pending_card_additions[user_id]
@@ -0,0 +1,178 @@
+from datetime import datetime, timedelta
+
+from aiogram import Router
+from aiogram.enums import ParseMode
+from aiogram.filters import Command
+from aiogram.types import Message
+from sqlalchemy import select, delete
+
+from database.session import get_session
+from database.catalog_cache import catalog_cache
+from database.drop_tables import ALLOWED_RARITIES, DEFAULT_DROP_WEIGHTS
+from database.models import User, DropTable, Category, Group
+
+router = Router()
+
+USAGE = (
+    "❗ Uso:\n"
+    "`/droptable` - Lista as tabelas de drop\n"
+    "`/droptable set <escopo> 🥉=50 🥈=30 🥇=20 [inicio fim]` - Define as chances\n"
+    "`/droptable del <id>` - Remove uma linha da tabela\n\n"
+    "Escopo: `global`, `c<ID da categoria>` ou `g<ID do grupo>`.\n"
+    "Datas opcionais (evento, UTC) no formato `AAAA-MM-DD`; o fim é inclusivo."
+)
+
+
+def describe_scope(row: DropTable) -> str:
+    if row.group_id is not None:
+        return f"grupo {row.group_id}"
+    if row.category_id is not None:
+        return f"categoria {row.category_id}"
+    return "global"
+
+
+def describe_window(row: DropTable) -> str:
+    if row.starts_at is None and row.ends_at is None:
+        return "permanente"
+    start = row.starts_at.strftime("%Y-%m-%d") if row.starts_at else "..."
+    end = (row.ends_at - timedelta(days=1)).strftime("%Y-%m-%d") if row.ends_at else "..."
+    return f"evento {start} a {end}"
+
+
+@router.message(Command(commands=["droptable"]))
+async def droptable_command(message: Message) -> None:
+    """
+    Comando exclusivo para administradores: configura as chances de raridade
+    do /capturar por categoria, grupo ou evento, sem precisar de deploy.
+    """
+    user_id = message.from_user.id
+
+    async with get_session() as session:
+        result = await session.execute(select(User).where(User.id == user_id))
+        user = result.scalar_one_or_none()
+
+        if not user or user.is_admin != 1:
+            await message.reply("❌ Você não tem permissão para usar este comando.")
+            return
+
+        args = message.text.strip().split()[1:]
+
+        # Listagem
+        if not args:
+            result = await session.execute(
+                select(DropTable).order_by(
+                    DropTable.group_id, DropTable.category_id, DropTable.starts_at, DropTable.id
+                )
+            )
+            rows = result.scalars().all()
+
+            default = " ".join(f"{r}={w}" for r, w in DEFAULT_DROP_WEIGHTS.items())
+            lines = [f"🎲 **Tabelas de drop**\n\nPadrão: {default}\n"]
+            for row in rows:
+                lines.append(
+                    f"`{row.id}` - {describe_scope(row)}, {describe_window(row)}: {row.rarity}={row.weight}"
+                )
+            if not rows:
+                lines.append("Nenhuma tabela configurada.")
+            lines.append("\n" + USAGE)
+
+            await message.reply("\n".join(lines), parse_mode=ParseMode.MARKDOWN)
+            return
+
+        action = args[0].lower()
+
+        if action == "del" and len(args) == 2 and args[1].isdigit():
+            result = await session.execute(delete(DropTable).where(DropTable.id == int(args[1])))
+            await session.commit()
+            if result.rowcount == 0:
+                await message.reply("❌ Linha da tabela de drop não encontrada.")
+                return
+            catalog_cache.invalidate()
+            await message.reply("✅ Linha removida da tabela de drop.")
+            return
+
+        if action != "set" or len(args) < 3:
+            await message.reply(USAGE, parse_mode=ParseMode.MARKDOWN)
+            return
+
+        # Escopo
+        scope = args[1].lower()
+        category_id = None
+        group_id = None
+        if scope == "global":
+            pass
+        elif scope[0] == "c" and scope[1:].isdigit():
+            category_id = int(scope[1:])
+            if not await session.get(Category, category_id):
+                await message.reply("❌ Categoria não encontrada.")
+                return
+        elif scope[0] == "g" and scope[1:].isdigit():
+            group_id = int(scope[1:])
+            group = await session.get(Group, group_id)
+            if not group:
+                await message.reply("❌ Grupo não encontrado.")
+                return
+            category_id = group.category_id
+        else:
+            await message.reply(USAGE, parse_mode=ParseMode.MARKDOWN)
+            return
+
+        # Pesos e datas
+        weights = {}
+        dates = []
+        for arg in args[2:]:
+            if "=" in arg:
+                rarity, _, weight = arg.partition("=")
+                if rarity not in ALLOWED_RARITIES or not weight.isdigit():
+                    await message.reply(
+                        f"❌ Peso inválido: `{arg}`. Raridades permitidas: {', '.join(ALLOWED_RARITIES)}.",
+                        parse_mode=ParseMode.MARKDOWN
+                    )
+                    return
+                weights[rarity] = int(weight)
+            else:
+                try:
+                    dates.append(datetime.strptime(arg, "%Y-%m-%d"))
+                except ValueError:
+                    await message.reply(USAGE, parse_mode=ParseMode.MARKDOWN)
+                    return
+
+        if not weights or sum(weights.values()) <= 0 or len(dates) not in (0, 2):
+            await message.reply(USAGE, parse_mode=ParseMode.MARKDOWN)
+            return
+
+        starts_at, ends_at = (dates[0], dates[1] + timedelta(days=1)) if dates else (None, None)
+        if starts_at is not None and ends_at <= starts_at:
+            await message.reply("❌ A data final precisa ser igual ou posterior à inicial.")
+            return
+
+        # Substitui a tabela do mesmo escopo e janela
+        await session.execute(
+            delete(DropTable).where(
+                DropTable.category_id.is_(None) if category_id is None else DropTable.category_id == category_id,
+                DropTable.group_id.is_(None) if group_id is None else DropTable.group_id == group_id,
+                DropTable.starts_at.is_(None) if starts_at is None else DropTable.starts_at == starts_at,
+                DropTable.ends_at.is_(None) if ends_at is None else DropTable.ends_at == ends_at,
+            )
+        )
+        session.add_all([
+            DropTable(
+                category_id=category_id,
+                group_id=group_id,
+                rarity=rarity,
+                weight=weight,
+                starts_at=starts_at,
+                ends_at=ends_at,
+            )
+            for rarity, weight in weights.items()
+        ])
+        await session.commit()
+
+    catalog_cache.invalidate()
+
+    total = sum(weights.values())
+    odds = "\n".join(f"{r}: {w / total:.1%}" for r, w in weights.items())
+    await message.reply(
+        f"✅ Tabela de drop atualizada ({scope}).\n\n{odds}",
+        parse_mode=ParseMode.MARKDOWN
+    )
@@ -6,6 +6,7 @@ from sqlalchemy import select, update
 from sqlalchemy.orm import selectinload
 
 from database.session import get_session
+from database.catalog_cache import catalog_cache
 from database.models import User, Group
 
 router = Router()
@@ -80,5 +81,6 @@ async def imgpd_command(message: Message) -> None:
             .values(image_file_id=image_file_id)
         )
         await session.commit()
+        catalog_cache.invalidate()
 
         await message.reply(f"✅ Imagem associada com sucesso ao grupo {group.id}. {group.name}!")
\ No newline at end of file
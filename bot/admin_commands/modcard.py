@@ -9,6 +9,7 @@ from sqlalchemy.future import select
 from sqlalchemy import update, delete
 from database.models import User, Card, Inventory
 from database.session import get_session
+from database.inventory import add_cards, remove_cards
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -142,7 +143,10 @@ async def modify_card_quantity(message: types.Message):
             if quantity == 0:
                 # Se a quantidade é 0, remover a carta do inventário
                 if inventory_item:
-                    await session.delete(inventory_item)
+                    if inventory_item.quantity > 0:
+                        await remove_cards(session, user.id, {card_id: inventory_item.quantity})
+                    else:
+                        await session.delete(inventory_item)
                     await session.commit()
                     await message.reply(
                         f"✅ **Sucesso!** Todas as unidades da carta ID {card_id} ({card.name}) foram removidas do inventário de '{nickname}'.",
@@ -158,7 +162,10 @@ async def modify_card_quantity(message: types.Message):
                 if inventory_item:
                     # Se o item já existe, atualizar a quantidade
                     old_quantity = inventory_item.quantity
-                    inventory_item.quantity = quantity
+                    if quantity > old_quantity:
+                        await add_cards(session, user.id, {card_id: quantity - old_quantity})
+                    elif quantity < old_quantity:
+                        await remove_cards(session, user.id, {card_id: old_quantity - quantity})
                     await session.commit()
                     await message.reply(
                         f"✅ **Sucesso!** A quantidade da carta ID {card_id} ({card.name}) para '{nickname}' foi alterada de {old_quantity} para {quantity}.",
@@ -166,8 +173,7 @@ async def modify_card_quantity(message: types.Message):
                     )
                 else:
                     # Se o item não existe, criar um novo
-                    new_inventory = Inventory(user_id=user.id, card_id=card_id, quantity=quantity)
-                    session.add(new_inventory)
+                    await add_cards(session, user.id, {card_id: quantity})
                     await session.commit()
                     await message.reply(
                         f"✅ **Sucesso!** Adicionadas {quantity} unidades da carta ID {card_id} ({card.name}) ao inventário de '{nickname}'.",
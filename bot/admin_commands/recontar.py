@@ -0,0 +1,41 @@
+import logging
+
+from aiogram import Router
+from aiogram.enums import ParseMode
+from aiogram.filters import Command
+from aiogram.types import Message
+from sqlalchemy import select
+
+from database.session import get_session
+from database.inventory import recompute_user_counters, recompute_group_progress
+from database.models import User
+
+logger = logging.getLogger(__name__)
+
+router = Router()
+
+@router.message(Command(commands=["recontar"]))
+async def recontar_command(message: Message) -> None:
+    """
+    Comando exclusivo para administradores: recalcula, a partir do inventário,
+    os contadores de coleção de todos os usuários (total, distintos e por raridade)
+    e o progresso por grupo usado pela /pokedex.
+    Uso: /recontar
+    """
+    async with get_session() as session:
+        result = await session.execute(select(User).where(User.id == message.from_user.id))
+        user = result.scalar_one_or_none()
+
+        if not user or user.is_admin != 1:
+            await message.reply("❌ Você não tem permissão para usar este comando.")
+            return
+
+        updated = await recompute_user_counters(session)
+        await recompute_group_progress(session)
+        await session.commit()
+
+    logger.info(f"Admin {message.from_user.id} recalculou os contadores de {updated} usuários")
+    await message.reply(
+        f"✅ Contadores de coleção e progresso por grupo recalculados para `{updated}` usuários.",
+        parse_mode=ParseMode.MARKDOWN
+    )
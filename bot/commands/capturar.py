@@ -1,25 +1,47 @@
 # commands/capturar.py
 
 import random
-import time
+from collections import Counter
 from aiogram import Router, types
 from aiogram.filters import Command
 from aiogram.enums import ParseMode
 from aiogram.types import InputMediaPhoto, InputMediaDocument, CallbackQuery
+from aiogram.utils.media_group import MediaGroupBuilder
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from sqlalchemy import select, func, update  # Adicionado 'update' aqui
 from database.session import get_session
-from database.models import User, Card, Inventory, Category, Group
-from utils.image_utils import ensure_photo_file_id
+from database.models import User
+from database.crud_user import spend_pokeballs
+from database.inventory import add_cards, InventoryChange
+from database.catalog_cache import catalog_cache
+from utils.capture_sessions import capture_sessions
+from utils.titles import title_change_message
 
 router = Router()
 
-# Dicionário para rastrear usuários em processo de captura
-# Formato: {user_id: timestamp}
-active_captures = {}
+# Máximo de cards por /cap N
+MAX_MULTI_CAPTURE = 50
+
+# Ordem usada para destacar as capturas mais raras (menor = mais raro)
+RARITY_ORDER = {"💎": 0, "🥇": 1, "🥈": 2, "🥉": 3}
+
+# Quantidade máxima de imagens enviadas no resumo de uma captura múltipla
+MULTI_CAPTURE_MEDIA_LIMIT = 3
+
+def draw_cards(group_id: int, amount: int) -> list:
+    """
+    Sorteia `amount` cards de um grupo usando o catálogo em memória.
+    As raridades vêm da tabela de drop em vigor para o grupo (já renormalizada
+    sobre as raridades que o grupo possui); o card é escolhido dentro da raridade.
+    """
+    sampler = catalog_cache.get_group_sampler(group_id)
+    if sampler is None:
+        return []
+
+    return [
+        random.choice(catalog_cache.get_group_cards(group_id, rarity))
+        for rarity in sampler.sample_many(amount)
+    ]
 
-# Tempo máximo (em segundos) que um usuário pode ficar no estado de captura
-CAPTURE_TIMEOUT = 180  # 3 minutos
 
 @router.message(Command(commands=["cap", "capturar"]))
 async def capturar_command(message: types.Message):
@@ -36,17 +58,23 @@ async def capturar_command(message: types.Message):
         )
         return
 
+    # /cap N captura N cards de uma vez
+    args = message.text.split(maxsplit=1)
+    amount = 1
+    if len(args) > 1:
+        if not args[1].strip().isdigit() or not 1 <= int(args[1].strip()) <= MAX_MULTI_CAPTURE:
+            await message.reply(
+                f"❗ Uso: `/cap` ou `/cap quantidade` (de 1 a {MAX_MULTI_CAPTURE}).",
+                parse_mode=ParseMode.MARKDOWN
+            )
+            return
+        amount = int(args[1].strip())
+
     user_id = message.from_user.id
-    current_time = time.time()
-    
-    # Limpar capturas antigas antes de verificar
-    # Isso ajuda a resolver problemas de usuários "travados"
-    for uid in list(active_captures.keys()):
-        if current_time - active_captures[uid] > CAPTURE_TIMEOUT:
-            del active_captures[uid]
     
     # Verificar se o usuário já está em processo de captura
-    if user_id in active_captures:
+    # (sessões vencidas são descartadas pelo próprio registro)
+    if capture_sessions.get(user_id) is not None:
         await message.reply(
             "⚠️ **Você já tem um processo de captura em andamento!**\n"
             "Complete sua captura atual ou aguarde alguns minutos antes de tentar novamente.\n\n"
@@ -74,9 +102,17 @@ async def capturar_command(message: types.Message):
             )
             return
 
-        # Fetch all categories
-        result = await session.execute(select(Category).order_by(Category.name))
-        categories = result.scalars().all()
+        if user.pokeballs < amount:
+            await message.reply(
+                f"🎯 **Pokébolas insuficientes!**\n"
+                f"Você tem {user.pokeballs} pokébolas e tentou capturar {amount} cards.",
+                parse_mode=ParseMode.MARKDOWN
+            )
+            return
+
+        # Fetch all categories (from the in-memory catalog)
+        await catalog_cache.ensure_loaded()
+        categories = catalog_cache.get_categories()
 
         if not categories:
             await message.reply(
@@ -85,8 +121,8 @@ async def capturar_command(message: types.Message):
             )
             return
             
-        # Marcar usuário como em processo de captura com timestamp atual
-        active_captures[user_id] = current_time
+        # Marcar usuário como em processo de captura
+        capture_sessions.start(user_id, amount)
 
         # Build inline keyboard with user-specific callback data
         keyboard = InlineKeyboardBuilder()
@@ -105,6 +141,8 @@ async def capturar_command(message: types.Message):
             f"⚡️ @{message.from_user.username or 'Treinador'}, está na hora de capturar! Selecione uma das categorias.\n\n"
             f"🧶 Você tem {user.pokeballs} pokebolas.\n\n"
         )
+        if amount > 1:
+            msg_text += f"🎯 Captura múltipla: {amount} cards.\n\n"
 
         await message.answer(
             msg_text,
@@ -116,10 +154,12 @@ async def capturar_command(message: types.Message):
 async def handle_category_choice(callback: CallbackQuery):
     """
     Handles the user tapping on a category button:
-    1) Verifies that the callback is from the correct user.
+    1) Verifies that the callback is from the correct user and that
+       their capture session is still active.
     2) Retrieves all groups from the chosen category.
     3) Randomly selects up to five distinct groups.
-    4) Shows these group options to the user for the next step.
+    4) Stores the category and offered groups in the capture session and
+       shows these group options to the user for the next step.
     """
     data_parts = callback.data.split("_")
     # Expected format: "choose_cat_{user_id}_{category_id}"
@@ -135,76 +175,66 @@ async def handle_category_choice(callback: CallbackQuery):
     category_id = int(data_parts[3])
     user_id = callback.from_user.id
 
-    async with get_session() as session:
-        # Get the user
-        user = await session.get(User, user_id)
-        if not user:
-            await callback.message.edit_text(
-                "❌ Você não se registrou ainda!\nUse `/jornada` para iniciar sua aventura.",
-                parse_mode=ParseMode.MARKDOWN
-            )
-            return
-
-        if user.pokeballs <= 0:
-            await callback.message.edit_text(
-                "🎯 **Você está sem pokébolas!**\n"
-                "Adquira mais antes de tentar capturar um card.",
-                parse_mode=ParseMode.MARKDOWN
-            )
-            return
-
-        # Retrieve all groups for this category
-        groups_result = await session.execute(
-            select(Group).where(Group.category_id == category_id)
-        )
-        all_groups = groups_result.scalars().all()
-
-        if not all_groups:
-            await callback.message.edit_text(
-                "⚠️ Nenhum grupo encontrado nesta categoria.",
-                parse_mode=ParseMode.MARKDOWN
-            )
-            return
-
-        # Shuffle and slice up to 5 groups
-        random.shuffle(all_groups)
-        groups_to_show = all_groups[:5]
-
-        # Build an inline keyboard of groups
-        keyboard = InlineKeyboardBuilder()
-        for index, grp in enumerate(groups_to_show):
-            # New callback data format for group selection:
-            # choose_group_{user_id}_{category_id}_{group_id}
-            keyboard.button(
-                text=grp.name.upper(),
-                callback_data=f"choose_group_{user_id}_{category_id}_{grp.id}"
-            )
-            if (index + 1) % 2 == 0:
-                keyboard.adjust(2)
-        keyboard.adjust(2)
+    # Verificar se o usuário ainda está com a sessão de captura ativa.
+    # Pokébolas são validadas na captura, pelo decremento condicional.
+    capture = capture_sessions.get(user_id)
+    if capture is None:
+        await callback.answer("Sua sessão de captura expirou. Inicie uma nova captura.", show_alert=True)
+        return
 
-        # Verificar se o usuário ainda está no timeout ativo após verificação de dados
-        if user_id not in active_captures:
-            await callback.answer("Sua sessão de captura expirou. Inicie uma nova captura.", show_alert=True)
-            return
+    # Retrieve all groups for this category (from the in-memory catalog)
+    await catalog_cache.ensure_loaded()
+    all_groups = list(catalog_cache.get_groups(category_id))
 
+    if not all_groups:
         await callback.message.edit_text(
-            text="Selecione um grupo para tentar capturar:",
-            reply_markup=keyboard.as_markup(),
+            "⚠️ Nenhum grupo encontrado nesta categoria.",
             parse_mode=ParseMode.MARKDOWN
         )
+        return
+
+    # Shuffle and slice up to 5 groups
+    random.shuffle(all_groups)
+    groups_to_show = all_groups[:5]
+
+    capture.category_id = category_id
+    capture.offered_group_ids = tuple(grp.id for grp in groups_to_show)
+
+    # Build an inline keyboard of groups
+    keyboard = InlineKeyboardBuilder()
+    for index, grp in enumerate(groups_to_show):
+        # New callback data format for group selection:
+        # choose_group_{user_id}_{category_id}_{group_id}
+        keyboard.button(
+            text=grp.name.upper(),
+            callback_data=f"choose_group_{user_id}_{category_id}_{grp.id}"
+        )
+        if (index + 1) % 2 == 0:
+            keyboard.adjust(2)
+    keyboard.adjust(2)
+
+    await callback.message.edit_text(
+        text="Selecione um grupo para tentar capturar:",
+        reply_markup=keyboard.as_markup(),
+        parse_mode=ParseMode.MARKDOWN
+    )
 
 @router.callback_query(lambda call: call.data.startswith("choose_group_"))
 async def handle_group_choice(callback: CallbackQuery):
     """
     Handles the user tapping on a group button:
-    1) Verifies that the callback is from the correct user.
-    2) Deducts 1 pokebola from the user.
-    3) Determines the target rarity based on probability.
-    4) Selects a random card from that group with the target rarity.
-       If no card is found, falls back to any card in that group.
-    5) Adds the card to the user's inventory.
-    6) Shows the result with an image + stats using the card's actual rarity.
+    1) Verifies that the callback is from the correct user and matches
+       the category/groups stored in their capture session.
+    2) Determines the target rarity from the group's drop table.
+    3) Selects a random card from that group with the target rarity,
+       using the in-memory catalog.
+    4) Deducts 1 pokebola and adds the card to the user's inventory
+       in a single transaction.
+    5) Shows the result with an image + stats using the card's actual rarity.
+
+    For /cap N, all N cards are drawn in one pass, paid with a single
+    pokebola decrement and written with a single inventory upsert, and
+    the result is shown as one summary message.
     """
     data_parts = callback.data.split("_")
     # Expected format: "choose_group_{user_id}_{category_id}_{group_id}"
@@ -223,150 +253,190 @@ async def handle_group_choice(callback: CallbackQuery):
     group_id = int(data_parts[4])
     user_id = callback.from_user.id
 
-    async with get_session() as session:
-        # Get the user
-        user = await session.get(User, user_id)
-        if not user:
-            await callback.message.edit_text(
-                "❌ Você não se registrou ainda!\nUse `/jornada` para iniciar sua aventura.",
-                parse_mode=ParseMode.MARKDOWN
-            )
-            return
+    # The button must belong to the user's current capture session
+    capture = capture_sessions.get(user_id)
+    if (
+        capture is None
+        or capture.category_id != category_id
+        or group_id not in capture.offered_group_ids
+    ):
+        await callback.answer("Sua sessão de captura expirou. Inicie uma nova captura.", show_alert=True)
+        return
 
-        if user.pokeballs <= 0:
-            await callback.message.edit_text(
-                "🎯 **Você está sem pokébolas!**\n"
-                "Adquira mais antes de tentar capturar um card.",
-                parse_mode=ParseMode.MARKDOWN
-            )
-            return
+    # Encerrar a sessão antes de capturar para que um toque duplo não capture duas vezes
+    capture_sessions.finish(user_id)
+    amount = capture.amount
 
-        # Deduct 1 pokebola
-        user.pokeballs -= 1
-        await session.commit()
+    # Draw the cards in memory (target rarity from the group's drop table)
+    await catalog_cache.ensure_loaded()
+    drawn_cards = draw_cards(group_id, amount)
 
-        # Determine target rarity based on probability
-        roll = random.random()  # 0.0 <= roll < 1.0
-        if roll < 0.50:
-            target_rarity = "🥉"
-        elif roll < 0.80:
-            target_rarity = "🥈"
-        else:
-            target_rarity = "🥇"
-
-        # Get a random card in that group with the target rarity
-        card_result = await session.execute(
-            select(Card)
-            .where(Card.group_id == group_id, Card.rarity == target_rarity)
-            .order_by(func.random())
-            .limit(1)
+    if not drawn_cards:
+        await callback.message.edit_text(
+            "⚠️ Nenhum card foi encontrado neste grupo no momento.",
+            parse_mode=ParseMode.MARKDOWN
         )
-        card = card_result.scalar_one_or_none()
-
-        # If no card found for the target rarity, fallback to any card in that group
-        if not card:
-            card_result = await session.execute(
-                select(Card)
-                .where(Card.group_id == group_id)
-                .order_by(func.random())
-                .limit(1)
-            )
-            card = card_result.scalar_one_or_none()
+        return
 
-        if not card:
-            await callback.message.edit_text(
-                "⚠️ Nenhum card foi encontrado neste grupo no momento.",
-                parse_mode=ParseMode.MARKDOWN
-            )
-            return
+    drawn_counts = Counter(card.id for card in drawn_cards)
 
-        # Add the card to the user's inventory
-        inv_result = await session.execute(
-            select(Inventory).where(
-                Inventory.user_id == user_id,
-                Inventory.card_id == card.id
-            )
+    # Deduct the pokebolas and add the cards to the inventory in a single transaction.
+    # The conditional decrement (WHERE pokeballs >= amount) prevents double taps from
+    # spending pokebolas the user no longer has.
+    async with get_session() as session:
+        async with session.begin():
+            remaining_pokeballs = await spend_pokeballs(session, user_id, amount)
+            if remaining_pokeballs is not None:
+                captured = await add_cards(session, user_id, dict(drawn_counts))
+
+    if remaining_pokeballs is None:
+        await callback.message.edit_text(
+            "🎯 **Você está sem pokébolas!**\n"
+            "Adquira mais antes de tentar capturar um card.",
+            parse_mode=ParseMode.MARKDOWN
         )
-        inv_item = inv_result.scalar_one_or_none()
+        return
 
-        if inv_item:
-            inv_item.quantity += 1
-        else:
-            new_inv = Inventory(user_id=user_id, card_id=card.id, quantity=1)
-            session.add(new_inv)
-        await session.commit()
-
-        # Gather information for the caption
-        category_obj = await session.get(Category, category_id)
-        category_name = category_obj.name if category_obj else "Desconhecida"
-
-        group_obj = await session.get(Group, group_id)
-        group_name = group_obj.name if group_obj else "Desconhecido"
-
-        user_nickname = callback.from_user.username or "Treinador"
-        final_rarity = card.rarity
-
-        caption = (
-            f"🎰 Que sorte, @{user_nickname}! você acabou de capturar um pokecard.\n\n"
-            f"{final_rarity}{card.id}. {card.name} (1x)\n"
-            f"📚 Categoria: {category_name}\n"
-            f"📁 Grupo: {group_name}\n\n"
-            f"🃏 Você agora tem {inv_item.quantity if inv_item else 1} deste card.\n\n"
-            f"🎒Pokébolas restantes: {user.pokeballs}"
+    if amount > 1:
+        await send_multi_capture_summary(
+            callback, category_id, group_id, drawn_cards, captured, remaining_pokeballs
         )
+        return
 
-        # Limpar o estado de captura do usuário no final do processo
-        if user_id in active_captures:
-            del active_captures[user_id]
-
-        # Handle the card's image properly
-        if card.image_file_id:
-            try:
-                # Ensure image has correct aspect ratio
-                photo_id = card.image_file_id
-                try:
-                    # Try to convert and fix aspect ratio if needed
-                    photo_id = await ensure_photo_file_id(
-                        callback.bot, 
-                        types.Document(file_id=card.image_file_id),
-                        force_aspect_ratio=True
-                    )
-                    
-                    # Update card's file_id if it changed
-                    if photo_id != card.image_file_id:
-                        await session.execute(
-                            update(Card)
-                            .where(Card.id == card.id)
-                            .values(image_file_id=photo_id)
-                        )
-                        await session.commit()
-                except Exception:
-                    # If conversion fails, use original file_id
-                    pass
-                
-                # Send the image
-                await callback.message.edit_media(
-                    media=InputMediaPhoto(
-                        media=photo_id,
-                        caption=caption,
-                        parse_mode=ParseMode.MARKDOWN
-                    ),
-                    reply_markup=None
+    card = drawn_cards[0]
+
+    # Gather information for the caption
+    category_obj = catalog_cache.get_category(category_id)
+    category_name = category_obj.name if category_obj else "Desconhecida"
+
+    group_obj = catalog_cache.get_group(group_id)
+    group_name = group_obj.name if group_obj else "Desconhecido"
+
+    user_nickname = callback.from_user.username or "Treinador"
+    final_rarity = card.rarity
+
+    caption = (
+        f"🎰 Que sorte, @{user_nickname}! você acabou de capturar um pokecard.\n\n"
+        f"{final_rarity}{card.id}. {card.name} (1x)\n"
+        f"📚 Categoria: {category_name}\n"
+        f"📁 Grupo: {group_name}\n\n"
+        f"🃏 Você agora tem {captured.quantities[card.id]} deste card.\n\n"
+        f"🎒Pokébolas restantes: {remaining_pokeballs}"
+    )
+
+    # Aviso de novo título (só quando a captura cruza um limite)
+    title_note = title_change_message(user_nickname, captured.total_before, captured.total_after)
+    if title_note:
+        caption += f"\n\n{title_note}"
+
+    # Handle the card's image properly.
+    # The file_id is normalized once (at /addcarta or by the background job),
+    # so the capture only sends it, without downloading or re-uploading.
+    if card.image_file_id:
+        try:
+            if card.image_kind == "document":
+                media = InputMediaDocument(
+                    media=card.image_file_id,
+                    caption=caption,
+                    parse_mode=ParseMode.MARKDOWN
                 )
-            except Exception as e:
-                # Fallback for any errors
-                await callback.message.edit_text(
-                    caption,
+            else:
+                media = InputMediaPhoto(
+                    media=card.image_file_id,
+                    caption=caption,
                     parse_mode=ParseMode.MARKDOWN
                 )
-        else:
-            # Fallback to text if no image is available
+
+            # Send the image
+            await callback.message.edit_media(media=media, reply_markup=None)
+        except Exception as e:
+            # Fallback for any errors
             await callback.message.edit_text(
                 caption,
                 parse_mode=ParseMode.MARKDOWN
             )
+    else:
+        # Fallback to text if no image is available
+        await callback.message.edit_text(
+            caption,
+            parse_mode=ParseMode.MARKDOWN
+        )
+
+async def send_multi_capture_summary(
+    callback: CallbackQuery,
+    category_id: int,
+    group_id: int,
+    drawn_cards: list,
+    captured: InventoryChange,
+    remaining_pokeballs: int
+):
+    """
+    Shows the result of a /cap N as a single summary message, followed by
+    a media group with the rarest cards captured (🥇 and 💎).
+    """
+    category_obj = catalog_cache.get_category(category_id)
+    category_name = category_obj.name if category_obj else "Desconhecida"
+
+    group_obj = catalog_cache.get_group(group_id)
+    group_name = group_obj.name if group_obj else "Desconhecido"
+
+    user_nickname = callback.from_user.username or "Treinador"
+    drawn_counts = Counter(card.id for card in drawn_cards)
+    total = len(drawn_cards)
+
+    # Rarest first, then by card ID
+    cards = sorted(
+        {card.id: card for card in drawn_cards}.values(),
+        key=lambda c: (RARITY_ORDER.get(c.rarity, len(RARITY_ORDER)), c.id)
+    )
+
+    lines = [
+        f"{card.rarity}{card.id}. {card.name} ({drawn_counts[card.id]}x) — agora tem {captured.quantities[card.id]}"
+        for card in cards
+    ]
+
+    summary = (
+        f"🎰 Que sorte, @{user_nickname}! você acabou de capturar {total} pokecards.\n\n"
+        f"📚 Categoria: {category_name}\n"
+        f"📁 Grupo: {group_name}\n\n"
+        + "\n".join(lines)
+        + f"\n\n🎒Pokébolas restantes: {remaining_pokeballs}"
+    )
+
+    title_note = title_change_message(user_nickname, captured.total_before, captured.total_after)
+    if title_note:
+        summary += f"\n\n{title_note}"
+
+    await callback.message.edit_text(summary, parse_mode=ParseMode.MARKDOWN)
+
+    # Media groups cannot mix photos and documents; only photos are shown
+    rare_cards = [
+        card for card in cards
+        if card.rarity in ("💎", "🥇") and card.image_file_id and card.image_kind != "document"
+    ][:MULTI_CAPTURE_MEDIA_LIMIT]
+
+    if not rare_cards:
+        return
 
-# Adicionar função para limpar estados de captura sem atividade (opcional - pode ser implementado futuramente)
-# Esta função poderia ser chamada periodicamente por um scheduler para limpar capturas abandonadas
-async def clear_abandoned_captures():
-    active_captures.clear()
+    try:
+        if len(rare_cards) == 1:
+            card = rare_cards[0]
+            await callback.message.answer_photo(
+                photo=card.image_file_id,
+                caption=f"{card.rarity}{card.id}. {card.name}"
+            )
+        else:
+            media_group = MediaGroupBuilder()
+            for card in rare_cards:
+                media_group.add_photo(
+                    media=card.image_file_id,
+                    caption=f"{card.rarity}{card.id}. {card.name}"
+                )
+            await callback.message.answer_media_group(media=media_group.build())
+    except Exception:
+        # As imagens são apenas um complemento do resumo
+        pass
+
+def expire_captures() -> int:
+    """Remove as sessões de captura vencidas; chamada periodicamente pelo main."""
+    return capture_sessions.expire_due()
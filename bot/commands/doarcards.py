@@ -2,12 +2,19 @@ from aiogram import Router, types, F
 from aiogram.enums import ParseMode
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
-from sqlalchemy import select
-from sqlalchemy.orm import joinedload
 
-from database.models import User, Inventory, Card
+from database.models import User, Card
 from database.session import get_session, run_transaction
-from database.utils import consolidate_inventory_duplicates
+from database.user_lookup import resolve_user
+from database.inventory import (
+    add_cards,
+    remove_cards,
+    lock_inventory_rows,
+    transfer_all_cards as transfer_all_inventory,
+)
+from database.catalog_cache import catalog_cache
+from database.crud_user import lock_users
+from utils.titles import title_change_message
 import logging
 
 # Configure logger
@@ -26,6 +33,9 @@ OFFICIAL_GROUPS = {
     "pokuginasio": -1002533762710
 }
 
+# Quantos cards listar na resposta do `/doarcards *` (o total é sempre mostrado)
+DONATE_ALL_LIST_LIMIT = 30
+
 @router.message(Command(commands=["doarcards"]))
 async def doarcards_command(message: types.Message, state: FSMContext) -> None:
     # Verificar se o comando está sendo usado em um grupo oficial
@@ -54,12 +64,6 @@ async def doarcards_command(message: types.Message, state: FSMContext) -> None:
 
     donor_id = message.from_user.id
     
-    # Atualizar o nome de usuário no banco de dados se o usuário mudou de @username
-    async with get_session() as session:
-        # Silently update username if it changed
-        if message.from_user.username:
-            await update_username_if_changed(session, donor_id, message.from_user.username)
-    
     nickname = None
     cards_input = None
     recipient_id = None
@@ -168,16 +172,10 @@ async def doarcards_command(message: types.Message, state: FSMContext) -> None:
     if cards_input == "*":
         # Processar doação de todos os cards imediatamente
         async def transfer_all_cards(session):
-            # Carregar dados do doador e destinatário
-            donor_result = await session.execute(
-                select(User).where(User.id == donor_id).options(joinedload(User.inventory))
-            )
-            donor = donor_result.unique().scalar_one_or_none()
-
-            recipient_result = await session.execute(
-                select(User).where(User.id == recipient_id)
-            )
-            recipient = recipient_result.scalar_one_or_none()
+            # Carregar doador e destinatário (sem o inventário)
+            users = await lock_users(session, [donor_id, recipient_id])
+            donor = users.get(donor_id)
+            recipient = users.get(recipient_id)
             
             if not donor or not recipient:
                 return {"success": False, "error": "Usuário não encontrado"}
@@ -185,37 +183,20 @@ async def doarcards_command(message: types.Message, state: FSMContext) -> None:
             if donor.id == recipient.id:
                 return {"success": False, "error": "Não é possível doar para si mesmo"}
             
-            # Consolidar possíveis duplicatas do doador e destinatário antes de processar
-            await consolidate_inventory_duplicates(session, donor.id)
-            await consolidate_inventory_duplicates(session, recipient.id)
+            # Transferir todos os cards em um único comando (inventários,
+            # contadores e progresso por grupo dos dois usuários)
+            transfer = await transfer_all_inventory(session, donor.id, recipient.id)
+            donated_cards = sorted(transfer.moved.items())
+            title_notes = [
+                note for note in (
+                    title_change_message(donor.nickname, transfer.donor.total_before, transfer.donor.total_after),
+                    title_change_message(
+                        recipient.nickname, transfer.recipient.total_before, transfer.recipient.total_after
+                    ),
+                ) if note
+            ]
             
-            # Lista de cards doados para mensagem de sucesso
-            donated_cards = []
-            
-            # Transferir todos os cards
-            for inv_item in donor.inventory:
-                if inv_item.quantity > 0:
-                    donated_cards.append((inv_item.card_id, inv_item.quantity))
-                    # Buscar ou criar entrada no inventário do destinatário
-                    rec_inv_result = await session.execute(
-                        select(Inventory).where(
-                            Inventory.user_id == recipient.id,
-                            Inventory.card_id == inv_item.card_id
-                        )
-                    )
-                    recipient_inv = rec_inv_result.scalar_one_or_none()
-                    if recipient_inv:
-                        recipient_inv.quantity += inv_item.quantity
-                    else:
-                        new_inv = Inventory(
-                            user_id=recipient.id,
-                            card_id=inv_item.card_id,
-                            quantity=inv_item.quantity
-                        )
-                        session.add(new_inv)
-                    inv_item.quantity = 0
-            
-            return {"success": True, "donated_cards": donated_cards}
+            return {"success": True, "donated_cards": donated_cards, "title_notes": title_notes}
             
         # Executar operação em transação segura
         success, result, error = await run_transaction(
@@ -233,12 +214,21 @@ async def doarcards_command(message: types.Message, state: FSMContext) -> None:
             
         # Gerar mensagem de sucesso
         donated_cards = result.get("donated_cards", [])
+        title_notes = "".join(f"\n\n{note}" for note in result.get("title_notes", []))
         if donated_cards:
-            cards_list = "\n".join([f"- Card ID `{card_id}`: `{quantity}` unidades" for card_id, quantity in donated_cards])
+            cards_list = "\n".join([
+                f"- Card ID `{card_id}`: `{quantity}` unidades"
+                for card_id, quantity in donated_cards[:DONATE_ALL_LIST_LIMIT]
+            ])
+            if len(donated_cards) > DONATE_ALL_LIST_LIMIT:
+                cards_list += f"\n- ... e mais {len(donated_cards) - DONATE_ALL_LIST_LIMIT} cards"
+            total_units = sum(quantity for _, quantity in donated_cards)
             await message.reply(
                 f"✅ **Doação realizada com sucesso!**\n\n"
+                f"**Total doado:** `{total_units}` unidades de `{len(donated_cards)}` cards diferentes\n\n"
                 f"**Cards doados:**\n{cards_list}\n\n"
-                f"**Destinatário:** `{nickname}`",
+                f"**Destinatário:** `{nickname}`"
+                f"{title_notes}",
                 parse_mode=ParseMode.MARKDOWN
             )
         else:
@@ -282,18 +272,13 @@ async def doarcards_command(message: types.Message, state: FSMContext) -> None:
                 return
 
         # Process the donation of specific cards
-        async def transfer_specific_cards(session):
-            # Load donor and recipient data with card details
-            donor_result = await session.execute(
-                select(User).where(User.id == donor_id)
-                .options(joinedload(User.inventory).joinedload(Inventory.card))
-            )
-            donor = donor_result.unique().scalar_one_or_none()
+        await catalog_cache.ensure_loaded()
 
-            recipient_result = await session.execute(
-                select(User).where(User.id == recipient_id)
-            )
-            recipient = recipient_result.scalar_one_or_none()
+        async def transfer_specific_cards(session):
+            # Lock donor and recipient (without loading their inventories)
+            users = await lock_users(session, [donor_id, recipient_id])
+            donor = users.get(donor_id)
+            recipient = users.get(recipient_id)
             
             if not donor or not recipient:
                 return {"success": False, "error": "Usuário não encontrado"}
@@ -301,24 +286,27 @@ async def doarcards_command(message: types.Message, state: FSMContext) -> None:
             if donor.id == recipient.id:
                 return {"success": False, "error": "Não é possível doar para si mesmo"}
             
-            # Consolidar possíveis duplicatas do doador e destinatário antes de processar
-            await consolidate_inventory_duplicates(session, donor.id)
-            await consolidate_inventory_duplicates(session, recipient.id)
+            transfer = {}
+            for card_id, quantity in donations:
+                transfer[card_id] = transfer.get(card_id, 0) + quantity
+            
+            # Lock only the donor's rows for the donated cards
+            owned = await lock_inventory_rows(session, [(donor.id, card_id) for card_id in transfer])
             
             # First, verify if the user has all the necessary cards
             invalid_donations = []
             cards_info = []
             total_cards = 0
             
-            for card_id, quantity in donations:
-                donor_inv = next((inv for inv in donor.inventory if inv.card_id == card_id), None)
-                if not donor_inv or donor_inv.quantity < quantity:
+            for card_id, quantity in transfer.items():
+                card = catalog_cache.get_card(card_id)
+                if not card or owned.get((donor.id, card_id), 0) < quantity:
                     invalid_donations.append((card_id, quantity))
                 else:
                     card_info = {
                         "id": card_id,
-                        "name": donor_inv.card.name,
-                        "rarity": donor_inv.card.rarity,
+                        "name": card.name,
+                        "rarity": card.rarity,
                         "quantity": quantity
                     }
                     cards_info.append(card_info)
@@ -332,32 +320,23 @@ async def doarcards_command(message: types.Message, state: FSMContext) -> None:
                     "error": f"Quantidade insuficiente dos seguintes cards: {invalid_list}"
                 }
             
-            # Transfer the specified cards
-            for card_id, quantity in donations:
-                donor_inv = next((inv for inv in donor.inventory if inv.card_id == card_id), None)
-                donor_inv.quantity -= quantity
-
-                rec_inv_result = await session.execute(
-                    select(Inventory).where(
-                        Inventory.user_id == recipient.id,
-                        Inventory.card_id == card_id
-                    )
-                )
-                recipient_inv = rec_inv_result.scalar_one_or_none()
-                if recipient_inv:
-                    recipient_inv.quantity += quantity
-                else:
-                    new_inv = Inventory(
-                        user_id=recipient.id,
-                        card_id=card_id,
-                        quantity=quantity
-                    )
-                    session.add(new_inv)
+            # Transfer the specified cards (inventories and counters of both users)
+            removed = await remove_cards(session, donor.id, transfer)
+            if len(removed.quantities) != len(transfer):
+                raise ValueError("O inventário mudou durante a doação. Tente novamente.")
+            added = await add_cards(session, recipient.id, transfer)
+            title_notes = [
+                note for note in (
+                    title_change_message(donor.nickname, removed.total_before, removed.total_after),
+                    title_change_message(recipient.nickname, added.total_before, added.total_after),
+                ) if note
+            ]
             
             return {
                 "success": True, 
                 "donated_cards": cards_info,
-                "total_cards": total_cards
+                "total_cards": total_cards,
+                "title_notes": title_notes
             }
         
         # Execute operation in a safe transaction
@@ -377,6 +356,7 @@ async def doarcards_command(message: types.Message, state: FSMContext) -> None:
         # Generate success message with detailed card information
         donated_cards = result.get("donated_cards", [])
         total_cards = result.get("total_cards", 0)
+        title_notes = "".join(f"\n\n{note}" for note in result.get("title_notes", []))
         
         if donated_cards:
             cards_list = "\n".join([
@@ -388,7 +368,8 @@ async def doarcards_command(message: types.Message, state: FSMContext) -> None:
                 f"✨ **Doação realizada com sucesso!** ✨\n\n"
                 f"📦 **Cards doados ({total_cards} no total):**\n{cards_list}\n\n"
                 f"🎁 **Destinatário:** `{nickname}`\n\n"
-                f"_Que sua generosidade traga muita alegria ao colecionador!_ 🌟",
+                f"_Que sua generosidade traga muita alegria ao colecionador!_ 🌟"
+                f"{title_notes}",
                 parse_mode=ParseMode.MARKDOWN
             )
 
@@ -405,40 +386,10 @@ async def find_user_by_reference(session, reference: str, message_user_id: int =
     Returns:
         User object or None if not found
     """
-    # Clean up reference (remove @ if present)
-    reference_clean = reference.lstrip("@").lower()
-    
-    # Try to find by username OR nickname case-insensitive
-    stmt = select(User).where(
-        (User.username.ilike(reference_clean)) | 
-        (User.nickname.ilike(f"%{reference_clean}%"))
-    )
-    
-    # Exclude self if message_user_id is provided
-    if message_user_id is not None:
-        stmt = stmt.where(User.id != message_user_id)
-        
-    result = await session.execute(stmt)
-    return result.scalar_one_or_none()
+    # Resolução indexada e com cache (exato, depois prefixo único)
+    user = await resolve_user(session, reference)
 
-
-async def update_username_if_changed(session, user_id: int, current_username: str) -> None:
-    """
-    Updates the user's username in the database if it has changed.
-    
-    Args:
-        session: Database session
-        user_id: Telegram user ID
-        current_username: Current Telegram username
-    """
-    if not current_username:
-        return  # Skip if no username provided
-        
-    stmt = select(User).where(User.id == user_id)
-    result = await session.execute(stmt)
-    user = result.scalar_one_or_none()
-    
-    if user and user.username != current_username:
-        logger.info(f"Updating username for user {user_id} from '{user.username}' to '{current_username}'")
-        user.username = current_username
-        await session.commit()
+    # Exclude self if message_user_id is provided
+    if user is not None and user.id == message_user_id:
+        return None
+    return user
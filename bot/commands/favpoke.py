@@ -84,10 +84,18 @@ async def favpoke_command(message: types.Message) -> None:
         )
 
         try:
-            await message.answer_photo(
-                photo=card.image_file_id,
-                caption=caption,
-                parse_mode=ParseMode.MARKDOWN
-            )
+            # Cards que continuam como documento são enviados como documento
+            if card.image_kind == "document":
+                await message.answer_document(
+                    document=card.image_file_id,
+                    caption=caption,
+                    parse_mode=ParseMode.MARKDOWN
+                )
+            else:
+                await message.answer_photo(
+                    photo=card.image_file_id,
+                    caption=caption,
+                    parse_mode=ParseMode.MARKDOWN
+                )
         except Exception:
             await message.reply(caption, parse_mode=ParseMode.MARKDOWN)
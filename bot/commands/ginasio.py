@@ -1,22 +1,23 @@
 from aiogram import Router, types
 from aiogram.filters import Command
 from aiogram.enums import ParseMode
-from sqlalchemy import select, desc
-from sqlalchemy.orm import joinedload
 
-from database.models import Card, Inventory, User
 from database.session import get_session
+from database.catalog_cache import catalog_cache
+from database.leaderboards import get_card_leaderboard, get_user_card_rank, UserRank
 
 router = Router()
 
 @router.message(Command("ginasio"))
 async def ginasio_command(message: types.Message) -> None:
     """
-    Handles the /ginasio <card_id> command.
-    Shows the Top 10 users who have the highest quantity of the specified card.
+    Handles the /ginasio <card_id ou nome> command.
+    Shows the Top 10 users who have the highest quantity of the specified card,
+    plus the caller's own rank and quantity.
     
     Example usage:
         /ginasio 20
+        /ginasio Pikachu
     """
     user_id = message.from_user.id
 
@@ -24,57 +25,66 @@ async def ginasio_command(message: types.Message) -> None:
     parts = message.text.split(maxsplit=1)
     argument = parts[1].strip() if len(parts) > 1 else None
 
-    # Check if card_id is provided and valid
-    if not argument or not argument.isdigit():
+    # Check if card_id is provided
+    if not argument:
         await message.reply(
-            "❗ **Erro:** Você deve fornecer o ID do card.\n"
-            "Exemplo: `/ginasio 20`",
+            "❗ **Erro:** Você deve fornecer o ID ou o nome do card.\n"
+            "Exemplo: `/ginasio 20` ou `/ginasio Pikachu`",
             parse_mode=ParseMode.MARKDOWN
         )
         return
 
-    card_id = int(argument)
-
-    async with get_session() as session:
-        # Fetch the card (with optional group info)
-        card_query = (
-            select(Card)
-            .options(joinedload(Card.group))  # only needed if you want group info
-            .where(Card.id == card_id)
-        )
-        card_result = await session.execute(card_query)
-        card = card_result.scalar_one_or_none()
-
-        if not card:
+    await catalog_cache.ensure_loaded()
+    if argument.isdigit():
+        card_id = int(argument)
+    else:
+        # Busca por nome no índice de trigramas do catálogo
+        matches = catalog_cache.search_cards(argument)
+        if not matches:
+            await message.reply(
+                f"❌ **Erro:** Nenhum card encontrado com o nome `{argument}`.",
+                parse_mode=ParseMode.MARKDOWN
+            )
+            return
+        if matches[0].score < 1.0 and len(matches) > 1:
+            suggestions = "\n".join(f"• `{m.id}` {m.name}" for m in matches)
             await message.reply(
-                f"❌ **Erro:** Nenhum card encontrado com o ID `{card_id}`.",
+                f"🔎 Encontrei mais de um card parecido com `{argument}`:\n\n"
+                f"{suggestions}\n\n"
+                "Use o ID para escolher. Exemplo: `/ginasio 20`",
                 parse_mode=ParseMode.MARKDOWN
             )
             return
+        card_id = matches[0].id
 
-        # Get top 10 users who hold the most copies of this card
-        inv_query = (
-            select(Inventory, User)
-            .join(User, Inventory.user_id == User.id)
-            .where(Inventory.card_id == card_id)
-            .order_by(desc(Inventory.quantity))
-            .limit(10)
+    card = catalog_cache.get_card(card_id)
+    if not card:
+        await message.reply(
+            f"❌ **Erro:** Nenhum card encontrado com o ID `{card_id}`.",
+            parse_mode=ParseMode.MARKDOWN
         )
-        inventory_result = await session.execute(inv_query)
-        top_users = inventory_result.all()  # List[(Inventory, User)]
+        return
+
+    async with get_session() as session:
+        # Top 10 (em cache por alguns segundos) e a posição de quem chamou
+        top_users = await get_card_leaderboard(session, card_id)
 
-    # Check if the current user is in top 10
-    user_in_top = any(u.id == user_id for _, u in top_users)
+        own_entry = next((e for e in top_users if e.user_id == user_id), None)
+        if own_entry is not None:
+            above = sum(1 for e in top_users if e.quantity > own_entry.quantity)
+            own_rank = UserRank(above + 1, own_entry.quantity, False)
+        else:
+            own_rank = await get_user_card_rank(session, card_id, user_id)
 
     # Prepare ranking lines (medals for top positions)
     medals = ["🥇", "🥈", "🥉"] + ["🏅"] * 7
     rank_lines = []
-    for idx, (inv_item, user_db) in enumerate(top_users):
+    for idx, entry in enumerate(top_users):
         medal = medals[idx] if idx < len(medals) else "🏅"
-        rank_lines.append(f"{medal} {user_db.nickname} - {inv_item.quantity}")
+        rank_lines.append(f"{medal} {entry.nickname} - {entry.quantity}")
 
     # Construct header message
-    if user_in_top:
+    if own_entry is not None:
         header = (
             f"🏆 Você está entre os Top 10 do ginásio de {card.id}. {card.name}:\n"
         )
@@ -83,17 +93,30 @@ async def ginasio_command(message: types.Message) -> None:
             f"👀 Vejo que você não está entre os Top 10 no ginásio de {card.id}. {card.name}:\n"
         )
 
+    if own_rank is None:
+        own_line = "Você ainda não possui este card."
+    else:
+        position = f"{own_rank.rank}+" if own_rank.capped else f"{own_rank.rank}"
+        own_line = f"📍 Sua posição: #{position} com {own_rank.quantity} cópias"
+
     # Combine header + ranking lines
-    caption = header + "\n" + "\n".join(rank_lines)
+    caption = header + "\n" + "\n".join(rank_lines) + "\n\n" + own_line
 
-    # If there's an image, send as a photo; else fallback to text
+    # If there's an image, send it as its normalized kind; else fallback to text
     if card.image_file_id:
         try:
-            await message.answer_photo(
-                photo=card.image_file_id,
-                caption=caption,
-                parse_mode=ParseMode.MARKDOWN
-            )
+            if card.image_kind == "document":
+                await message.answer_document(
+                    document=card.image_file_id,
+                    caption=caption,
+                    parse_mode=ParseMode.MARKDOWN
+                )
+            else:
+                await message.answer_photo(
+                    photo=card.image_file_id,
+                    caption=caption,
+                    parse_mode=ParseMode.MARKDOWN
+                )
         except Exception as e:
             # If something goes wrong sending as photo, fallback to text
             await message.reply(
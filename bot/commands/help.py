@@ -14,11 +14,13 @@ async def help_command(message: Message):
         "🔹 `/mochila` - Confira os itens que você carrega. 🎒\n"
         "🔹 `/pokebanco` - Veja suas riquezas no PokéBanco. 🏦\n"
         "🔹 `/pokefav` - Favorite um card e um emoji! 💌"
-        "🔹 `/ginasio` cardid - Veja o ranking do ginásio para um card específico. 🏆\n"
+        "🔹 `/ginasio` cardid ou cardname - Veja o ranking do ginásio para um card específico. 🏆\n"
+        "🔹 `/ranking` [total|completo] [categoria] - Veja o ranking de colecionadores. 🏆\n"
         "🔹 `/pokedex` ou `/pd`- Veja todas as coleções. 🗂\n"
         "🔹 `/pokebola` ou `/pb` cardid ou cardname - Visualize informações sobre um card. 🃏\n\n"
         "⚔️ **Comandos de Captura:**\n"
         "🔹 `/capturar` ou `/cap` - Tente capturar um card raro! 🎯\n"
+        "🔹 `/cap quantidade` - Capture vários cards de uma vez (até 50). 🎯\n"
         "🔹 `/roubar` - Troque cartas com outro treinador. Use o formato:\n"
         "   `/roubar id1 xqty1, id2 xqty2 X id3 xqty3, id4 xqty4` (responda à mensagem do outro treinador). 🔄\n\n"
         "🛒 **Comandos de Loja:**\n"
@@ -27,7 +29,9 @@ async def help_command(message: Message):
         "🔹 `/doarcards` - Doe cards para outros treinadores. 🎁\n"
         "🔹 `/doarbolas` - Doe Pokebolas para outros treinadores. 🎁\n"
         "🔹 `/doarcoins` - Doe Pokecoins para outros treinadores. 🎁\n"
-        "🔹 `/venderc` - Venda seus cards para o Pokemart. 💰\n\n"
+        "🔹 `/venderc` - Venda seus cards para o Pokemart (ex.: `/venderc duplicadas`, `/venderc 🥉 manter 1`). 💰\n"
+        "🔹 `/mercado` - Compre e venda cards com outros treinadores pelo seu preço. 📈\n"
+        "🔹 `/leilao` card_id preço duração - Leiloe um card 🥇 ou 💎; dê lances com `/lance`. 🔨\n\n"
         "Divirta-se e boa sorte na sua aventura! ⚡"
     )
     await message.answer(help_text, parse_mode=ParseMode.MARKDOWN)
\ No newline at end of file
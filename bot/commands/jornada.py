@@ -12,6 +12,7 @@ from sqlalchemy.exc import IntegrityError
 from database.session import get_session
 from database.models import User
 from database.crud_user import get_user_by_id, get_user_by_nickname
+from database.user_lookup import invalidate_user_names
 
 router = Router()
 
@@ -147,6 +148,7 @@ async def handle_confirmation(callback: CallbackQuery, state: FSMContext):
                 )
                 session.add(new_user)
                 await session.commit()
+                invalidate_user_names(user_id, nickname, username)
 
                 # Clear the FSM state
                 await state.clear()
@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import re
+from datetime import datetime, timedelta
+from typing import Optional
+
+from aiogram import Bot, Router, types
+from aiogram.enums import ParseMode
+from aiogram.filters import Command
+from sqlalchemy import select
+
+from database.session import get_session
+from database.catalog_cache import catalog_cache
+from database.models import User
+from database.auctions import (
+    AUCTION_CLOSE_BATCH_SIZE,
+    AUCTION_RARITIES,
+    AUCTION_SWEEP_INTERVAL,
+    MAX_AUCTION_DURATION,
+    MIN_AUCTION_DURATION,
+    close_due_auctions,
+    create_auction,
+    get_open_auctions,
+    min_next_bid,
+    place_bid,
+)
+
+logger = logging.getLogger(__name__)
+
+router = Router()
+
+MAX_START_PRICE = 1_000_000
+
+USAGE = (
+    "❗ Uso: `/leilao <card_id> <preço_inicial> <duração>`\n\n"
+    "A duração pode ser em minutos (`30m`), horas (`2h`) ou dias (`1d`), "
+    "de 5 minutos a 48 horas. Só cards 🥇 e 💎 podem ser leiloados.\n\n"
+    "• `/leilao` - ver os leilões abertos\n"
+    "• `/lance <leilão> <valor>` - dar um lance"
+)
+
+DURATION_UNITS = {"m": "minutes", "h": "hours", "d": "days"}
+
+
+def parse_duration(value: str) -> Optional[timedelta]:
+    """'30m', '2h', '1d' ou só minutos -> timedelta (None se inválido ou fora dos limites)"""
+    match = re.fullmatch(r"(\d+)([mhd]?)", value.strip().lower())
+    if not match:
+        return None
+    duration = timedelta(**{DURATION_UNITS[match.group(2) or "m"]: int(match.group(1))})
+    if not MIN_AUCTION_DURATION <= duration <= MAX_AUCTION_DURATION:
+        return None
+    return duration
+
+
+def format_remaining(ends_at: datetime) -> str:
+    minutes = max(0, int((ends_at - datetime.utcnow()).total_seconds() // 60))
+    if minutes >= 60:
+        return f"{minutes // 60}h{minutes % 60:02d}"
+    return f"{minutes} min"
+
+
+def card_label(card_id: int) -> str:
+    card = catalog_cache.get_card(card_id)
+    return f"{card.rarity} {card.id}. {card.name}" if card else f"Card {card_id}"
+
+
+@router.message(Command("leilao"))
+async def leilao_command(message: types.Message) -> None:
+    """
+    Abre um leilão de um card raro ou lista os leilões abertos.
+    Uso: /leilao <card_id> <preço_inicial> <duração>
+    """
+    args = message.text.split()[1:]
+    await catalog_cache.ensure_loaded()
+
+    if not args:
+        async with get_session() as session:
+            auctions = await get_open_auctions(session)
+        if not auctions:
+            await message.reply(f"🔨 Nenhum leilão aberto no momento.\n\n{USAGE}", parse_mode=ParseMode.MARKDOWN)
+            return
+        lines = []
+        for a in auctions:
+            price = f"lance atual `{a.current_bid}`" if a.current_bid is not None else f"inicial `{a.start_price}`"
+            lines.append(
+                f"`#{a.id}` {card_label(a.card_id)} - {price} pokecoins - "
+                f"termina em {format_remaining(a.ends_at)}"
+            )
+        await message.reply(
+            "🔨 **Leilões abertos:**\n\n" + "\n".join(lines) + "\n\nPara dar um lance: `/lance <leilão> <valor>`",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return
+
+    if len(args) != 3 or not args[0].isdigit() or not args[1].isdigit():
+        await message.reply(USAGE, parse_mode=ParseMode.MARKDOWN)
+        return
+    card_id, start_price = int(args[0]), int(args[1])
+    duration = parse_duration(args[2])
+    if duration is None or not 0 < start_price <= MAX_START_PRICE:
+        await message.reply(f"❌ **Erro:** Preço ou duração inválidos.\n\n{USAGE}", parse_mode=ParseMode.MARKDOWN)
+        return
+
+    card = catalog_cache.get_card(card_id)
+    if not card or card.rarity not in AUCTION_RARITIES:
+        await message.reply(
+            f"❌ **Erro:** Só cards {' e '.join(AUCTION_RARITIES)} podem ser leiloados.",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return
+
+    async with get_session() as session:
+        auction = await create_auction(
+            session, message.from_user.id, card_id, start_price, duration, message.chat.id
+        )
+        if auction is None:
+            await session.rollback()
+            await message.reply(
+                f"❌ **Erro:** Você não possui o card `{card_id}`.",
+                parse_mode=ParseMode.MARKDOWN
+            )
+            return
+        await session.commit()
+
+    await message.reply(
+        f"🔨 **Leilão `#{auction.id}` aberto!**\n\n"
+        f"{card_label(card_id)}\n"
+        f"💰 Lance inicial: `{start_price}` pokecoins\n"
+        f"⏳ Termina em {format_remaining(auction.ends_at)}\n\n"
+        f"Dê seu lance com `/lance {auction.id} <valor>`",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+
+@router.message(Command("lance"))
+async def lance_command(message: types.Message) -> None:
+    """
+    Dá um lance em um leilão; as pokecoins ficam reservadas até ele ser superado.
+    Uso: /lance <leilão> <valor>
+    """
+    args = message.text.split()[1:]
+    if len(args) != 2 or not args[0].lstrip("#").isdigit() or not args[1].isdigit():
+        await message.reply("❗ Uso: `/lance <leilão> <valor>`", parse_mode=ParseMode.MARKDOWN)
+        return
+    auction_id, amount = int(args[0].lstrip("#")), int(args[1])
+
+    try:
+        async with get_session() as session:
+            try:
+                bid = await place_bid(session, auction_id, message.from_user.id, amount)
+            except ValueError as e:
+                await session.rollback()
+                await message.reply(f"❌ **Erro:** {e}", parse_mode=ParseMode.MARKDOWN)
+                return
+            await session.commit()
+    except Exception as e:
+        logger.error(f"Erro ao registrar lance no leilão {auction_id}: {str(e)}", exc_info=True)
+        await message.reply("❌ Não foi possível registrar o lance agora. Tente novamente mais tarde.")
+        return
+
+    await message.reply(
+        f"✅ Lance de `{bid.amount}` pokecoins registrado no leilão `#{auction_id}`!\n"
+        f"⏳ Termina em {format_remaining(bid.ends_at)}",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+    if bid.previous_bidder_id is not None and bid.previous_bidder_id != message.from_user.id:
+        try:
+            await message.bot.send_message(
+                bid.previous_bidder_id,
+                f"⚠️ Seu lance de `{bid.previous_bid}` pokecoins no leilão `#{auction_id}` foi superado "
+                f"e as pokecoins foram devolvidas. Lance mínimo agora: "
+                f"`{min_next_bid(bid.amount, bid.amount)}`.",
+                parse_mode=ParseMode.MARKDOWN
+            )
+        except Exception as e:
+            logger.info(f"Não foi possível avisar o licitante {bid.previous_bidder_id}: {e}")
+
+
+async def close_auctions(bot: Bot) -> int:
+    """
+    Encerra todos os leilões vencidos, em lotes (uma transação por lote), e
+    anuncia os resultados nos chats onde foram abertos.
+
+    Returns:
+        int: Quantidade de leilões encerrados
+    """
+    total = 0
+    while True:
+        async with get_session() as session:
+            closed = await close_due_auctions(session)
+            winner_ids = {a.winner_id for a in closed if a.winner_id is not None}
+            nicknames = {}
+            if winner_ids:
+                rows = await session.execute(select(User.id, User.nickname).where(User.id.in_(winner_ids)))
+                nicknames = dict(rows.all())
+            await session.commit()
+
+        async def announce(auction) -> None:
+            if auction.winner_id is not None:
+                text = (
+                    f"🔨 **Leilão `#{auction.id}` encerrado!**\n\n{card_label(auction.card_id)} "
+                    f"foi arrematado por `{nicknames.get(auction.winner_id, auction.winner_id)}` "
+                    f"por `{auction.winning_bid}` pokecoins."
+                )
+            else:
+                text = (
+                    f"🔨 **Leilão `#{auction.id}` encerrado** sem lances; "
+                    f"{card_label(auction.card_id)} voltou para o vendedor."
+                )
+            try:
+                await bot.send_message(auction.chat_id, text, parse_mode=ParseMode.MARKDOWN)
+            except Exception as e:
+                logger.error("Erro ao anunciar o leilão %s (chat=%s): %s", auction.id, auction.chat_id, e)
+
+        if closed:
+            await catalog_cache.ensure_loaded()
+            await asyncio.gather(*(announce(auction) for auction in closed))
+        total += len(closed)
+        if len(closed) < AUCTION_CLOSE_BATCH_SIZE:
+            break
+
+    if total:
+        logger.info("%s leilões encerrados", total)
+    return total
+
+
+async def scheduled_auction_closing(bot: Bot):
+    """Varredura única e periódica que encerra os leilões vencidos"""
+    while True:
+        await asyncio.sleep(AUCTION_SWEEP_INTERVAL)
+        try:
+            await close_auctions(bot)
+        except Exception as e:
+            logger.error(f"Erro ao encerrar leilões: {str(e)}")
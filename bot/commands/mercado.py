@@ -0,0 +1,236 @@
+import logging
+
+from aiogram import Router, types
+from aiogram.enums import ParseMode
+from aiogram.filters import Command
+
+from database.session import get_session
+from database.catalog_cache import catalog_cache
+from database.order_book import (
+    SIDE_SELL,
+    cancel_order,
+    get_order_book,
+    get_user_orders,
+    place_buy_order,
+    place_sell_order,
+)
+
+logger = logging.getLogger(__name__)
+
+router = Router()
+
+# Limites de uma ordem
+MAX_ORDER_PRICE = 1_000_000
+MAX_ORDER_QUANTITY = 10_000
+# Valor total (preço x quantidade) cabe em users.coins (INTEGER)
+MAX_ORDER_VALUE = 2**31 - 1
+
+USAGE = (
+    "❗ Uso do mercado entre treinadores:\n\n"
+    "• `/mercado <card>` - ver as ofertas de um card\n"
+    "• `/mercado vender <card_id> <preço> [quantidade]` - anunciar cards\n"
+    "• `/mercado comprar <card_id> <preço> [quantidade]` - fazer uma oferta de compra\n"
+    "• `/mercado ordens` - ver suas ordens abertas\n"
+    "• `/mercado cancelar <ordem>` - cancelar uma ordem\n\n"
+    "_Cards anunciados e pokecoins de ofertas de compra ficam reservados até a ordem "
+    "ser executada ou cancelada._"
+)
+
+
+def format_levels(levels, empty: str) -> str:
+    if not levels:
+        return empty
+    return "\n".join(
+        f"• `{level.price}` pokecoins - {level.quantity} unidade(s) ({level.orders} ordem(ns))"
+        for level in levels
+    )
+
+
+def parse_order_args(args: list[str]):
+    """[card_id, preço, quantidade?] -> (card_id, preço, quantidade) ou None"""
+    if len(args) not in (2, 3) or not all(arg.isdigit() for arg in args):
+        return None
+    card_id, price = int(args[0]), int(args[1])
+    quantity = int(args[2]) if len(args) == 3 else 1
+    if not (0 < price <= MAX_ORDER_PRICE and 0 < quantity <= MAX_ORDER_QUANTITY):
+        return None
+    if price * quantity > MAX_ORDER_VALUE:
+        return None
+    return card_id, price, quantity
+
+
+@router.message(Command("mercado"))
+async def mercado_command(message: types.Message) -> None:
+    """
+    Mercado entre treinadores: livro de ofertas de compra e venda por card.
+    Uso: /mercado <card> | vender | comprar | ordens | cancelar
+    """
+    parts = message.text.split()
+    if len(parts) < 2:
+        await message.reply(USAGE, parse_mode=ParseMode.MARKDOWN)
+        return
+
+    action = parts[1].lower()
+    if action in ("vender", "comprar"):
+        await place_order(message, action, parts[2:])
+    elif action == "ordens":
+        await show_user_orders(message)
+    elif action == "cancelar":
+        await cancel_user_order(message, parts[2:])
+    else:
+        await show_order_book(message, " ".join(parts[1:]))
+
+
+async def show_order_book(message: types.Message, argument: str) -> None:
+    await catalog_cache.ensure_loaded()
+    if argument.isdigit():
+        card = catalog_cache.get_card(int(argument))
+    else:
+        matches = catalog_cache.search_cards(argument)
+        if matches and (matches[0].score >= 1.0 or len(matches) == 1):
+            card = catalog_cache.get_card(matches[0].id)
+        elif matches:
+            suggestions = "\n".join(f"• `{m.id}` {m.name}" for m in matches)
+            await message.reply(
+                f"🔎 Encontrei mais de um card parecido com `{argument}`:\n\n"
+                f"{suggestions}\n\n"
+                "Use o ID para escolher. Exemplo: `/mercado 20`",
+                parse_mode=ParseMode.MARKDOWN
+            )
+            return
+        else:
+            card = None
+    if not card:
+        await message.reply(
+            f"❌ **Erro:** Nenhum card encontrado para `{argument}`.\n\n{USAGE}",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return
+
+    async with get_session() as session:
+        asks, bids = await get_order_book(session, card.id)
+
+    await message.reply(
+        f"📈 **Mercado - {card.rarity} {card.id}. {card.name}**\n\n"
+        f"🏷️ **À venda:**\n{format_levels(asks, 'Ninguém está vendendo este card.')}\n\n"
+        f"🛒 **Ofertas de compra:**\n{format_levels(bids, 'Ninguém está comprando este card.')}",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+
+async def place_order(message: types.Message, action: str, args: list[str]) -> None:
+    parsed = parse_order_args(args)
+    if parsed is None:
+        await message.reply(
+            f"❌ **Erro:** Ordem inválida. Preço entre 1 e {MAX_ORDER_PRICE}, "
+            f"quantidade entre 1 e {MAX_ORDER_QUANTITY} e valor total até {MAX_ORDER_VALUE}.\n\n{USAGE}",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return
+    card_id, price, quantity = parsed
+
+    await catalog_cache.ensure_loaded()
+    card = catalog_cache.get_card(card_id)
+    if not card:
+        await message.reply(
+            f"❌ **Erro:** Nenhum card encontrado com o ID `{card_id}`.",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return
+
+    user_id = message.from_user.id
+    try:
+        async with get_session() as session:
+            # Casamento, entregas, pagamentos e garantia numa única transação
+            if action == "vender":
+                placement = await place_sell_order(session, user_id, card_id, price, quantity)
+                error = f"Você não possui `{quantity}` unidade(s) do card `{card_id}`."
+            else:
+                placement = await place_buy_order(session, user_id, card_id, price, quantity)
+                error = "Você não tem pokecoins suficientes para esta ordem."
+            if placement is None:
+                await session.rollback()
+                await message.reply(f"❌ **Erro:** {error}", parse_mode=ParseMode.MARKDOWN)
+                return
+            await session.commit()
+    except Exception as e:
+        logger.error(f"Erro ao registrar ordem no mercado: {str(e)}", exc_info=True)
+        await message.reply("❌ Não foi possível registrar a ordem agora. Tente novamente mais tarde.")
+        return
+
+    card_label = f"{card.rarity} **{card.id}. {card.name}**"
+    if action == "vender":
+        text = f"🏷️ **Ordem de venda:** {card_label} - `{quantity}`x a `{price}` pokecoins\n\n"
+        if placement.filled:
+            text += (
+                f"✅ Vendido na hora: `{placement.filled}` unidade(s) por "
+                f"`{placement.filled_value}` pokecoins.\n"
+            )
+        if placement.resting:
+            text += (
+                f"📋 `{placement.resting}` unidade(s) anunciada(s) no mercado "
+                f"(ordem `#{placement.order_id}`)."
+            )
+    else:
+        text = f"🛒 **Ordem de compra:** {card_label} - `{quantity}`x a até `{price}` pokecoins\n\n"
+        if placement.filled:
+            text += (
+                f"✅ Comprado na hora: `{placement.filled}` unidade(s) por "
+                f"`{placement.filled_value}` pokecoins.\n"
+            )
+        if placement.resting:
+            text += (
+                f"📋 Oferta de `{placement.resting}` unidade(s) registrada "
+                f"(ordem `#{placement.order_id}`, `{placement.resting * price}` pokecoins reservadas)."
+            )
+    await message.reply(text, parse_mode=ParseMode.MARKDOWN)
+
+
+async def show_user_orders(message: types.Message) -> None:
+    async with get_session() as session:
+        orders = await get_user_orders(session, message.from_user.id)
+
+    if not orders:
+        await message.reply("📋 Você não tem ordens abertas no mercado.")
+        return
+
+    await catalog_cache.ensure_loaded()
+    lines = []
+    for order in orders:
+        card = catalog_cache.get_card(order.card_id)
+        name = f"{card.rarity} {card.id}. {card.name}" if card else f"Card {order.card_id}"
+        side = "Venda" if order.side == SIDE_SELL else "Compra"
+        lines.append(f"`#{order.id}` {side} - {name} - `{order.quantity}`x a `{order.price}` pokecoins")
+
+    await message.reply(
+        "📋 **Suas ordens abertas:**\n\n" + "\n".join(lines) +
+        "\n\nPara cancelar: `/mercado cancelar <ordem>`",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+
+async def cancel_user_order(message: types.Message, args: list[str]) -> None:
+    if len(args) != 1 or not args[0].lstrip("#").isdigit():
+        await message.reply(USAGE, parse_mode=ParseMode.MARKDOWN)
+        return
+    order_id = int(args[0].lstrip("#"))
+
+    async with get_session() as session:
+        order = await cancel_order(session, message.from_user.id, order_id)
+        await session.commit()
+
+    if order is None:
+        await message.reply(
+            f"❌ **Erro:** Ordem `#{order_id}` não encontrada entre as suas ordens abertas.",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return
+
+    if order.side == SIDE_SELL:
+        refund = f"`{order.quantity}` card(s) devolvido(s) à sua mochila"
+    else:
+        refund = f"`{order.price * order.quantity}` pokecoins devolvidas"
+    await message.reply(
+        f"✅ Ordem `#{order.id}` cancelada: {refund}.",
+        parse_mode=ParseMode.MARKDOWN
+    )
@@ -3,28 +3,34 @@ from aiogram.filters import Command, CommandObject
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, Message, InputMediaPhoto
 from aiogram.enums import ParseMode
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from sqlalchemy import select
+from typing import NamedTuple
+
+from sqlalchemy import select, tuple_
 from database.session import get_session
-from database.models import Inventory, Card, Group, Category, User
+from database.catalog_cache import catalog_cache
+from database.user_lookup import resolve_user
+from database.models import Inventory, Card, User
+from utils.titles import get_title
 
 router = Router()
 
-# Novo padrão para callback: mochila_page_{page}_user_{user_id}.
+# Novo padrão para callback: mochila_page_{page}_user_{user_id}_{n|p}_{peso}_{card_id}.
+# n/p = página seguinte/anterior ao card (peso, card_id) da página atual (keyset).
+# O formato antigo, sem o cursor, continua aceito (usa OFFSET).
 MOCHILA_CALLBACK_PREFIX = "mochila_page"
 
+MOCHILA_PAGE_SIZE = 10
+
+# Ordem da mochila: 🥇, 🥈, 🥉 e depois o resto, por ID do card
+# (inventory.rarity_weight, ver database/inventory.py)
+
 @router.message(Command(commands=["mochila"], ignore_case=True, ignore_mention=True))
 async def mochila_command(message: Message, command: CommandObject):
     args = (command.args or "").strip()
 
     async with get_session() as session:
         if args:
-            username_lookup = args.lstrip("@").lower()
-            stmt = select(User).where(
-                (User.username.ilike(username_lookup)) |
-                (User.nickname.ilike(f"%{username_lookup}%"))
-            )
-            result = await session.execute(stmt)
-            target_user = result.scalar_one_or_none()
+            target_user = await resolve_user(session, args)
 
             if not target_user:
                 await message.answer(
@@ -41,15 +47,7 @@ async def mochila_command(message: Message, command: CommandObject):
                 )
                 return
 
-        result = await session.execute(
-            select(Inventory, Card, Group, Category)
-            .join(Card, Inventory.card_id == Card.id)
-            .join(Group, Card.group_id == Group.id)
-            .join(Category, Group.category_id == Category.id)
-            .where(Inventory.user_id == target_user.id, Inventory.quantity >= 1)
-            .order_by(Card.id.asc())
-        )
-        inventory = result.all()
+        page_items, total_items = await fetch_mochila_page(session, target_user, page=1)
 
         # Separar a carta favorita
         fav_card = None
@@ -73,7 +71,7 @@ async def mochila_command(message: Message, command: CommandObject):
         )
 
     # Exibir inventário paginado
-    if not inventory:
+    if not total_items:
         await message.answer(
             f"🎒 **A mochila de @{target_user.username or target_user.nickname} está vazia!**\n"
             "Ainda não há cards registrados...\n\n"
@@ -84,55 +82,114 @@ async def mochila_command(message: Message, command: CommandObject):
 
     await send_mochila_page(
         message,
-        inventory,
+        page_items,
+        total_items,
         page=1,
         user_id=target_user.id,
-        nickname=target_user.nickname or target_user.username or "Usuário"
+        nickname=target_user.nickname or target_user.username or "Usuário",
+        cards_total=target_user.cards_total
+    )
+
+
+class MochilaItem(NamedTuple):
+    id: int
+    name: str
+    rarity: str
+    quantity: int
+    weight: int
+
+
+async def fetch_mochila_page(
+    session,
+    user: User,
+    page: int,
+    direction: str | None = None,
+    cursor: tuple[int, int] | None = None
+):
+    """
+    Busca apenas os cards de uma página da mochila, ordenados por raridade e ID.
+
+    A página é lida do índice ix_inventory_user_rarity_card (user_id,
+    rarity_weight, card_id), sem juntar com cards: nome e raridade vêm do
+    catalog_cache e o total de cards distintos de users.cards_distinct.
+
+    Com `direction`/`cursor` a página é buscada por keyset: os 10 cards logo
+    depois ("n") ou logo antes ("p") do par (peso da raridade, card_id).
+    Sem cursor, usa OFFSET a partir do número da página.
+
+    Returns:
+        tuple: (itens da página, total de cards distintos na mochila)
+    """
+    key = tuple_(Inventory.rarity_weight, Inventory.card_id)
+    stmt = (
+        select(Inventory.card_id, Inventory.quantity, Inventory.rarity_weight)
+        .where(Inventory.user_id == user.id, Inventory.quantity >= 1)
     )
 
+    if direction == "n" and cursor:
+        stmt = stmt.where(key > tuple_(*cursor)).order_by(Inventory.rarity_weight, Inventory.card_id)
+    elif direction == "p" and cursor:
+        stmt = stmt.where(key < tuple_(*cursor)).order_by(
+            Inventory.rarity_weight.desc(), Inventory.card_id.desc()
+        )
+    else:
+        stmt = stmt.order_by(Inventory.rarity_weight, Inventory.card_id).offset(
+            (page - 1) * MOCHILA_PAGE_SIZE
+        )
 
-def get_rarity_weight(rarity: str) -> int:
-    weights = {"🥇": 1, "🥈": 2, "🥉": 3}
-    return weights.get(rarity, 4)
+    result = await session.execute(stmt.limit(MOCHILA_PAGE_SIZE))
+    rows = result.all()
+    if direction == "p" and cursor:
+        rows.reverse()
+
+    await catalog_cache.ensure_loaded()
+    items = []
+    for row in rows:
+        card = catalog_cache.get_card(row.card_id)
+        items.append(MochilaItem(
+            row.card_id,
+            card.name if card else f"Card {row.card_id}",
+            card.rarity if card else "",
+            row.quantity,
+            row.rarity_weight,
+        ))
+    return items, user.cards_distinct or 0
 
 async def send_mochila_page(
     message_or_callback: Message | CallbackQuery,
-    inventory: list,
+    page_items: list,
+    total_items: int,
     page: int,
     user_id: int,
-    nickname: str
+    nickname: str,
+    cards_total: int = 0
 ):
-    items_per_page = 10
-    start_index = (page - 1) * items_per_page
-    end_index = start_index + items_per_page
-    total_pages = (len(inventory) + items_per_page - 1) // items_per_page
-    
-    # Ordenar o inventário por raridade e ID
-    sorted_inventory = sorted(
-        inventory,
-        key=lambda x: (get_rarity_weight(x[1].rarity), x[1].id)
-    )
-    page_items = sorted_inventory[start_index:end_index]
+    total_pages = max(1, (total_items + MOCHILA_PAGE_SIZE - 1) // MOCHILA_PAGE_SIZE)
 
     lines = []
-    for i, (inv, card, group, category) in enumerate(page_items, start=start_index + 1):
-        line = f"{card.rarity}`{card.id}`. {card.name} ({inv.quantity}x)"
+    for item in page_items:
+        line = f"{item.rarity}`{item.id}`. {item.name} ({item.quantity}x)"
         lines.append(line)
 
     inventory_text = "\n".join(lines)
-    header = f"🎒 Uau, @{nickname}! Aqui está sua mochila:\n\n"
+    header = (
+        f"🎒 Uau, @{nickname}! Aqui está sua mochila:\n"
+        f"🏅 Título: {get_title(cards_total)}\n\n"
+    )
     text = f"{header}{inventory_text}\n\nPágina {page}/{total_pages}"
 
     keyboard = InlineKeyboardBuilder()
-    if page > 1:
+    if page > 1 and page_items:
+        first = page_items[0]
         keyboard.button(
             text="⬅️ Anterior",
-            callback_data=f"{MOCHILA_CALLBACK_PREFIX}_{page - 1}_user_{user_id}"
+            callback_data=f"{MOCHILA_CALLBACK_PREFIX}_{page - 1}_user_{user_id}_p_{first.weight}_{first.id}"
         )
-    if page < total_pages:
+    if page < total_pages and page_items:
+        last = page_items[-1]
         keyboard.button(
             text="Próximo ➡️",
-            callback_data=f"{MOCHILA_CALLBACK_PREFIX}_{page + 1}_user_{user_id}"
+            callback_data=f"{MOCHILA_CALLBACK_PREFIX}_{page + 1}_user_{user_id}_n_{last.weight}_{last.id}"
         )
     keyboard.adjust(2)
 
@@ -160,6 +217,11 @@ async def mochila_pagination_callback(callback: CallbackQuery):
         parts = callback.data.split("_")
         page = int(parts[2])
         user_id = int(parts[4])
+        direction = None
+        cursor = None
+        if len(parts) >= 8:
+            direction = parts[5]
+            cursor = (int(parts[6]), int(parts[7]))
     except Exception:
         await callback.answer("❌ Erro ao processar a navegação da mochila.", show_alert=True)
         return
@@ -170,20 +232,19 @@ async def mochila_pagination_callback(callback: CallbackQuery):
             await callback.answer("❌ Usuário original não encontrado.", show_alert=True)
             return
 
-        result = await session.execute(
-            select(Inventory, Card, Group, Category)
-            .join(Card, Inventory.card_id == Card.id)
-            .join(Group, Card.group_id == Group.id)
-            .join(Category, Group.category_id == Category.id)
-            .where(Inventory.user_id == user_id, Inventory.quantity >= 1)
-            .order_by(Card.id.asc())
-        )
-        inventory = result.all()
+        page_items, total_items = await fetch_mochila_page(session, user, page, direction, cursor)
+
+        # A mochila mudou desde a última página (cards doados/vendidos): volta ao início
+        if not page_items and page > 1:
+            page = 1
+            page_items, total_items = await fetch_mochila_page(session, user, page)
 
     await send_mochila_page(
         callback,
-        inventory,
+        page_items,
+        total_items,
         page,
         user_id=user.id,
-        nickname=user.nickname or user.username or "Usuário"
+        nickname=user.nickname or user.username or "Usuário",
+        cards_total=user.cards_total
     )
@@ -2,12 +2,12 @@ from aiogram import Router
 from aiogram.types import Message
 from aiogram.filters import Command
 from aiogram.enums import ParseMode
-from sqlalchemy.orm import joinedload
 from sqlalchemy import select
 
 # Database imports
 from database.session import get_session
 from database.models import User
+from utils.titles import get_title
 
 router = Router()
 
@@ -19,14 +19,9 @@ async def pokebanco_command(message: Message):
     user_id = message.from_user.id
 
     async with get_session() as session:
-        # Query the user with eager loading of the inventory relationship
-        result = await session.execute(
-            select(User)
-            .options(joinedload(User.inventory))  # Eagerly load the inventory relationship
-            .where(User.id == user_id)
-        )
-        # Use .unique() to remove duplicates caused by joined eager loads
-        user = result.unique().scalar_one_or_none()
+        # The collection counters live on the user row; no inventory load needed
+        result = await session.execute(select(User).where(User.id == user_id))
+        user = result.scalar_one_or_none()
 
         if not user:
             await message.answer(
@@ -39,14 +34,15 @@ async def pokebanco_command(message: Message):
         # Retrieve user data
         coins = user.coins
         pokeballs = user.pokeballs
-        captures = user.captures  # Dynamically calculated from the inventory
+        captures = user.captures  # Maintained counter (users.cards_total)
 
         # Send the response to the user
         await message.answer(
             f"🏦 **Bem-vindo ao PokéBanco!** 🏦\n\n"
             f"💰 **Pokecoins:** `{coins}`\n"
             f"🎯 **Pokébolas:** `{pokeballs}`\n"
-            f"📸 **Capturas:** `{captures}`\n\n"
+            f"📸 **Capturas:** `{captures}`\n"
+            f"🏅 **Título:** {get_title(captures)}\n\n"
             f"Continue sua jornada e acumule mais riquezas e conquistas! 🌟",
             parse_mode=ParseMode.MARKDOWN
         )
@@ -6,7 +6,8 @@ from sqlalchemy import select, update
 from sqlalchemy.orm import selectinload
 
 from database.session import get_session
-from database.models import User, Group, Category, Inventory, Card
+from database.catalog_cache import catalog_cache
+from database.models import User, Group, Category, Inventory, Card, UserGroupProgress
 
 router = Router()
 
@@ -27,33 +28,60 @@ def build_categories_keyboard(categories: list[Category]) -> InlineKeyboardMarku
         buttons.append([InlineKeyboardButton(text=btn_text, callback_data=btn_data)])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
-def build_groups_keyboard(groups: list[Group]) -> InlineKeyboardMarkup:
+def completion_percent(owned_distinct: int, group_size: int) -> int:
+    if group_size <= 0:
+        return 0
+    return min(100, owned_distinct * 100 // group_size)
+
+def build_groups_keyboard(groups: list[tuple[Group, UserGroupProgress]]) -> InlineKeyboardMarkup:
     buttons = []
-    for g in groups[:5]:  # limita a 5 grupos
-        btn_text = f"{g.id}. {g.name}"
+    for g, progress in groups[:5]:  # limita a 5 grupos
+        group_size = len(catalog_cache.get_group_cards(g.id))
+        btn_text = f"{g.id}. {g.name} ({completion_percent(progress.owned_distinct, group_size)}%)"
         btn_data = f"pokedex_group:{g.id}"
         buttons.append([InlineKeyboardButton(text=btn_text, callback_data=btn_data)])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
-def format_group_cards(
-    cards: list[Card], 
-    user_inventory: dict[int, int], 
-    group_id: int, 
-    group_name: str, 
-    user_id: int,
-    page: int = 1
-) -> tuple[str, int]:
-    """Returns (formatted_text, total_pages)"""
+async def fetch_owned_groups(session, user_id: int, category_id: int) -> list[tuple[Group, UserGroupProgress]]:
+    """
+    Grupos da categoria em que o usuário tem cards, com o progresso de cada um.
+    Lê apenas user_group_progress (chave primária user_id, group_id) em vez de
+    varrer o inventário.
+    """
+    result = await session.execute(
+        select(Group, UserGroupProgress)
+        .join(UserGroupProgress, UserGroupProgress.group_id == Group.id)
+        .where(
+            UserGroupProgress.user_id == user_id,
+            UserGroupProgress.owned_distinct > 0,
+            Group.category_id == category_id
+        )
+        .order_by(Group.id)
+    )
+    return [tuple(row) for row in result.all()]
+
+def paginate_group_cards(cards: list[Card], page: int = 1) -> tuple[list[Card], int]:
+    """Returns (page_cards, total_pages)"""
     sorted_cards = sorted(cards, key=lambda c: (c.rarity, c.id))
     total_pages = (len(sorted_cards) + CARDS_PER_PAGE - 1) // CARDS_PER_PAGE
-    
+
     start_idx = (page - 1) * CARDS_PER_PAGE
     end_idx = start_idx + CARDS_PER_PAGE
-    page_cards = sorted_cards[start_idx:end_idx]
-    
+    return sorted_cards[start_idx:end_idx], total_pages
+
+def format_group_cards(
+    page_cards: list[Card],
+    user_inventory: dict[int, int],
+    group_id: int,
+    group_name: str,
+    group_size: int,
+    owned_distinct: int,
+    owned_total: int,
+    page: int,
+    total_pages: int
+) -> str:
+    """Monta o texto de uma página da Pokédex do grupo."""
     lines = []
-    total_cards_user_owns = sum(user_inventory.get(card.id, 0) for card in cards)
-    
     for card in page_cards:
         user_qty = user_inventory.get(card.id, 0)
         rarity_emoji = RARITY_EMOJIS.get(card.rarity, card.rarity)
@@ -63,8 +91,9 @@ def format_group_cards(
         f"🌼 Pokédex do grupo {group_id}. {group_name}"
         f"\nPágina {page}/{total_pages}\n\n"
         f"{chr(10).join(lines)}\n\n"
-        f"No seu inventário há {total_cards_user_owns} de {len(cards)} cards deste grupo."
-    ), total_pages
+        f"No seu inventário há {owned_total} de {group_size} cards deste grupo.\n"
+        f"Completo: {owned_distinct}/{group_size} ({completion_percent(owned_distinct, group_size)}%)"
+    )
 
 def build_group_navigation_keyboard(group_id: int, current_page: int, total_pages: int) -> InlineKeyboardMarkup:
     buttons = []
@@ -177,30 +206,16 @@ async def pokedex_command(message: Message) -> None:
                 cat_result = await session.execute(select(Category).where(Category.id == cat_id))
                 category = cat_result.scalar_one_or_none()
             else:
-                # Try exact match (case-insensitive) using func.lower
-                from sqlalchemy import func
-                search_lower = search_arg.lower()
-                cat_result = await session.execute(
-                    select(Category).where(func.lower(Category.name) == search_lower)
-                )
-                exact_categories = cat_result.scalars().all()
-                
-                if len(exact_categories) == 1:
-                    category = exact_categories[0]
-                elif len(exact_categories) > 1:
-                    # No improvável caso de categorias com mesmo nome
-                    category = exact_categories[0]
+                # Busca por nome no índice de trigramas do catálogo;
+                # só aceita direto um nome idêntico (ignorando maiúsculas e acentos)
+                await catalog_cache.ensure_loaded()
+                matches = catalog_cache.search_categories(search_arg)
+
+                if matches and matches[0].score >= 1.0:
+                    category = catalog_cache.get_category(matches[0].id)
                 else:
-                    # Se não encontrar correspondência exata, procura similares
-                    cat_result = await session.execute(
-                        select(Category).where(func.lower(Category.name).like(f"%{search_lower}%"))
-                    )
-                    similar_categories = cat_result.scalars().all()
-                    
-                    if similar_categories:
-                        # Organiza os resultados similares por comprimento do nome
-                        similar_categories.sort(key=lambda x: abs(len(x.name) - len(search_arg)))
-                        similar_cats = "\n".join(f'• ID {c.id}: "{c.name}"' for c in similar_categories[:5])
+                    if matches:
+                        similar_cats = "\n".join(f'• ID {m.id}: "{m.name}"' for m in matches)
                         await message.reply(
                             f'❌ **Categoria não encontrada**\n\n'
                             f'Não encontrei uma categoria com exatamente o nome "{search_arg}".\n\n'
@@ -217,14 +232,8 @@ async def pokedex_command(message: Message) -> None:
                     return
 
             # Buscar grupos da categoria
-            group_result = await session.execute(
-                select(Group)
-                .join(Group.cards)
-                .join(Card.inventory)
-                .where(Group.category_id == category.id, Inventory.user_id == user_id)
-                .options(selectinload(Group.category))
-            )
-            groups = list({g for g in group_result.scalars().all()})
+            await catalog_cache.ensure_loaded()
+            groups = await fetch_owned_groups(session, user_id, category.id)
 
             if not groups:
                 await message.reply(
@@ -250,30 +259,15 @@ async def pokedex_command(message: Message) -> None:
                 group_result = await session.execute(select(Group).where(Group.id == group_id))
                 group = group_result.scalar_one_or_none()
             else:
-                # Try exact match (case-insensitive) using func.lower for exact comparison
-                from sqlalchemy import func
-                search_lower = search_arg.lower()
-                group_result = await session.execute(
-                    select(Group).where(func.lower(Group.name) == search_lower)
-                )
-                exact_groups = group_result.scalars().all()
-                
-                if len(exact_groups) == 1:
-                    group = exact_groups[0]
-                elif len(exact_groups) > 1:
-                    # No conflito improvável de grupos com mesmo nome
-                    group = exact_groups[0]
+                # Busca por nome no índice de trigramas do catálogo
+                await catalog_cache.ensure_loaded()
+                matches = catalog_cache.search_groups(search_arg)
+
+                if matches and matches[0].score >= 1.0:
+                    group = catalog_cache.get_group(matches[0].id)
                 else:
-                    # Se não encontrar correspondência exata, procura similares
-                    group_result = await session.execute(
-                        select(Group).where(func.lower(Group.name).like(f"%{search_lower}%"))
-                    )
-                    similar_groups = group_result.scalars().all()
-                    
-                    if similar_groups:
-                        # Organiza os resultados similares por comprimento do nome (mais próximo primeiro)
-                        similar_groups.sort(key=lambda x: abs(len(x.name) - len(search_arg)))
-                        similar_groups_list = "\n".join(f'• ID {g.id}: "{g.name}"' for g in similar_groups[:5])
+                    if matches:
+                        similar_groups_list = "\n".join(f'• ID {m.id}: "{m.name}"' for m in matches)
                         await message.reply(
                             f'❌ **Grupo não encontrado**\n\n'
                             f'Não encontrei um grupo com exatamente o nome "{search_arg}".\n\n'
@@ -306,15 +300,9 @@ async def pokedex_category_callback(callback: CallbackQuery) -> None:
 
     user_id = callback.from_user.id
 
+    await catalog_cache.ensure_loaded()
     async with get_session() as session:
-        group_result = await session.execute(
-            select(Group)
-            .join(Group.cards)
-            .join(Card.inventory)
-            .where(Group.category_id == category_id, Inventory.user_id == user_id)
-            .options(selectinload(Group.category))
-        )
-        groups = list({g for g in group_result.scalars().all()})
+        groups = await fetch_owned_groups(session, user_id, category_id)
 
     if not groups:
         await callback.message.answer("Você não possui nenhum card dessa categoria.")
@@ -343,37 +331,47 @@ async def pokedex_group_callback(callback: CallbackQuery) -> None:
     await show_group_cards(callback, group_id, user_id)
 
 async def show_group_cards(message_or_callback: Message | CallbackQuery, group_id: int, user_id: int, page: int = 1) -> None:
-    async with get_session() as session:
-        group_result = await session.execute(select(Group).where(Group.id == group_id))
-        group = group_result.scalar_one_or_none()
-
-        if not group:
-            msg = "Esse grupo não existe ou foi removido."
-            if isinstance(message_or_callback, CallbackQuery):
-                await message_or_callback.message.answer(msg)
-                await message_or_callback.answer()
-            else:
-                await message_or_callback.answer(msg)
-            return
+    # Grupo e lista de cards vêm do catálogo em memória; do banco só são lidos
+    # o progresso do usuário no grupo e as quantidades dos cards da página.
+    await catalog_cache.ensure_loaded()
+    group = catalog_cache.get_group(group_id)
+
+    if not group:
+        msg = "Esse grupo não existe ou foi removido."
+        if isinstance(message_or_callback, CallbackQuery):
+            await message_or_callback.message.answer(msg)
+            await message_or_callback.answer()
+        else:
+            await message_or_callback.answer(msg)
+        return
 
-        cards_result = await session.execute(select(Card).where(Card.group_id == group_id))
-        cards_in_group = cards_result.scalars().all()
+    cards_in_group = catalog_cache.get_group_cards(group_id)
+    page_cards, total_pages = paginate_group_cards(cards_in_group, page)
 
-        inv_result = await session.execute(
-            select(Inventory)
-            .join(Inventory.card)
-            .where(Inventory.user_id == user_id, Card.group_id == group_id)
-        )
-        user_inventory_list = inv_result.scalars().all()
-        user_inventory_map = {inv.card_id: inv.quantity for inv in user_inventory_list}
+    async with get_session() as session:
+        progress = await session.get(UserGroupProgress, (user_id, group_id))
+
+        user_inventory_map = {}
+        if progress and progress.owned_distinct > 0 and page_cards:
+            inv_result = await session.execute(
+                select(Inventory.card_id, Inventory.quantity)
+                .where(
+                    Inventory.user_id == user_id,
+                    Inventory.card_id.in_([card.id for card in page_cards])
+                )
+            )
+            user_inventory_map = {row.card_id: row.quantity for row in inv_result.all()}
 
-        caption, total_pages = format_group_cards(
-            cards=cards_in_group,
+        caption = format_group_cards(
+            page_cards=page_cards,
             user_inventory=user_inventory_map,
             group_id=group.id,
             group_name=group.name,
-            user_id=user_id,
-            page=page
+            group_size=len(cards_in_group),
+            owned_distinct=progress.owned_distinct if progress else 0,
+            owned_total=progress.owned_total if progress else 0,
+            page=page,
+            total_pages=total_pages
         )
 
         keyboard = build_group_navigation_keyboard(group.id, page, total_pages)
@@ -1,14 +1,15 @@
-from math import ceil
 from aiogram import types, Router, F
 from aiogram.enums import ParseMode
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from sqlalchemy import select, func
-from sqlalchemy.orm import joinedload
 
 from database.session import get_session
-from database.models import User, Marketplace, Inventory, Card
+from database.models import User
+from database.inventory import add_cards
+from database.market import quote_stock, take_stock
+from database.crud_user import spend_coins
+from database.storefront import STOREFRONT_PAGE_SIZE, storefront_cache
 
-PAGE_SIZE = 5
+PAGE_SIZE = STOREFRONT_PAGE_SIZE
 
 # user_states => whether the user is waiting to input "card_id x quantity" lines
 user_states = {}  # { user_id: "waiting_for_cards_input" | None }
@@ -24,65 +25,31 @@ async def pokemart_capturas(callback: types.CallbackQuery):
     """
     Displays the 'Capturas' listing with pagination.
     """
-    await show_capturas_page(callback, page=1)
+    await show_capturas_page(callback)
 
-async def show_capturas_page(callback: types.CallbackQuery, page: int):
-    async with get_session() as session:
-        # Count how many distinct "grouped" listings exist in normal rarities
-        count_q = select(func.count(Card.id)).select_from(
-            select(
-                Card.id.label("card_id"),
-                Card.name.label("card_name"),
-                Card.rarity.label("card_rarity"),
-                Marketplace.price.label("card_price"),
-                func.count(Marketplace.id).label("available")
-            )
-            .join(Marketplace.card)
-            .where(Card.rarity.in_(["🥇", "🥈", "🥉"]))
-            .group_by(Card.id, Card.name, Card.rarity, Marketplace.price)
-            .subquery()
-        )
-        count_result = await session.execute(count_q)
-        total_listings = count_result.scalar() or 0
-        total_pages = ceil(total_listings / PAGE_SIZE) if total_listings > 0 else 1
-
-        # Retrieve data for the current page
-        offset_val = (page - 1) * PAGE_SIZE
-        listings_q = (
-            select(
-                Card.id.label("card_id"),
-                Card.name.label("card_name"),
-                Card.rarity.label("card_rarity"),
-                Marketplace.price.label("card_price"),
-                func.count(Marketplace.id).label("available")
-            )
-            .join(Marketplace.card)
-            .where(Card.rarity.in_(["🥇", "🥈", "🥉"]))
-            .group_by(Card.id, Card.name, Card.rarity, Marketplace.price)
-            .limit(PAGE_SIZE)
-            .offset(offset_val)
-        )
-        result = await session.execute(listings_q)
-        rows = result.all()
+async def show_capturas_page(callback: types.CallbackQuery, after=None, before=None):
+    # Served from the in-memory storefront snapshot (no database access)
+    await storefront_cache.ensure_loaded()
+    page = storefront_cache.page(after=after, before=before, size=PAGE_SIZE)
 
     # Build text
-    if not rows:
+    if not page.entries:
         text = "🃏 **Capturas**\n\nNenhum card está à venda no momento."
     else:
         text = "🃏 **Capturas**\n\n"
-        for r in rows:
+        for r in page.entries:
             text += (
-                f"{r.card_rarity} **{r.card_id}. {r.card_name}** "
-                f"- `{r.card_price}` pokecoins "
+                f"{r.rarity} **{r.card_id}. {r.name}** "
+                f"- `{r.price}` pokecoins "
                 f"(x{r.available} disponíveis)\n"
             )
 
-    # Build inline keyboard
+    # Build inline keyboard (keyset tokens: card_id and price of the page edge)
     keyboard = InlineKeyboardBuilder()
-    if page > 1:
-        keyboard.button(text="⬅️ Anterior", callback_data=f"capturas_page_{page-1}")
-    if page < total_pages:
-        keyboard.button(text="Próxima ➡️", callback_data=f"capturas_page_{page+1}")
+    if page.prev_key:
+        keyboard.button(text="⬅️ Anterior", callback_data=f"capturas_prev_{page.prev_key[0]}_{page.prev_key[1]}")
+    if page.next_key:
+        keyboard.button(text="Próxima ➡️", callback_data=f"capturas_next_{page.next_key[0]}_{page.next_key[1]}")
 
     # Add "Comprar Cards" button
     keyboard.button(text="🛒 Comprar Cards", callback_data="capturas_buy_cards")
@@ -103,11 +70,16 @@ async def capturas_page(callback: types.CallbackQuery):
     Handles pagination for Capturas listings.
     """
     try:
-        page = int(callback.data.split("_")[-1])
+        _, direction, card_id, price = callback.data.split("_")
+        key = (int(card_id), int(price))
     except ValueError:
-        await callback.answer("Página inválida.", show_alert=True)
+        # Buttons from before keyset pagination: back to the first page
+        await show_capturas_page(callback)
         return
-    await show_capturas_page(callback, page)
+    if direction == "prev":
+        await show_capturas_page(callback, before=key)
+    else:
+        await show_capturas_page(callback, after=key)
 
 ##############################################################################
 # 2) Buy Cards Flow
@@ -165,65 +137,56 @@ async def capturas_cards_input(message: types.Message):
             )
             return
 
-    # Check availability & cost
+    # Same card on several lines counts as a single order line
+    requested = {}
+    for (card_id, q) in orders:
+        requested[card_id] = requested.get(card_id, 0) + q
+
+    # Check availability & cost of the whole order with one grouped query
     async with get_session() as session:
-        total_cost = 0
-        for (card_id, q) in orders:
-            ccount_q = select(func.count(Marketplace.id)).where(Marketplace.card_id == card_id)
-            res = await session.execute(ccount_q)
-            available = res.scalar() or 0
-            if available < q:
-                await message.reply(
-                    f"❌ **Erro:** Você pediu `{q}` do card `{card_id}`, mas só há `{available}` disponível.",
-                    parse_mode=ParseMode.MARKDOWN
-                )
-                return
-            single_q = select(Marketplace).where(Marketplace.card_id == card_id).limit(1)
-            res = await session.execute(single_q)
-            single_list = res.scalar_one_or_none()
-            if not single_list:
-                await message.reply(
-                    f"❌ **Erro:** Nenhuma listing para card ID `{card_id}`.",
-                    parse_mode=ParseMode.MARKDOWN
-                )
-                return
-            total_cost += single_list.price * q
-
-        # Check user coins
-        buyer_q = select(User).where(User.id == user_id)
-        res = await session.execute(buyer_q)
-        buyer = res.scalar_one_or_none()
-        if not buyer:
+        quotes = await quote_stock(session, requested)
+        buyer = await session.get(User, user_id)
+
+    total_cost = 0
+    for card_id, q in requested.items():
+        quote = quotes.get(card_id)
+        if not quote or not quote.available:
             await message.reply(
-                "❌ **Erro:** Você não está registrado. Use `/jornada`.",
+                f"❌ **Erro:** Nenhuma listing para card ID `{card_id}`.",
                 parse_mode=ParseMode.MARKDOWN
             )
             return
-        if buyer.coins < total_cost:
+        if quote.cost is None:
             await message.reply(
-                f"❌ **Erro:** Você precisa de `{total_cost}` pokecoins, mas tem `{buyer.coins}`.",
+                f"❌ **Erro:** Você pediu `{q}` do card `{card_id}`, mas só há `{quote.available}` disponível.",
                 parse_mode=ParseMode.MARKDOWN
             )
             return
+        total_cost += quote.cost
+
+    # Check user coins
+    if not buyer:
+        await message.reply(
+            "❌ **Erro:** Você não está registrado. Use `/jornada`.",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return
+    if buyer.coins < total_cost:
+        await message.reply(
+            f"❌ **Erro:** Você precisa de `{total_cost}` pokecoins, mas tem `{buyer.coins}`.",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return
 
     # If success, store orders & reset state
     user_states[user_id] = None
-    pending_purchase[user_id] = orders
+    pending_purchase[user_id] = list(requested.items())
 
-    # Summarize
+    # Summarize (from the same quotes)
     confirm_text = "⚠️ **Confirmação de Compra**\n\nVocê quer comprar:\n\n"
-    async with get_session() as session:
-        for (card_id, q) in orders:
-            listing_q = (
-                select(Marketplace)
-                .options(joinedload(Marketplace.card))
-                .where(Marketplace.card_id == card_id)
-                .limit(1)
-            )
-            res = await session.execute(listing_q)
-            listing = res.scalar_one_or_none()
-            if listing:
-                confirm_text += f"{listing.card.rarity} **{listing.card.id}. {listing.card.name}** - `{q}` unidades\n"
+    for card_id, q in requested.items():
+        quote = quotes[card_id]
+        confirm_text += f"{quote.rarity} **{quote.card_id}. {quote.name}** - `{q}` unidades\n"
     confirm_text += f"\n💵 **Total:** `{total_cost}` pokecoins\n\nDeseja confirmar a compra?"
 
     kb = InlineKeyboardBuilder()
@@ -236,7 +199,7 @@ async def capturas_cards_input(message: types.Message):
 
 async def confirm_buy(callback: types.CallbackQuery):
     """
-    Removes listings, adds cards, deducts coins.
+    Takes the units from the stock, adds cards, deducts coins.
     """
     try:
         buyer_id = int(callback.data.split("_")[2])
@@ -249,46 +212,34 @@ async def confirm_buy(callback: types.CallbackQuery):
         return
     orders = pending_purchase.pop(buyer_id)
 
-    total_cost = 0
+    bought = {}
+    for (card_id, q) in orders:
+        bought[card_id] = bought.get(card_id, 0) + q
+
     async with get_session() as session:
-        # fetch buyer
-        buyer_q = select(User).where(User.id == buyer_id)
-        res = await session.execute(buyer_q)
-        buyer = res.scalar_one_or_none()
-        if not buyer:
-            await callback.answer("Usuário não encontrado.", show_alert=True)
+        # Take the units from the stock (cheapest price first) with one UPDATE
+        taken = await take_stock(session, bought)
+        if {t.card_id for t in taken} != set(bought):
+            await session.rollback()
+            missing = sorted(set(bought) - {t.card_id for t in taken})
+            await callback.answer(
+                f"❌ Erro: estoque insuficiente para o(s) card(s) {', '.join(map(str, missing))}.",
+                show_alert=True
+            )
             return
 
-        for (card_id, q) in orders:
-            listing_q = select(Marketplace).where(Marketplace.card_id == card_id).limit(q)
-            r2 = await session.execute(listing_q)
-            found_listings = r2.scalars().all()
-            if len(found_listings) < q:
-                await callback.answer(
-                    f"❌ Erro: só há {len(found_listings)} listings para card {card_id}.",
-                    show_alert=True
-                )
-                return
-            for listing in found_listings:
-                total_cost += listing.price
-                await session.delete(listing)
-                # Add to buyer's inventory
-                inv_q = select(Inventory).where(Inventory.user_id == buyer_id, Inventory.card_id == card_id)
-                ires = await session.execute(inv_q)
-                inv_item = ires.scalar_one_or_none()
-                if inv_item:
-                    inv_item.quantity += 1
-                else:
-                    new_inv = Inventory(user_id=buyer_id, card_id=card_id, quantity=1)
-                    session.add(new_inv)
-
-        # final coin check
-        if buyer.coins < total_cost:
+        total_cost = sum(t.price * t.quantity for t in taken)
+        if await spend_coins(session, buyer_id, total_cost) is None:
+            await session.rollback()
             await callback.answer(f"❌ Moedas insuficientes para {total_cost}!", show_alert=True)
             return
-        buyer.coins -= total_cost
+
+        # Add to buyer's inventory (and collection counters)
+        await add_cards(session, buyer_id, bought)
         await session.commit()
 
+    storefront_cache.apply({(t.card_id, t.price): -t.quantity for t in taken})
+
     await callback.message.edit_text(
         f"✅ **Compra concluída!**\nVocê gastou `{total_cost}` pokecoins e recebeu os cards.",
         parse_mode=ParseMode.MARKDOWN
@@ -309,7 +260,9 @@ async def cancel_buy(callback: types.CallbackQuery):
 router = Router()
 
 # Pagination
-router.callback_query.register(capturas_page, lambda c: c.data.startswith("capturas_page_"))
+router.callback_query.register(
+    capturas_page, lambda c: c.data.startswith(("capturas_next_", "capturas_prev_", "capturas_page_"))
+)
 # "Comprar Cards" button
 router.callback_query.register(capturas_buy_cards, lambda c: c.data == "capturas_buy_cards")
 
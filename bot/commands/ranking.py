@@ -0,0 +1,155 @@
+import logging
+
+from aiogram import Router, types
+from aiogram.enums import ParseMode
+from aiogram.filters import Command
+from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
+
+from database.session import get_session
+from database.catalog_cache import catalog_cache
+from database.rankings import (
+    RANKING_MODES,
+    RANKING_REFRESH_INTERVAL,
+    get_ranking,
+    get_user_rank,
+)
+
+logger = logging.getLogger(__name__)
+
+router = Router()
+
+MODE_TITLES = {
+    "total": "total de cards",
+    "completo": "coleção completa",
+}
+
+USAGE = (
+    "❗ Uso: `/ranking [total|completo] [categoria]`\n\n"
+    "Exemplos:\n"
+    "• `/ranking` - ranking global por total de cards\n"
+    "• `/ranking completo` - ranking global por cards diferentes\n"
+    "• `/ranking 1` ou `/ranking Kpop` - ranking de uma categoria"
+)
+
+
+def build_ranking_keyboard(mode: str, category_id: int) -> InlineKeyboardMarkup:
+    buttons = [
+        InlineKeyboardButton(
+            text=("✅ " if key == mode else "") + MODE_TITLES[key].capitalize(),
+            callback_data=f"ranking_{key}_{category_id}"
+        )
+        for key in RANKING_MODES
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=[buttons])
+
+
+async def build_ranking_text(user_id: int, mode: str, category_id: int) -> str:
+    """Monta o texto do ranking (category_id=0 para o global)."""
+    await catalog_cache.ensure_loaded()
+    if category_id:
+        category = catalog_cache.get_category(category_id)
+        scope = f"da categoria {category.name}" if category else f"da categoria {category_id}"
+        catalog_size = sum(
+            len(catalog_cache.get_group_cards(g.id)) for g in catalog_cache.get_groups(category_id)
+        )
+    else:
+        scope = "global"
+        catalog_size = len(catalog_cache.cards_by_id)
+
+    async with get_session() as session:
+        entries = await get_ranking(session, mode, category_id or None)
+        own_rank = await get_user_rank(session, user_id, mode, category_id or None)
+
+    medals = ["🥇", "🥈", "🥉"]
+    lines = []
+    for idx, entry in enumerate(entries):
+        position = medals[idx] if idx < len(medals) else f"{idx + 1}."
+        if mode == "completo":
+            percent = entry.distinct_cards * 100 // catalog_size if catalog_size else 0
+            lines.append(f"{position} {entry.nickname} - {entry.distinct_cards} cards diferentes ({percent}%)")
+        else:
+            lines.append(f"{position} {entry.nickname} - {entry.total} cards")
+
+    text = f"🏆 **Ranking {scope} - {MODE_TITLES[mode]}**\n\n"
+    text += "\n".join(lines) if lines else "Ninguém pontuou neste ranking ainda."
+
+    if own_rank is None:
+        text += "\n\nVocê ainda não aparece neste ranking."
+    else:
+        position = f"{own_rank.rank}+" if own_rank.capped else f"{own_rank.rank}"
+        unit = "cards diferentes" if mode == "completo" else "cards"
+        text += f"\n\n📍 Sua posição: #{position} ({own_rank.quantity} {unit})"
+
+    if category_id:
+        text += f"\n\n_Rankings por categoria são atualizados a cada {RANKING_REFRESH_INTERVAL // 60} minutos._"
+    return text
+
+
+@router.message(Command(commands=["ranking"]))
+async def ranking_command(message: types.Message) -> None:
+    """
+    Mostra o ranking global de colecionadores ou o de uma categoria.
+    Uso: /ranking [total|completo] [categoria]
+    """
+    parts = message.text.split(maxsplit=1)
+    args = parts[1].strip() if len(parts) > 1 else ""
+
+    mode = "total"
+    first, _, rest = args.partition(" ")
+    if first.lower() in RANKING_MODES:
+        mode = first.lower()
+        args = rest.strip()
+
+    category_id = 0
+    if args:
+        await catalog_cache.ensure_loaded()
+        if args.isdigit():
+            category = catalog_cache.get_category(int(args))
+        else:
+            matches = catalog_cache.search_categories(args, limit=1)
+            category = catalog_cache.get_category(matches[0].id) if matches else None
+        if not category:
+            await message.reply(
+                f"❌ Categoria `{args}` não encontrada.\n\n{USAGE}",
+                parse_mode=ParseMode.MARKDOWN
+            )
+            return
+        category_id = category.id
+
+    try:
+        text = await build_ranking_text(message.from_user.id, mode, category_id)
+    except Exception as e:
+        logger.error(f"Erro ao montar o ranking: {str(e)}", exc_info=True)
+        await message.reply("❌ Não foi possível carregar o ranking agora. Tente novamente mais tarde.")
+        return
+
+    await message.reply(
+        text,
+        reply_markup=build_ranking_keyboard(mode, category_id),
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+
+@router.callback_query(lambda c: c.data.startswith("ranking_"))
+async def ranking_callback(callback: CallbackQuery) -> None:
+    try:
+        _, mode, category_id = callback.data.split("_")
+        category_id = int(category_id)
+    except ValueError:
+        await callback.answer("Dados inválidos.", show_alert=True)
+        return
+    if mode not in RANKING_MODES:
+        await callback.answer("Dados inválidos.", show_alert=True)
+        return
+
+    text = await build_ranking_text(callback.from_user.id, mode, category_id)
+    try:
+        await callback.message.edit_text(
+            text,
+            reply_markup=build_ranking_keyboard(mode, category_id),
+            parse_mode=ParseMode.MARKDOWN
+        )
+    except Exception:
+        # Mensagem sem alterações (mesmo modo clicado novamente)
+        pass
+    await callback.answer()
@@ -1,31 +1,33 @@
 import asyncio
-import time
 import logging
-from aiogram import Router, types, F
+from datetime import datetime
+from aiogram import Bot, Router, types, F
 from aiogram.filters import Command
 from aiogram.enums import ParseMode
 from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
-from sqlalchemy import select
-from sqlalchemy.orm import joinedload
+from sqlalchemy import select, update
 
-from database.models import User, Inventory, Card
+from database.models import User, Card, Trade
 from database.session import get_session
-from database.utils import consolidate_inventory_duplicates
+from database.user_lookup import resolve_user
+from database.trades import (
+    TRADE_ACCEPTED,
+    TRADE_PENDING,
+    TRADE_REJECTED,
+    create_trade,
+    close_trade,
+    expire_pending_trades,
+)
+from database.crud_user import lock_users
+from database.inventory import add_cards, remove_cards, lock_inventory_rows
+from utils.titles import title_change_message
 
 logger = logging.getLogger(__name__)
 router = Router()
 
-# Armazenamento global para trocas pendentes
-# Cada entrada tem a estrutura:
-#   trade_id: {
-#       "requester_id": int,
-#       "target_id": int,
-#       "requested_cards": list[tuple[int, int]],
-#       "offered_cards": list[tuple[int, int]],
-#       "created_at": float,  # timestamp
-#       "processing": bool    # flag para controle de processamento
-#   }
-pending_trades = {}
+# As trocas pendentes ficam na tabela `trades` (database/trades.py), para
+# sobreviverem a reinícios; a expiração é feita por expire_trades(), chamada
+# periodicamente pelo bot/main.py.
 
 # Tempo de expiração (segundos)
 TRADE_TIMEOUT = 180  # 3 minutos
@@ -72,12 +74,6 @@ async def roubar_command(message: types.Message) -> None:
     requester_id = message.from_user.id
     logger.info("Comando /roubar recebido do usuário %s", requester_id)
     
-    # Atualizar o nome de usuário no banco de dados se o usuário mudou de @username
-    async with get_session() as session:
-        # Silently update username if it changed
-        if message.from_user.username:
-            await update_username_if_changed(session, requester_id, message.from_user.username)
-    
     text_parts = message.text.strip().split(maxsplit=1)
     if len(text_parts) < 2:
         await message.reply(
@@ -182,74 +178,40 @@ async def roubar_command(message: types.Message) -> None:
         "Clique em **Aceitar** para confirmar ou **Recusar** para cancelar."
     )
 
-    # Cria o teclado inline com callback_data que contém o ID único da troca.
-    # Usaremos o ID da mensagem enviada com o teclado como identificador único.
+    # Registra a troca antes de enviar a proposta: o ID da linha vai no callback_data
+    async with get_session() as session:
+        trade = await create_trade(
+            session,
+            chat_id=message.chat.id,
+            requester_id=requester_id,
+            target_id=target_id,
+            requested_cards=requested_cards,
+            offered_cards=offered_cards,
+            timeout=TRADE_TIMEOUT
+        )
+        trade_id = trade.id
+        await session.commit()
+
     sent_message = await message.reply(
         confirm_text,
         parse_mode=ParseMode.MARKDOWN,
         reply_markup=InlineKeyboardMarkup(
             inline_keyboard=[
                 [
-                    InlineKeyboardButton(text="✅ Aceitar", callback_data=f"roubar_accept:{sent_message_id_placeholder()}"),
-                    InlineKeyboardButton(text="❌ Recusar", callback_data=f"roubar_reject:{sent_message_id_placeholder()}")
+                    InlineKeyboardButton(text="✅ Aceitar", callback_data=f"roubar_accept:{trade_id}"),
+                    InlineKeyboardButton(text="❌ Recusar", callback_data=f"roubar_reject:{trade_id}")
                 ]
             ]
         )
     )
-    # Utiliza o ID da mensagem enviada como trade_id
-    trade_id = sent_message.message_id
-
-    # Agora, atualizamos o teclado inline com o trade_id correto
-    kb = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(text="✅ Aceitar", callback_data=f"roubar_accept:{trade_id}"),
-                InlineKeyboardButton(text="❌ Recusar", callback_data=f"roubar_reject:{trade_id}")
-            ]
-        ]
-    )
-    try:
-        await sent_message.edit_reply_markup(reply_markup=kb)
-    except Exception as e:
-        logger.error("Erro ao atualizar teclado inline: %s", e)
-
-    # Armazena os dados da troca com timestamp
-    pending_trades[trade_id] = {
-        "requester_id": requester_id,
-        "target_id": target_id,
-        "requested_cards": requested_cards,
-        "offered_cards": offered_cards,
-        "created_at": time.time(),
-        "processing": False  # Adicionado flag para controle de processamento
-    }
-    logger.info("Troca pendente criada (trade_id=%s) entre %s e %s", trade_id, requester_id, target_id)
 
-    # Auto-limpeza: remove a troca após o timeout, se ainda estiver pendente.
-    async def auto_cleanup(trade_id: int, chat_id: int):
-        await asyncio.sleep(TRADE_TIMEOUT)
-        trade_data = pending_trades.get(trade_id)
-        if trade_data:
-            logger.info("Troca %s expirada após %s segundos", trade_id, TRADE_TIMEOUT)
-            del pending_trades[trade_id]
-            try:
-                # Se possível, edita a mensagem para informar que a proposta expirou.
-                await sent_message.edit_text(
-                    "⌛ A proposta de troca expirou após 3 minutos sem resposta.",
-                    parse_mode=ParseMode.MARKDOWN
-                )
-            except Exception as e:
-                logger.error("Erro ao editar mensagem expirada (trade_id=%s): %s", trade_id, e)
-            # Opcional: enviar uma mensagem de notificação no chat
-            try:
-                await message.bot.send_message(
-                    chat_id,
-                    "⌛ A proposta de troca expirou.",
-                    parse_mode=ParseMode.MARKDOWN
-                )
-            except Exception as e:
-                logger.error("Erro ao notificar expiração da troca (trade_id=%s): %s", trade_id, e)
-
-    asyncio.create_task(auto_cleanup(trade_id, message.chat.id))
+    # Guarda a mensagem para que a varredura de expiração possa editá-la
+    async with get_session() as session:
+        await session.execute(
+            update(Trade).where(Trade.id == trade_id).values(message_id=sent_message.message_id)
+        )
+        await session.commit()
+    logger.info("Troca pendente criada (trade_id=%s) entre %s e %s", trade_id, requester_id, target_id)
 
 
 # ===============================
@@ -270,124 +232,112 @@ async def roubar_accept_callback(callback: CallbackQuery) -> None:
         await callback.answer("Dados de troca inválidos.", show_alert=True)
         return
 
-    trade_data = pending_trades.get(trade_id)
-    if not trade_data:
-        logger.warning("Troca não encontrada ou expirada (trade_id=%s)", trade_id)
-        await callback.answer("Troca expirada ou inválida.", show_alert=True)
-        return
-
-    # Verifica expiração
-    if time.time() - trade_data["created_at"] > TRADE_TIMEOUT:
-        logger.info("Troca %s expirada", trade_id)
-        del pending_trades[trade_id]
-        await callback.answer("Troca expirada.", show_alert=True)
-        return
-
-    # Verifica se o clique é feito pelo usuário–alvo
-    if callback.from_user.id != trade_data["target_id"]:
-        logger.warning("Usuário %s tentou interagir com a troca %s (alvo=%s)",
-                       callback.from_user.id, trade_id, trade_data["target_id"])
-        await callback.answer("Você não pode interagir com essa troca.", show_alert=True)
-        return
-        
-    # Verifica se a troca já está sendo processada (evita cliques múltiplos)
-    if trade_data.get("processing", False):
-        logger.warning("Tentativa de processar troca %s que já está em processamento", trade_id)
-        await callback.answer("Esta troca já está sendo processada.", show_alert=True)
+    trade = await get_open_trade(callback, trade_id)
+    if not trade:
         return
-        
-    # Marca imediatamente a troca como em processamento
-    trade_data["processing"] = True
 
     # Processa a troca
-    requester_id = trade_data["requester_id"]
-    requested_cards = trade_data["requested_cards"]
-    offered_cards = trade_data["offered_cards"]
+    requester_id = trade.requester_id
+    requested_cards = [tuple(pair) for pair in trade.requested_cards]
+    offered_cards = [tuple(pair) for pair in trade.offered_cards]
 
     try:
         async with get_session() as session:
-            # Consolidar possíveis duplicatas de inventário para ambos os usuários
-            # Fazemos isso primeiro para evitar problemas durante o carregamento dos inventários
-            try:
-                await consolidate_inventory_duplicates(session, requester_id)
-                await consolidate_inventory_duplicates(session, callback.from_user.id)
-            except Exception as e:
-                logger.error("Erro durante consolidação de inventário: %s", e)
-                await callback.answer("Erro durante verificação de inventário.", show_alert=True)
-                return
-            
-            # Carrega o solicitante e seu inventário
-            req_result = await session.execute(
-                select(User).where(User.id == requester_id).options(joinedload(User.inventory))
-            )
-            requester = req_result.unique().scalar_one_or_none()
+            target_id = callback.from_user.id
 
-            # Carrega o usuário–alvo (quem aceitou)
-            tgt_result = await session.execute(
-                select(User).where(User.id == callback.from_user.id).options(joinedload(User.inventory))
-            )
-            target_user = tgt_result.unique().scalar_one_or_none()
+            requested = {}
+            for (card_id, qty) in requested_cards:
+                requested[card_id] = requested.get(card_id, 0) + qty
+            offered = {}
+            for (card_id, qty) in offered_cards:
+                offered[card_id] = offered.get(card_id, 0) + qty
+
+            # Trava os dois usuários e depois só as linhas de inventário
+            # envolvidas, sempre em ordem de ID, para evitar deadlocks
+            users = await lock_users(session, [requester_id, target_id])
+            requester = users.get(requester_id)
+            target_user = users.get(target_id)
 
             if not requester or not target_user:
                 logger.error("Usuário não encontrado: requester(%s) ou target(%s)",
-                             requester_id, callback.from_user.id)
+                             requester_id, target_id)
                 await callback.answer("Usuário não encontrado ou não registrado.", show_alert=True)
                 return
 
+            owned = await lock_inventory_rows(
+                session,
+                [(target_id, card_id) for card_id in requested]
+                + [(requester_id, card_id) for card_id in offered]
+            )
+
             # Verifica se o alvo possui as cartas solicitadas
-            for (card_id, qty) in requested_cards:
-                t_item = next((inv for inv in target_user.inventory if inv.card_id == card_id), None)
-                if not t_item or t_item.quantity < qty:
+            for card_id, qty in requested.items():
+                if owned.get((target_id, card_id), 0) < qty:
                     msg = f"Você não possui {qty}x do card ID {card_id}."
                     logger.info("Troca falhou: %s", msg)
                     await callback.answer(msg, show_alert=True)
                     return
 
             # Verifica se o solicitante possui as cartas ofertadas
-            for (card_id, qty) in offered_cards:
-                r_item = next((inv for inv in requester.inventory if inv.card_id == card_id), None)
-                if not r_item or r_item.quantity < qty:
+            for card_id, qty in offered.items():
+                if owned.get((requester_id, card_id), 0) < qty:
                     msg = f"O solicitante não possui {qty}x do card ID {card_id}."
                     logger.info("Troca falhou: %s", msg)
                     await callback.answer(msg, show_alert=True)
                     return
 
-            # Transfere os cards do alvo para o solicitante
-            for (card_id, qty) in requested_cards:
-                t_item = next(inv for inv in target_user.inventory if inv.card_id == card_id)
-                t_item.quantity -= qty
-                r_item = next((inv for inv in requester.inventory if inv.card_id == card_id), None)
-                if r_item:
-                    r_item.quantity += qty
-                else:
-                    session.add(Inventory(user_id=requester_id, card_id=card_id, quantity=qty))
-
-            # Transfere os cards do solicitante para o alvo
-            for (card_id, qty) in offered_cards:
-                r_item = next(inv for inv in requester.inventory if inv.card_id == card_id)
-                r_item.quantity -= qty
-                t_item = next((inv for inv in target_user.inventory if inv.card_id == card_id), None)
-                if t_item:
-                    t_item.quantity += qty
-                else:
-                    session.add(Inventory(user_id=callback.from_user.id, card_id=card_id, quantity=qty))
+            # Transição atômica pending -> accepted; um segundo clique (ou a
+            # expiração) não passa daqui. Se a transação for desfeita, a troca
+            # volta a ficar pendente.
+            if not await close_trade(session, trade_id, target_id, TRADE_ACCEPTED):
+                logger.warning("Troca %s já foi processada ou expirou", trade_id)
+                await callback.answer("Esta troca já foi processada ou expirou.", show_alert=True)
+                return
+
+            # Retira os cards de cada lado (atualizando os contadores de coleção)
+            removed_target = await remove_cards(session, target_id, requested)
+            removed_requester = await remove_cards(session, requester_id, offered)
+            if (
+                len(removed_target.quantities) != len(requested)
+                or len(removed_requester.quantities) != len(offered)
+            ):
+                await session.rollback()
+                logger.info("Troca %s falhou: inventário mudou durante a troca", trade_id)
+                await callback.answer("Os inventários mudaram durante a troca. Tente novamente.", show_alert=True)
+                return
+
+            # Transfere os cards do alvo para o solicitante e do solicitante para o alvo
+            added_requester = await add_cards(session, requester_id, requested)
+            added_target = await add_cards(session, target_id, offered)
 
             await session.commit()
             logger.info("Troca %s concluída com sucesso.", trade_id)
+
+            # Avisos de título: compara o total de cada um antes e depois da troca
+            title_notes = []
+            for nickname, removed, added in (
+                (requester.nickname, removed_requester, added_requester),
+                (target_user.nickname, removed_target, added_target),
+            ):
+                before = removed.total_before if removed.total_before is not None else added.total_before
+                after = added.total_after if added.total_after is not None else removed.total_after
+                note = title_change_message(nickname, before, after)
+                if note:
+                    title_notes.append(note)
     except Exception as e:
         logger.exception("Erro durante processamento da troca (trade_id=%s): %s", trade_id, e)
+        # A transação foi desfeita: a troca continua pendente e pode ser aceita de novo
         await callback.answer("Erro interno durante a troca.", show_alert=True)
-        # Marca a troca como não mais em processamento para permitir nova tentativa
-        trade_data["processing"] = False
         return
 
     try:
-        await callback.message.edit_text("✅ **Troca concluída com sucesso!**", parse_mode=ParseMode.MARKDOWN)
+        await callback.message.edit_text(
+            "✅ **Troca concluída com sucesso!**" + "".join(f"\n\n{note}" for note in title_notes),
+            parse_mode=ParseMode.MARKDOWN
+        )
     except Exception as e:
         logger.error("Erro ao editar mensagem da troca (trade_id=%s): %s", trade_id, e)
     await callback.answer("Troca finalizada!", show_alert=True)
-    # Remove a troca dos registros pendentes
-    pending_trades.pop(trade_id, None)
 
 
 # ===============================
@@ -407,17 +357,15 @@ async def roubar_reject_callback(callback: CallbackQuery) -> None:
         await callback.answer("Dados de troca inválidos.", show_alert=True)
         return
 
-    trade_data = pending_trades.get(trade_id)
-    if not trade_data:
-        logger.warning("Troca não encontrada ou expirada (trade_id=%s)", trade_id)
-        await callback.answer("Troca expirada ou inválida.", show_alert=True)
+    trade = await get_open_trade(callback, trade_id)
+    if not trade:
         return
 
-    # Verifica se o clique é feito pelo usuário–alvo
-    if callback.from_user.id != trade_data["target_id"]:
-        logger.warning("Usuário %s tentou interagir com a troca %s (alvo=%s)",
-                       callback.from_user.id, trade_id, trade_data["target_id"])
-        await callback.answer("Você não pode interagir com essa troca.", show_alert=True)
+    async with get_session() as session:
+        closed = await close_trade(session, trade_id, callback.from_user.id, TRADE_REJECTED)
+        await session.commit()
+    if not closed:
+        await callback.answer("Esta troca já foi processada ou expirou.", show_alert=True)
         return
 
     logger.info("Troca %s recusada pelo usuário %s", trade_id, callback.from_user.id)
@@ -426,7 +374,70 @@ async def roubar_reject_callback(callback: CallbackQuery) -> None:
     except Exception as e:
         logger.error("Erro ao editar mensagem de recusa (trade_id=%s): %s", trade_id, e)
     await callback.answer("Troca recusada.", show_alert=True)
-    pending_trades.pop(trade_id, None)
+
+
+# =========================================================
+# Consulta e expiração das trocas
+# =========================================================
+
+async def get_open_trade(callback: CallbackQuery, trade_id: int) -> Trade | None:
+    """
+    Busca a troca pelo ID e valida se ela ainda está pendente, dentro do prazo e
+    se quem clicou é o usuário–alvo. Responde ao callback e retorna None caso contrário.
+    """
+    async with get_session() as session:
+        trade = await session.get(Trade, trade_id)
+
+    if not trade or trade.status != TRADE_PENDING:
+        logger.warning("Troca não encontrada ou encerrada (trade_id=%s)", trade_id)
+        await callback.answer("Troca expirada ou inválida.", show_alert=True)
+        return None
+
+    if datetime.utcnow() >= trade.expires_at:
+        logger.info("Troca %s expirada", trade_id)
+        await callback.answer("Troca expirada.", show_alert=True)
+        return None
+
+    # Verifica se o clique é feito pelo usuário–alvo
+    if callback.from_user.id != trade.target_id:
+        logger.warning("Usuário %s tentou interagir com a troca %s (alvo=%s)",
+                       callback.from_user.id, trade_id, trade.target_id)
+        await callback.answer("Você não pode interagir com essa troca.", show_alert=True)
+        return None
+
+    return trade
+
+
+async def expire_trades(bot: Bot) -> int:
+    """
+    Varredura única de expiração: marca de uma vez todas as trocas vencidas
+    como expiradas e edita as mensagens delas em lote.
+
+    Returns:
+        int: Quantidade de trocas expiradas
+    """
+    async with get_session() as session:
+        expired = await expire_pending_trades(session)
+        await session.commit()
+
+    async def edit_expired(chat_id: int, message_id: int) -> None:
+        try:
+            await bot.edit_message_text(
+                "⌛ A proposta de troca expirou após 3 minutos sem resposta.",
+                chat_id=chat_id,
+                message_id=message_id,
+                parse_mode=ParseMode.MARKDOWN
+            )
+        except Exception as e:
+            logger.error("Erro ao editar mensagem expirada (chat=%s, msg=%s): %s", chat_id, message_id, e)
+
+    await asyncio.gather(*(
+        edit_expired(trade.chat_id, trade.message_id)
+        for trade in expired if trade.message_id is not None
+    ))
+    if expired:
+        logger.info("%s trocas expiradas", len(expired))
+    return len(expired)
 
 
 # =========================================================
@@ -508,48 +519,10 @@ async def find_user_by_reference(session, reference: str, message_user_id: int =
     Returns:
         User object or None if not found
     """
-    # Clean up reference (remove @ if present)
-    reference_clean = reference.lstrip("@").lower()
-    
-    # Try to find by username OR nickname case-insensitive
-    stmt = select(User).where(
-        (User.username.ilike(reference_clean)) | 
-        (User.nickname.ilike(f"%{reference_clean}%"))
-    )
-    
-    # Exclude self if message_user_id is provided
-    if message_user_id is not None:
-        stmt = stmt.where(User.id != message_user_id)
-        
-    result = await session.execute(stmt)
-    return result.scalar_one_or_none()
-
+    # Resolução indexada e com cache (exato, depois prefixo único)
+    user = await resolve_user(session, reference)
 
-async def update_username_if_changed(session, user_id: int, current_username: str) -> None:
-    """
-    Updates the user's username in the database if it has changed.
-    
-    Args:
-        session: Database session
-        user_id: Telegram user ID
-        current_username: Current Telegram username
-    """
-    if not current_username:
-        return  # Skip if no username provided
-        
-    stmt = select(User).where(User.id == user_id)
-    result = await session.execute(stmt)
-    user = result.scalar_one_or_none()
-    
-    if user and user.username != current_username:
-        logger.info(f"Updating username for user {user_id} from '{user.username}' to '{current_username}'")
-        user.username = current_username
-        await session.commit()
-
-
-def sent_message_id_placeholder() -> str:
-    """
-    Função auxiliar para compor o placeholder inicial do callback_data.
-    Esse valor será substituído logo após o envio da mensagem.
-    """
-    return "0"
+    # Exclude self if message_user_id is provided
+    if user is not None and user.id == message_user_id:
+        return None
+    return user
@@ -1,25 +1,128 @@
 # commands/venderc.py
 
 import logging
+from math import ceil
 from aiogram import Router, types
 from aiogram.filters import Command
 from aiogram.enums import ParseMode
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from sqlalchemy.future import select
-from sqlalchemy.orm import joinedload
 
 from database.session import get_session
-from database.models import User, Inventory, Card, Marketplace
+from database.models import User, Inventory
+from database.inventory import remove_cards
+from database.crud_user import credit_coins, lock_users
+from database.catalog_cache import catalog_cache
+from database.market import HOUSE_PRICES, add_stock, find_sellable_cards, house_price
+from database.storefront import storefront_cache
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
-# In-memory dictionary for pending sales { user_id: [(card_id, qty), ...] }
+# In-memory dictionary for pending sales { user_id: {"cards": {card_id: qty}, "description": str} }
 pending_sales = {}
 
+# Lines per page of the sale summary
+SALE_PAGE_SIZE = 20
+
+USAGE = (
+    "❗ **Erro:** Você precisa especificar os cards para vender.\n"
+    "Exemplos:\n"
+    "`/venderc 5 x2, 4 x1, 3 x10`\n"
+    "`/venderc duplicadas` - vende as cópias repetidas (mantém 1 de cada)\n"
+    "`/venderc 🥉 manter 1` - vende os 🥉, mantendo 1 de cada\n"
+    "`/venderc grupo 12` - vende os cards do grupo 12\n"
+    "Os filtros podem ser combinados: `/venderc grupo 12 🥈 duplicadas`"
+)
+
 # Initialize router
 router = Router()
 
+
+def parse_sale_filter(args: str):
+    """
+    Parses filters like "duplicadas", "🥉 manter 1" or "grupo 12".
+
+    Returns:
+        None if the arguments are not a filter (the "ID xQty" format), or a dict
+        with rarities, group_id and keep.
+
+    Raises:
+        ValueError: If the arguments start like a filter but are invalid.
+    """
+    tokens = args.split()
+    rarities, group_id, keep = [], None, 0
+    i = 0
+    while i < len(tokens):
+        token = tokens[i].lower()
+        if token in ("duplicadas", "repetidas"):
+            keep = max(keep, 1)
+        elif token in HOUSE_PRICES:
+            rarities.append(token)
+        elif token in ("manter", "grupo"):
+            if i + 1 >= len(tokens) or not tokens[i + 1].isdigit():
+                raise ValueError(f"`{token}` precisa de um número. Exemplo: `{token} 1`")
+            if token == "manter":
+                keep = int(tokens[i + 1])
+            else:
+                group_id = int(tokens[i + 1])
+            i += 1
+        elif i == 0:
+            return None
+        else:
+            raise ValueError(f"Filtro desconhecido: `{tokens[i]}`")
+        i += 1
+    return {"rarities": rarities or list(HOUSE_PRICES), "group_id": group_id, "keep": keep}
+
+
+def describe_sale_filter(sale_filter) -> str:
+    parts = [" ".join(sale_filter["rarities"])]
+    if sale_filter["group_id"] is not None:
+        group = catalog_cache.get_group(sale_filter["group_id"])
+        parts.append(f"grupo {group.name if group else sale_filter['group_id']}")
+    if sale_filter["keep"]:
+        parts.append(f"mantendo {sale_filter['keep']} de cada")
+    return ", ".join(parts)
+
+
+def build_sale_summary(user_id: int, sale: dict, page: int, description: str = ""):
+    """Builds the (paged) confirmation text and keyboard from the catalog cache."""
+    card_ids = list(sale)
+    total_pages = max(1, ceil(len(card_ids) / SALE_PAGE_SIZE))
+    page = min(max(page, 1), total_pages)
+
+    total_units = sum(sale.values())
+    total_value = sum(
+        house_price(catalog_cache.get_card(card_id).rarity) * qty for card_id, qty in sale.items()
+    )
+
+    text = "⚠️ **Confirmação de Venda**\n\n"
+    if description:
+        text += f"🔎 **Filtro:** {description}\n"
+    text += f"Você está prestes a vender `{total_units}` cards (`{len(card_ids)}` diferentes):\n\n"
+    for card_id in card_ids[(page - 1) * SALE_PAGE_SIZE:page * SALE_PAGE_SIZE]:
+        card = catalog_cache.get_card(card_id)
+        qty = sale[card_id]
+        text += (
+            f"{card.rarity} **{card.id}. {card.name}** - `{qty}` unidades "
+            f"(`{house_price(card.rarity) * qty}` pokecoins)\n"
+        )
+    if total_pages > 1:
+        text += f"\n📄 Página {page}/{total_pages}\n"
+    text += f"\n💵 **Total a receber:** `{total_value}` pokecoins\n\n"
+    text += "Deseja confirmar a venda?"
+
+    kb = InlineKeyboardBuilder()
+    if page > 1:
+        kb.button(text="⬅️ Anterior", callback_data=f"sell_page_{user_id}_{page - 1}")
+    if page < total_pages:
+        kb.button(text="Próxima ➡️", callback_data=f"sell_page_{user_id}_{page + 1}")
+    kb.button(text="✅ Vender", callback_data=f"confirm_sell_{user_id}")
+    kb.button(text="❌ Cancelar", callback_data="cancel_sell")
+    kb.adjust(1)
+    return text, kb.as_markup()
+
+
 @router.message(Command("venderc"))
 async def venderc_command(message: types.Message):
     """Handle the /venderc command to sell cards from the user's inventory."""
@@ -34,41 +137,43 @@ async def venderc_command(message: types.Message):
         # Check if arguments are provided
         if len(text_parts) < 2:
             logging.info("[DEBUG] No arguments provided")
-            await message.reply(
-                "❗ **Erro:** Você precisa especificar os IDs dos cards e as quantidades para vender.\n"
-                "Exemplo:\n"
-                "`/venderc 5 x2, 4 x1, 3 x10`",
-                parse_mode=ParseMode.MARKDOWN
-            )
+            await message.reply(USAGE, parse_mode=ParseMode.MARKDOWN)
             return
 
         args = text_parts[1].strip()
         logging.info(f"[DEBUG] Arguments: {args}")
 
+        try:
+            sale_filter = parse_sale_filter(args)
+        except ValueError as e:
+            await message.reply(f"❌ **Erro:** {e}", parse_mode=ParseMode.MARKDOWN)
+            return
+
         # Parse items in format "ID xQty"
-        card_data = args.split(",")
-        cards_to_sell = []
-        for item in card_data:
-            try:
-                card_id_str, quantity_str = item.strip().split("x")
-                card_id = int(card_id_str)
-                qty = int(quantity_str)
-                cards_to_sell.append((card_id, qty))
-            except ValueError:
-                logging.info(f"[DEBUG] Invalid format: {item}")
-                await message.reply(
-                    f"❌ **Erro:** Formato inválido para `{item}`. Use `ID xQuantidade`.",
-                    parse_mode=ParseMode.MARKDOWN
-                )
-                return
+        cards_to_sell = {}
+        if sale_filter is None:
+            for item in args.split(","):
+                try:
+                    card_id_str, quantity_str = item.strip().split("x")
+                    card_id = int(card_id_str)
+                    qty = int(quantity_str)
+                    if qty <= 0:
+                        raise ValueError
+                    cards_to_sell[card_id] = cards_to_sell.get(card_id, 0) + qty
+                except ValueError:
+                    logging.info(f"[DEBUG] Invalid format: {item}")
+                    await message.reply(
+                        f"❌ **Erro:** Formato inválido para `{item}`. Use `ID xQuantidade`.",
+                        parse_mode=ParseMode.MARKDOWN
+                    )
+                    return
 
+        await catalog_cache.ensure_loaded()
         logging.info("[DEBUG] Starting database query")
         async with get_session() as session:
             logging.info("[DEBUG] Database session opened")
             # Fetch user
-            user = (await session.execute(
-                select(User).where(User.id == user_id)
-            )).scalar_one_or_none()
+            user = await session.get(User, user_id)
 
             if not user:
                 logging.info("[DEBUG] User not found in database")
@@ -78,60 +183,54 @@ async def venderc_command(message: types.Message):
                 )
                 return
 
-            # Load user's inventory
-            logging.info("[DEBUG] Querying user inventory")
-            inv_result = await session.execute(
-                select(Inventory).options(joinedload(Inventory.card))
-                .where(Inventory.user_id == user_id)
-            )
-            user_inventory = inv_result.scalars().all()
-            inv_dict = {inv.card_id: inv for inv in user_inventory}
-
-            total_value = 0
-            confirmation_text = "⚠️ **Confirmação de Venda**\n\nVocê está prestes a vender:\n\n"
-
-            # Rarity value mapping
-            rarity_value = {"🥇": 1000, "🥈": 500, "🥉": 250}
-
-            # Validate and calculate sale
-            for (card_id, qty) in cards_to_sell:
-                inv_item = inv_dict.get(card_id)
-                if not inv_item or inv_item.quantity < qty:
+            if sale_filter is not None:
+                # The whole sale set in one query over inventory + cards
+                cards_to_sell = await find_sellable_cards(session, user_id, **sale_filter)
+            else:
+                # Only the requested cards of the user's inventory
+                owned = dict((await session.execute(
+                    select(Inventory.card_id, Inventory.quantity)
+                    .where(Inventory.user_id == user_id, Inventory.card_id.in_(list(cards_to_sell)))
+                )).all())
+
+        # Cards in the database that the in-memory catalog doesn't know yet
+        # (added after the last load): reload it once
+        in_database = cards_to_sell if sale_filter is not None else owned
+        if any(not catalog_cache.get_card(card_id) for card_id in in_database):
+            catalog_cache.invalidate()
+            await catalog_cache.ensure_loaded()
+
+        if sale_filter is not None:
+            # Lines still unknown to the catalog are left out of the sale
+            cards_to_sell = {
+                card_id: qty for card_id, qty in cards_to_sell.items() if catalog_cache.get_card(card_id)
+            }
+            if not cards_to_sell:
+                await message.reply(
+                    f"🔎 Nenhum card para vender com o filtro: {describe_sale_filter(sale_filter)}.",
+                    parse_mode=ParseMode.MARKDOWN
+                )
+                return
+            description = describe_sale_filter(sale_filter)
+        else:
+            # Validate the sale
+            for card_id, qty in cards_to_sell.items():
+                if owned.get(card_id, 0) < qty or not catalog_cache.get_card(card_id):
                     logging.info(f"[DEBUG] Insufficient quantity for card {card_id}")
                     await message.reply(
                         f"❌ **Erro:** Você não possui `{qty}` unidades do card ID `{card_id}`.",
                         parse_mode=ParseMode.MARKDOWN
                     )
                     return
+            description = ""
 
-                card = inv_item.card
-                card_val = rarity_value.get(card.rarity, 0) * qty
-                total_value += card_val
+        # Store pending sale
+        pending_sales[user_id] = {"cards": cards_to_sell, "description": description}
+        logging.info(f"[DEBUG] Pending sale stored for user {user_id}")
 
-                confirmation_text += (
-                    f"{card.rarity} **{card.id}. {card.name}** - `{qty}` unidades\n"
-                    f"💰 Valor parcial: `{card_val}` pokecoins\n\n"
-                )
-
-            confirmation_text += f"💵 **Total a receber:** `{total_value}` pokecoins\n\n"
-            confirmation_text += "Deseja confirmar a venda?"
-
-            # Store pending sale
-            pending_sales[user_id] = cards_to_sell
-            logging.info(f"[DEBUG] Pending sale stored for user {user_id}")
-
-            # Build confirmation keyboard
-            kb = InlineKeyboardBuilder()
-            kb.button(text="✅ Vender", callback_data=f"confirm_sell_{user_id}")
-            kb.button(text="❌ Cancelar", callback_data="cancel_sell")
-            kb.adjust(1)
-
-            await message.reply(
-                confirmation_text,
-                reply_markup=kb.as_markup(),
-                parse_mode=ParseMode.MARKDOWN
-            )
-            logging.info("[DEBUG] Confirmation message sent")
+        text, markup = build_sale_summary(user_id, cards_to_sell, 1, description)
+        await message.reply(text, reply_markup=markup, parse_mode=ParseMode.MARKDOWN)
+        logging.info("[DEBUG] Confirmation message sent")
 
     except Exception as e:
         logging.error(f"[ERROR] Unhandled exception in /venderc: {e}", exc_info=True)
@@ -140,6 +239,29 @@ async def venderc_command(message: types.Message):
             parse_mode=ParseMode.MARKDOWN
         )
 
+@router.callback_query(lambda call: call.data.startswith("sell_page_"))
+async def sell_page(callback: types.CallbackQuery):
+    """Pages through the summary of a pending sale (no database access)."""
+    try:
+        _, _, user_id, page = callback.data.split("_")
+        user_id, page = int(user_id), int(page)
+    except ValueError:
+        await callback.answer("Dados inválidos.", show_alert=True)
+        return
+
+    if callback.from_user.id != user_id:
+        await callback.answer("Esta venda não é sua.", show_alert=True)
+        return
+    if user_id not in pending_sales:
+        await callback.answer("Nenhuma venda pendente encontrada.", show_alert=True)
+        return
+
+    await catalog_cache.ensure_loaded()
+    pending = pending_sales[user_id]
+    text, markup = build_sale_summary(user_id, pending["cards"], page, pending["description"])
+    await callback.message.edit_text(text, reply_markup=markup, parse_mode=ParseMode.MARKDOWN)
+    await callback.answer()
+
 @router.callback_query(lambda call: call.data.startswith("confirm_sell_"))
 async def confirm_sell(callback: types.CallbackQuery):
     """Handle the confirmation of the card sale."""
@@ -157,70 +279,68 @@ async def confirm_sell(callback: types.CallbackQuery):
         await callback.answer("Dados inválidos.", show_alert=True)
         return
 
+    if callback.from_user.id != user_id:
+        await callback.answer("Esta venda não é sua.", show_alert=True)
+        return
+
     if user_id not in pending_sales:
         logging.info("[DEBUG] No pending sales for user")
         await callback.answer("Nenhuma venda pendente encontrada.", show_alert=True)
         return
 
-    cards_to_sell = pending_sales.pop(user_id)
-    logging.info(f"[DEBUG] Confirming sale for user {user_id}, cards: {cards_to_sell}")
+    # The summary is kept if the sale fails, so the confirmation can be
+    # retried from the same message
+    pending = pending_sales[user_id]
+    sold = pending["cards"]
+    logging.info(f"[DEBUG] Confirming sale for user {user_id}, {len(sold)} cards")
 
+    committed = False
     try:
+        await catalog_cache.ensure_loaded()
+        total_value = 0
+        stock = {}
+        for card_id, qty in sold.items():
+            card = catalog_cache.get_card(card_id)
+            if not card:
+                # Reloaded on the next access, so retrying can find it
+                catalog_cache.invalidate()
+                await callback.answer(f"❌ Card {card_id} não encontrado. Tente novamente.", show_alert=True)
+                return
+            price = house_price(card.rarity)
+            total_value += price * qty
+            stock[(card_id, price)] = stock.get((card_id, price), 0) + qty
+
         async with get_session() as session:
             logging.info("[DEBUG] Database session opened for confirm_sell")
-            # Fetch user
-            user = (await session.execute(
-                select(User).where(User.id == user_id)
-            )).scalar_one_or_none()
-
-            if not user:
-                logging.info("[DEBUG] User not found in database")
-                await callback.answer("Usuário não encontrado.", show_alert=True)
+            # User row locked before the inventory, like trades, donations and the order book
+            await lock_users(session, [user_id])
+            # Claim the sale: a second tap that waited for the lock finds it gone
+            if pending_sales.get(user_id) is not pending:
+                await session.rollback()
+                await callback.answer("Nenhuma venda pendente encontrada.", show_alert=True)
+                return
+            pending_sales.pop(user_id)
+
+            # Debit the inventory (and the user's collection counters), all or nothing
+            removed = await remove_cards(session, user_id, sold)
+            if len(removed.quantities) != len(sold):
+                await session.rollback()
+                pending_sales.setdefault(user_id, pending)
+                await callback.answer("❌ Quantidade insuficiente para venda.", show_alert=True)
                 return
 
-            # Load inventory
-            logging.info("[DEBUG] Querying user inventory for confirm_sell")
-            inv_result = await session.execute(
-                select(Inventory).options(joinedload(Inventory.card))
-                .where(Inventory.user_id == user_id)
-            )
-            inv_list = inv_result.scalars().all()
-            inv_dict = {i.card_id: i for i in inv_list}
-
-            total_value = 0
-            rarity_value = {"🥇": 1000, "🥈": 500, "🥉": 250}
-
-            # Process the sale
-            for (card_id, qty) in cards_to_sell:
-                if card_id not in inv_dict or inv_dict[card_id].quantity < qty:
-                    logging.info(f"[DEBUG] Insufficient quantity for card {card_id}")
-                    await callback.answer("❌ Quantidade insuficiente para venda.", show_alert=True)
-                    return
-
-                card = inv_dict[card_id].card
-                card_val = rarity_value.get(card.rarity, 0) * qty
-                total_value += card_val
-
-                # Update inventory
-                inv_dict[card_id].quantity -= qty
-                if inv_dict[card_id].quantity <= 0:
-                    await session.delete(inv_dict[card_id])
-
-                # Add to marketplace
-                new_listing = Marketplace(
-                    seller_id=user_id,
-                    card_id=card_id,
-                    price=rarity_value.get(card.rarity, 0)
-                )
-                session.add(new_listing)
-
-            # Update user's coins
-            user.coins += total_value
+            # Credit the coins and add the sold units to the Pokémart stock
+            await credit_coins(session, {user_id: total_value})
+            await add_stock(session, stock)
             await session.commit()
+            committed = True
+
+        storefront_cache.apply(stock)
 
         logging.info(f"[DEBUG] Sale confirmed, user {user_id} earned {total_value} pokecoins")
         await callback.message.edit_text(
-            f"✅ **Venda concluída!** Você recebeu `{total_value}` pokecoins.\n"
+            f"✅ **Venda concluída!** Você vendeu `{sum(sold.values())}` cards e recebeu "
+            f"`{total_value}` pokecoins.\n"
             "Os cards agora estão disponíveis no Pokémart.",
             parse_mode=ParseMode.MARKDOWN
         )
@@ -228,6 +348,9 @@ async def confirm_sell(callback: types.CallbackQuery):
 
     except Exception as e:
         logging.error(f"[ERROR] Unhandled exception in confirm_sell: {e}", exc_info=True)
+        # Keep the summary if the sale didn't go through (it may have been claimed above)
+        if not committed:
+            pending_sales.setdefault(user_id, pending)
         await callback.answer(f"Erro inesperado => {e}", show_alert=True)
 
 @router.callback_query(lambda call: call.data == "cancel_sell")
@@ -240,4 +363,4 @@ async def cancel_sell(callback: types.CallbackQuery):
         logging.info(f"[DEBUG] Pending sale canceled for user {user_id}")
 
     await callback.message.edit_text("❌ Venda cancelada.", parse_mode=ParseMode.MARKDOWN)
-    await callback.answer("Venda cancelada.", show_alert=True)
\ No newline at end of file
+    await callback.answer("Venda cancelada.", show_alert=True)
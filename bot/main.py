@@ -29,6 +29,9 @@ from commands.roubar import router as roubar_router
 from commands.pokedex import router as pokedex_router
 from commands.favpoke import router as favpoke_router
 from commands.ginasio import router as ginasio_router
+from commands.ranking import router as ranking_router
+from commands.mercado import router as mercado_router
+from commands.leilao import router as leilao_router
 from admin_commands.fileid import router as fileid_router
 
 from admin_commands.addcarta import router as addcarta_router, scheduled_cleanup
@@ -37,15 +40,20 @@ from admin_commands.rcoins import router as rcoins_router
 from admin_commands.imgpd import router as imgpd_router
 from admin_commands.checkduplicates import router as checkduplicates_router
 from admin_commands.modcard import router as modcard_router
+from admin_commands.droptable import router as droptable_router
+from admin_commands.recontar import router as recontar_router
 
 # Import the database 
 from database.models import Base
 from database.session import engine
+from database.migrations import run_migrations
+from database.catalog_cache import catalog_cache
 
 # Middleware imports
 from middlewares.logging_middleware import LoggingMiddleware
 from middlewares.anti_flood_middleware import AntiFloodMiddleware
 from middlewares.registration_middleware import RegistrationMiddleware
+from middlewares.username_sync_middleware import UsernameSyncMiddleware
 
 #------------------------------------------------------
 # Teporary function to recreate the database schema
@@ -57,9 +65,14 @@ async def create_db():
     try:
         async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+        # Aplicar alterações de esquema em tabelas que já existiam
+        await run_migrations(engine)
         print("Database schema created successfully!")
     except Exception as e:
-        print(f"Failed to create database schema: {e}")
+        # Sem o esquema completo (ex.: o índice único do inventário usado pelos
+        # UPSERTs) capturas, trocas e compras falhariam: não inicia o bot
+        logging.critical(f"Failed to create database schema: {e}", exc_info=True)
+        raise
 
 # Load environment variables
 load_dotenv()
@@ -97,12 +110,15 @@ dp.include_router(mochila_router)
 dp.include_router(pokebola_router)
 dp.include_router(pokebanco_router)
 dp.include_router(ginasio_router)
+dp.include_router(ranking_router)
 dp.include_router(checkduplicates_router)
 dp.include_router(fileid_router)
 dp.include_router(capturar_router)
 dp.include_router(addcarta_router)
 dp.include_router(favpoke_router)
 dp.include_router(imgpd_router)
+dp.include_router(droptable_router)
+dp.include_router(recontar_router)
 dp.include_router(admin_router)
 dp.include_router(rclicar_router)
 dp.include_router(rcoins_router)
@@ -110,6 +126,8 @@ dp.include_router(comprarbolas_router)
 dp.include_router(doarcards_router)
 dp.include_router(doarbolas_router)
 dp.include_router(doarcoins_router)
+dp.include_router(mercado_router)
+dp.include_router(leilao_router)
 dp.include_router(venderc_router) #Before pokemart. If it work I'm a happy man.
 dp.include_router(roubar_router)
 dp.include_router(pokemart_router)
@@ -117,6 +135,9 @@ dp.include_router(pokemart_router)
 
 
 # Register the middleware
+# Mantém users.username atualizado a partir de qualquer update (escrita em lote)
+username_sync = UsernameSyncMiddleware(flush_interval=5)
+dp.update.outer_middleware(username_sync)
 dp.message.middleware(AntiFloodMiddleware(limit=5, interval=10))
 #Below is used to restrict all commands to authorized users
 dp.message.middleware(RegistrationMiddleware())
@@ -147,9 +168,13 @@ async def set_bot_commands(bot: Bot):
         BotCommand(command="doarbolas", description="Doar pokebolas para outro treinador"),
         BotCommand(command="doarcoins", description="Doar pokecoins para outro treinador"),
         BotCommand(command="venderc", description="Vender cards para o Pokemart"),
+        BotCommand(command="mercado", description="Comprar e vender cards entre treinadores"),
+        BotCommand(command="leilao", description="Leiloar um card raro ou ver os leilões"),
+        BotCommand(command="lance", description="Dar um lance em um leilão"),
         BotCommand(command="roubar", description="Trocar cartas com outro treinador"),
         BotCommand(command="favpoke", description="Definir seu card favorito"),
         BotCommand(command="ginasio", description="Ver o ranking do ginásio"),
+        BotCommand(command="ranking", description="Ver o ranking de colecionadores"),
     ]
     await bot.set_my_commands(commands)
 
@@ -157,6 +182,8 @@ async def set_bot_commands(bot: Bot):
     admin_commands = [
         BotCommand(command="addcarta", description="(Admin) Adicionar uma nova carta"),
         BotCommand(command="imgpd", description="(Admin) Adicionar imagem a um grupo"),
+        BotCommand(command="droptable", description="(Admin) Configurar chances de captura"),
+        BotCommand(command="recontar", description="(Admin) Recalcular contadores de coleção"),
         BotCommand(command="rclicar", description="(Admin) Distribuir pokebolas"),
         BotCommand(command="rcoins", description="(Admin) Distribuir pokecoins"),
         BotCommand(command="fileid", description="(Admin) Obter file_id de uma imagem"),
@@ -174,9 +201,13 @@ async def set_bot_commands(bot: Bot):
         BotCommand(command="doarbolas", description="Doar pokebolas para outro treinador"),
         BotCommand(command="doarcoins", description="Doar pokecoins para outro treinador"),
         BotCommand(command="venderc", description="Vender cards para o Pokemart"),
+        BotCommand(command="mercado", description="Comprar e vender cards entre treinadores"),
+        BotCommand(command="leilao", description="Leiloar um card raro ou ver os leilões"),
+        BotCommand(command="lance", description="Dar um lance em um leilão"),
         BotCommand(command="roubar", description="Trocar cartas com outro treinador"),
         BotCommand(command="favpoke", description="Definir seu card favorito"),
         BotCommand(command="ginasio", description="Ver o ranking do ginásio"),
+        BotCommand(command="ranking", description="Ver o ranking de colecionadores"),
     ]
 
     # Fetch the list of admin users from the database.
@@ -197,14 +228,35 @@ from admin_commands.addcarta import scheduled_cleanup as addcarta_cleanup
 from admin_commands.rcoins import cleanup_pending_transactions as rcoins_cleanup
 from admin_commands.rclicar import cleanup_pending_transactions as rclicar_cleanup
 from commands.doarcoins import cleanup_pending_transactions as doarcoins_cleanup
+from commands.capturar import expire_captures
+from commands.roubar import expire_trades
+from utils.capture_sessions import capture_sessions
+from utils.image_utils import scheduled_image_normalization
+from database.rankings import scheduled_ranking_refresh
+from commands.leilao import scheduled_auction_closing
 
 # Run the bot
 async def main():
     # Comment this if you want to reset the database schema
     await create_db()
+
+    # Carregar o catálogo em memória usado pelo /capturar
+    await catalog_cache.load()
     
     # Iniciar os schedulers para limpeza periódica de transações pendentes
     asyncio.create_task(addcarta_cleanup())
+
+    # Normalizar em segundo plano as imagens de cards ainda não verificadas
+    asyncio.create_task(scheduled_image_normalization(bot))
+
+    # Atualizar periodicamente os rankings por categoria do /ranking
+    asyncio.create_task(scheduled_ranking_refresh())
+
+    # Gravar em lote os usernames alterados observados pelo middleware
+    asyncio.create_task(username_sync.run())
+
+    # Encerrar e liquidar os leilões vencidos do /leilao
+    asyncio.create_task(scheduled_auction_closing(bot))
     
     # Criar função genérica para executar todas as limpezas
     async def run_all_cleanups():
@@ -214,6 +266,13 @@ async def main():
                 rcoins_cleanup()
                 rclicar_cleanup()
                 doarcoins_cleanup()
+
+                # Expirar sessões de captura abandonadas e registrar os contadores
+                if expire_captures():
+                    logging.info(f"Sessões de captura: {capture_sessions.stats()}")
+
+                # Expirar propostas de troca vencidas do /roubar
+                await expire_trades(bot)
             except Exception as e:
                 logging.error(f"Erro durante limpeza programada: {str(e)}")
             
@@ -0,0 +1,108 @@
+import heapq
+import itertools
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+# Tempo máximo (em segundos) que um usuário pode ficar no estado de captura
+CAPTURE_TIMEOUT = 180  # 3 minutos
+
+
+@dataclass
+class CaptureSession:
+    """Estado de uma captura em andamento (do /cap até a escolha do grupo)."""
+    user_id: int
+    amount: int
+    started_at: float
+    expires_at: float
+    category_id: Optional[int] = None
+    offered_group_ids: Tuple[int, ...] = ()
+
+
+class CaptureSessionRegistry:
+    """
+    Registro das capturas em andamento, com expiração por min-heap.
+
+    Cada sessão entra no heap ordenada pelo horário de expiração (O(log n)).
+    A expiração é preguiçosa: `expire_due` só remove o topo do heap enquanto
+    ele estiver vencido, e `get` descarta na hora uma sessão vencida. Entradas
+    de sessões já finalizadas ficam no heap até vencerem e são ignoradas.
+    """
+
+    def __init__(self, timeout: float = CAPTURE_TIMEOUT):
+        self.timeout = timeout
+        self._sessions: Dict[int, CaptureSession] = {}
+        self._heap: List[Tuple[float, int, CaptureSession]] = []
+        self._counter = itertools.count()
+        self.started_total = 0
+        self.completed_total = 0
+        self.expired_total = 0
+
+    def start(self, user_id: int, amount: int = 1, now: Optional[float] = None) -> Optional[CaptureSession]:
+        """Abre uma sessão para o usuário; retorna None se já houver uma ativa."""
+        now = time.time() if now is None else now
+        if self.get(user_id, now) is not None:
+            return None
+
+        session = CaptureSession(
+            user_id=user_id,
+            amount=amount,
+            started_at=now,
+            expires_at=now + self.timeout,
+        )
+        self._sessions[user_id] = session
+        heapq.heappush(self._heap, (session.expires_at, next(self._counter), session))
+        self.started_total += 1
+        return session
+
+    def get(self, user_id: int, now: Optional[float] = None) -> Optional[CaptureSession]:
+        """Retorna a sessão ativa do usuário, ou None se não existir ou tiver vencido."""
+        session = self._sessions.get(user_id)
+        if session is None:
+            return None
+        now = time.time() if now is None else now
+        if session.expires_at <= now:
+            del self._sessions[user_id]
+            self.expired_total += 1
+            return None
+        return session
+
+    def finish(self, user_id: int) -> Optional[CaptureSession]:
+        """Encerra a sessão do usuário (captura concluída)."""
+        session = self._sessions.pop(user_id, None)
+        if session is not None:
+            self.completed_total += 1
+        return session
+
+    def expire_due(self, now: Optional[float] = None) -> int:
+        """Remove as sessões vencidas do topo do heap; retorna quantas expiraram."""
+        now = time.time() if now is None else now
+        expired = 0
+        while self._heap and self._heap[0][0] <= now:
+            _, _, session = heapq.heappop(self._heap)
+            if self._sessions.get(session.user_id) is session:
+                del self._sessions[session.user_id]
+                expired += 1
+        self.expired_total += expired
+        return expired
+
+    def clear(self) -> None:
+        self._sessions.clear()
+        self._heap.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores para monitoramento."""
+        return {
+            "live": len(self._sessions),
+            "heap_size": len(self._heap),
+            "started": self.started_total,
+            "completed": self.completed_total,
+            "expired": self.expired_total,
+        }
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+# Instância única usada pelo /capturar
+capture_sessions = CaptureSessionRegistry()
@@ -1,4 +1,5 @@
 from PIL import Image
+import asyncio
 import io
 import logging
 import tempfile
@@ -20,7 +21,7 @@ async def ensure_photo_file_id(
     user_id: int,
     force_aspect_ratio: bool = True,
     mode: str = "lookup"
-) -> str:
+) -> Tuple[Optional[str], bool]:
     """
     Garante que um documento ou file_id seja convertido para photo com proporção 3:4.
     
@@ -33,7 +34,9 @@ async def ensure_photo_file_id(
               "lookup" quando é apenas o file_id existente no banco sem mensagem associada
         
     Returns:
-        str: File ID da foto processada com proporção correta
+        Tuple[Optional[str], bool]: (file_id, verificado). `verificado` só é True
+        quando o resultado é uma foto cuja proporção foi conferida ou corrigida;
+        em caso de falha, volta o file_id original (ou None) com False.
     """
     try:
         file_id = None
@@ -48,7 +51,7 @@ async def ensure_photo_file_id(
                 is_already_photo = 'photos' in file_info.file_path
             except Exception as e:
                 logger.error(f"Erro ao obter informações do arquivo: {str(e)}")
-                return file_id
+                return file_id, False
         
         elif isinstance(content, PhotoSize):
             file_id = content.file_id
@@ -60,11 +63,11 @@ async def ensure_photo_file_id(
             
         else:
             logger.error(f"Tipo de conteúdo não suportado: {type(content)}")
-            return None
+            return None, False
         
         # Se já é uma foto e não precisamos forçar proporção, apenas retornamos
         if is_already_photo and not force_aspect_ratio:
-            return file_id
+            return file_id, True
         
         # Se já é uma foto e proporção já está correta, retornamos o original
         if is_already_photo:
@@ -80,11 +83,11 @@ async def ensure_photo_file_id(
                 
                 # Se a proporção já está próxima de 3:4, não precisamos ajustar
                 if abs(current_ratio - target_ratio) <= 0.1:
-                    return file_id
+                    return file_id, True
             except Exception as e:
                 logger.warning(f"Erro ao verificar proporção de imagem: {str(e)}")
-                # Em caso de erro, retornamos o file_id original
-                return file_id
+                # Em caso de erro, retornamos o file_id original, sem verificação
+                return file_id, False
         
         # Baixar o arquivo
         file = await bot.get_file(file_id)
@@ -154,8 +157,10 @@ async def ensure_photo_file_id(
                 except Exception as e:
                     logger.warning(f"Não foi possível remover mensagem temporária: {str(e)}")
             
-            # Retornar novo file_id ou o original em caso de falha
-            return new_file_id or file_id
+            # Retornar novo file_id ou o original (não verificado) em caso de falha
+            if new_file_id:
+                return new_file_id, True
+            return file_id, False
             
         finally:
             # Limpar arquivo temporário
@@ -166,7 +171,7 @@ async def ensure_photo_file_id(
     
     except Exception as e:
         logger.error(f"Erro ao processar imagem: {str(e)}", exc_info=True)
-        return file_id if file_id else None
+        return (file_id if file_id else None), False
 
 
 async def is_document_image(document: Document) -> bool:
@@ -197,7 +202,8 @@ async def is_document_image(document: Document) -> bool:
 
 async def update_card_image_in_db(bot: Bot, card_id: int, user_id: int) -> Tuple[bool, Optional[str]]:
     """
-    Atualiza a imagem de um card no banco de dados, convertendo de document para photo se necessário.
+    Normaliza a imagem de um card no banco de dados, convertendo de document para photo
+    com proporção 3:4 se necessário, e registra o resultado em `image_kind`/`image_normalized`.
     
     Args:
         bot: Instância do bot
@@ -222,37 +228,114 @@ async def update_card_image_in_db(bot: Bot, card_id: int, user_id: int) -> Tuple
             
             original_file_id = card.image_file_id
             
-            # Verificar se precisa converter (se é documento ou proporção incorreta)
+            # Verificar se o arquivo é uma foto ou um documento
             try:
                 file_info = await bot.get_file(original_file_id)
-                is_photo = 'photos' in file_info.file_path
-                
-                if is_photo:
-                    # Se já é foto, não precisamos converter
-                    logger.info(f"Card ID {card_id} já possui uma imagem em formato photo")
-                    return True, None
+                is_photo = (file_info.file_path or "").startswith("photos/")
             except Exception as e:
                 logger.error(f"Erro ao verificar arquivo do card {card_id}: {str(e)}")
+                # Pode ser uma falha temporária: o card continua pendente e a rotina tenta de novo
                 return False, f"Erro ao verificar arquivo: {str(e)}"
             
-            # Converter para photo
-            new_file_id = await ensure_photo_file_id(
+            # Converter para photo e/ou corrigir a proporção
+            new_file_id, verified = await ensure_photo_file_id(
                 bot=bot,
                 content=original_file_id,
                 user_id=user_id,
                 force_aspect_ratio=True
             )
             
-            if not new_file_id or new_file_id == original_file_id:
+            if not verified and is_photo:
+                # Proporção não conferida (ex.: falha temporária no download): a foto
+                # continua pendente para a próxima execução
+                return False, "Não foi possível verificar a imagem"
+
+            if not verified:
+                # Documento (confirmado pelo file_path) que não pôde ser convertido:
+                # continua sendo enviado como documento
+                card.image_kind = "document"
+                await session.commit()
                 return False, "Não foi possível converter a imagem"
             
             # Atualizar no banco
             card.image_file_id = new_file_id
+            card.image_kind = "photo"
+            card.image_normalized = 1
             await session.commit()
             
-            logger.info(f"Imagem do card ID {card_id} atualizada com sucesso")
+            logger.info(f"Imagem do card ID {card_id} normalizada com sucesso")
             return True, None
             
     except Exception as e:
         logger.error(f"Erro ao atualizar imagem do card {card_id}: {str(e)}", exc_info=True)
         return False, f"Erro interno: {str(e)}"
+
+
+# Último card verificado pela rotina de normalização
+_normalization_cursor = 0
+
+
+async def normalize_pending_card_images(bot: Bot, batch_size: int = 20) -> int:
+    """
+    Normaliza um lote de cards cuja imagem ainda não foi verificada.
+    
+    Args:
+        bot: Instância do bot
+        batch_size: Quantidade máxima de cards processados nesta execução
+        
+    Returns:
+        int: Quantidade de cards processados
+    """
+    from sqlalchemy.future import select
+    from database.models import Card
+    from database.session import get_session
+    from sqlalchemy import func
+    from database.catalog_cache import catalog_cache
+    
+    global _normalization_cursor
+    async with get_session() as session:
+        result = await session.execute(
+            select(Card.id)
+            .where(Card.image_kind.is_(None), Card.id > _normalization_cursor)
+            .order_by(Card.id)
+            .limit(batch_size)
+        )
+        card_ids = result.scalars().all()
+    
+    # Cards que falharam continuam pendentes; o cursor evita que eles bloqueiem
+    # os seguintes, e volta ao início quando a fila chega ao fim
+    _normalization_cursor = card_ids[-1] if len(card_ids) == batch_size else 0
+    
+    for card_id in card_ids:
+        await update_card_image_in_db(bot, card_id, ADMIN_CHAT_ID)
+    
+    if not card_ids:
+        return 0
+    
+    # Cards registrados nesta execução (como foto ou como documento); os que
+    # falharam continuam pendentes e não mudaram no banco
+    async with get_session() as session:
+        updated = await session.scalar(
+            select(func.count())
+            .select_from(Card)
+            .where(Card.id.in_(card_ids), Card.image_kind.is_not(None))
+        )
+    
+    if updated:
+        # Os file_ids mudaram; o catálogo em memória precisa ser recarregado
+        catalog_cache.invalidate()
+    logger.info(f"Normalização de imagens: {len(card_ids)} cards processados, {updated} atualizados")
+    
+    return len(card_ids)
+
+
+async def scheduled_image_normalization(bot: Bot):
+    """Normaliza periodicamente, em segundo plano, as imagens de cards ainda não verificadas"""
+    while True:
+        try:
+            await normalize_pending_card_images(bot)
+        except Exception as e:
+            logger.error(f"Erro durante normalização programada de imagens: {str(e)}")
+        
+        # Esperar 5 minutos antes do próximo lote
+        await asyncio.sleep(300)
@@ -0,0 +1,48 @@
+from bisect import bisect_right
+from typing import Optional
+
+# Títulos por quantidade de cards na mochila (ver Context.md).
+# Cada título vale a partir do limite indicado, até o próximo.
+TITLE_TIERS = [
+    (0, "Novato"),
+    (1_000, "Colecionador Casual"),
+    (3_000, "Colecionador Hardcore"),
+    (7_000, "Treinador Experiente"),
+    (13_000, "Líder de Ginásio"),
+    (21_000, "Elite Four"),
+    (35_000, "Campeão Pokémon"),
+    (41_000, "Professor Pokémon"),
+    (50_000, "Treinador Profissional"),
+    (70_000, "Completista"),
+]
+
+_THRESHOLDS = [threshold for threshold, _ in TITLE_TIERS]
+
+
+def get_title(cards_total: int) -> str:
+    """Retorna o título correspondente ao total de cards do usuário."""
+    index = bisect_right(_THRESHOLDS, max(cards_total or 0, 0)) - 1
+    return TITLE_TIERS[index][1]
+
+
+def title_change(total_before: Optional[int], total_after: Optional[int]) -> Optional[str]:
+    """
+    Compara os totais antes/depois de uma alteração de inventário.
+    Retorna o novo título se a alteração cruzou um limite, ou None.
+    """
+    if total_before is None or total_after is None:
+        return None
+    new_title = get_title(total_after)
+    if new_title == get_title(total_before):
+        return None
+    return new_title
+
+
+def title_change_message(nickname: str, total_before: Optional[int], total_after: Optional[int]) -> str:
+    """Texto do aviso de mudança de título, ou string vazia se não mudou."""
+    new_title = title_change(total_before, total_after)
+    if not new_title:
+        return ""
+    if total_after > total_before:
+        return f"🏅 @{nickname} alcançou o título **{new_title}**!"
+    return f"🏅 @{nickname} agora tem o título **{new_title}**."
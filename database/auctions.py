@@ -0,0 +1,194 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.crud_user import credit_coins, lock_users, spend_coins
+from database.inventory import add_cards, remove_cards
+from database.models import Auction
+
+logger = logging.getLogger(__name__)
+
+AUCTION_OPEN = "open"
+AUCTION_CLOSED = "closed"
+
+# Raridades que podem ser leiloadas
+AUCTION_RARITIES = ("🥇", "💎")
+
+MIN_AUCTION_DURATION = timedelta(minutes=5)
+MAX_AUCTION_DURATION = timedelta(hours=48)
+
+# Intervalo (em segundos) entre varreduras de leilões vencidos
+AUCTION_SWEEP_INTERVAL = 30
+
+# Leilões encerrados por transação na varredura
+AUCTION_CLOSE_BATCH_SIZE = 100
+
+
+class BidResult(NamedTuple):
+    auction_id: int
+    amount: int
+    ends_at: datetime
+    previous_bidder_id: Optional[int]   # Licitante superado (já reembolsado), se houver
+    previous_bid: Optional[int]
+
+
+class ClosedAuction(NamedTuple):
+    id: int
+    seller_id: int
+    card_id: int
+    winning_bid: Optional[int]
+    winner_id: Optional[int]
+    chat_id: int
+
+
+# Encerra de uma vez um lote de leilões vencidos, pelo índice parcial
+# ix_auctions_open_ends_at. SKIP LOCKED deixa para a próxima varredura os
+# leilões que estão recebendo um lance neste momento.
+_CLOSE_DUE_SQL = text(
+    """
+    WITH due AS (
+        SELECT id FROM auctions
+        WHERE status = 'open' AND ends_at <= :now
+        ORDER BY ends_at
+        LIMIT :limit
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE auctions AS a SET status = 'closed'
+    FROM due
+    WHERE a.id = due.id
+    RETURNING a.id, a.seller_id, a.card_id, a.current_bid, a.bidder_id, a.chat_id
+    """
+)
+
+
+def min_next_bid(start_price: int, current_bid: Optional[int]) -> int:
+    """Menor lance aceito: o preço inicial, ou 5% (no mínimo 1) acima do maior lance."""
+    if current_bid is None:
+        return start_price
+    return current_bid + max(1, current_bid // 20)
+
+
+async def create_auction(
+    session: AsyncSession,
+    seller_id: int,
+    card_id: int,
+    start_price: int,
+    duration: timedelta,
+    chat_id: int
+) -> Optional[Auction]:
+    """
+    Abre um leilão de uma unidade do card, que sai do inventário do vendedor
+    e fica em garantia até o encerramento. Não faz commit.
+
+    Returns:
+        Optional[Auction]: Leilão criado, ou None se o vendedor não tiver o card
+    """
+    # Usuário travado antes do inventário, como nas demais operações
+    await lock_users(session, {seller_id})
+    removed = await remove_cards(session, seller_id, {card_id: 1})
+    if card_id not in removed.quantities:
+        return None
+
+    now = datetime.utcnow()
+    auction = Auction(
+        seller_id=seller_id,
+        card_id=card_id,
+        start_price=start_price,
+        chat_id=chat_id,
+        status=AUCTION_OPEN,
+        created_at=now,
+        ends_at=now + duration,
+    )
+    session.add(auction)
+    await session.flush()
+    return auction
+
+
+async def place_bid(session: AsyncSession, auction_id: int, bidder_id: int, amount: int) -> BidResult:
+    """
+    Registra um lance. O leilão é travado (FOR UPDATE) durante a validação,
+    as pokecoins do novo lance ficam reservadas e o licitante superado é
+    reembolsado na mesma transação. Não faz commit.
+
+    Raises:
+        ValueError: Com a mensagem para o usuário, se o lance não for aceito;
+        a transação deve ser desfeita.
+    """
+    auction = (await session.execute(
+        select(Auction).where(Auction.id == auction_id).with_for_update()
+    )).scalar_one_or_none()
+    if auction is None or auction.status != AUCTION_OPEN or auction.ends_at <= datetime.utcnow():
+        raise ValueError(f"Leilão #{auction_id} não encontrado ou já encerrado.")
+    if auction.seller_id == bidder_id:
+        raise ValueError("Você não pode dar lances no seu próprio leilão.")
+    minimum = min_next_bid(auction.start_price, auction.current_bid)
+    if amount < minimum:
+        raise ValueError(f"O lance mínimo neste leilão é de {minimum} pokecoins.")
+
+    previous_bidder_id, previous_bid = auction.bidder_id, auction.current_bid
+    # Usuários travados em ordem de ID antes de mover pokecoins: lances cruzados
+    # em dois leilões não entram em deadlock
+    await lock_users(session, {bidder_id} | ({previous_bidder_id} - {None}))
+    # Reembolsa antes de reservar: quem cobre o próprio lance só precisa da diferença
+    if previous_bidder_id is not None:
+        await credit_coins(session, {previous_bidder_id: previous_bid})
+    if await spend_coins(session, bidder_id, amount) is None:
+        raise ValueError(f"Você não tem {amount} pokecoins para este lance.")
+
+    auction.current_bid = amount
+    auction.bidder_id = bidder_id
+    await session.flush()
+    return BidResult(auction.id, amount, auction.ends_at, previous_bidder_id, previous_bid)
+
+
+async def close_due_auctions(
+    session: AsyncSession,
+    now: Optional[datetime] = None,
+    limit: int = AUCTION_CLOSE_BATCH_SIZE
+) -> List[ClosedAuction]:
+    """
+    Encerra um lote de leilões vencidos e faz a liquidação de todos na mesma
+    transação: o card vai para o vencedor (ou volta para o vendedor, se não
+    houve lances) e o lance vencedor, já reservado, vai para o vendedor.
+    Não faz commit.
+
+    Returns:
+        List[ClosedAuction]: Leilões encerrados agora (menos que `limit` quando não há mais vencidos)
+    """
+    now = now or datetime.utcnow()
+    rows = (await session.execute(_CLOSE_DUE_SQL, {"now": now, "limit": limit})).all()
+    closed = [ClosedAuction(*row) for row in rows]
+
+    if not closed:
+        return closed
+
+    deliveries: Dict[int, Dict[int, int]] = {}
+    payments: Dict[int, int] = {}
+    for auction in closed:
+        receiver = auction.winner_id if auction.winner_id is not None else auction.seller_id
+        cards = deliveries.setdefault(receiver, {})
+        cards[auction.card_id] = cards.get(auction.card_id, 0) + 1
+        if auction.winner_id is not None:
+            payments[auction.seller_id] = payments.get(auction.seller_id, 0) + auction.winning_bid
+
+    # Todos os usuários do lote travados em ordem de ID antes das entregas e pagamentos
+    await lock_users(session, set(deliveries) | set(payments))
+    for user_id in sorted(deliveries):
+        await add_cards(session, user_id, deliveries[user_id])
+    await credit_coins(session, dict(sorted(payments.items())))
+    return closed
+
+
+async def get_open_auctions(session: AsyncSession, limit: int = 10) -> List[Auction]:
+    """Leilões abertos, dos que terminam primeiro para os últimos."""
+    result = await session.execute(
+        select(Auction)
+        # Condição literal para casar com o predicado do índice parcial
+        .where(text("status = 'open'"), Auction.ends_at > datetime.utcnow())
+        .order_by(Auction.ends_at)
+        .limit(limit)
+    )
+    return list(result.scalars().all())
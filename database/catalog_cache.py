@@ -0,0 +1,163 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from database.models import Category, Group, Card, DropTable
+from database.drop_tables import (
+    AliasSampler,
+    DEFAULT_DROP_WEIGHTS,
+    build_rarity_sampler,
+    resolve_drop_rows,
+)
+from database.name_search import NameSearchIndex, SearchMatch
+from database.session import get_session
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogCache:
+    """
+    Cache em memória do catálogo (categorias → grupos → cards por raridade)
+    e das tabelas de drop, compiladas em amostradores de raridade por grupo.
+
+    O catálogo só muda quando um administrador adiciona cards ou altera grupos,
+    então ele é carregado uma vez na inicialização e recarregado sob demanda
+    depois de uma invalidação. Os objetos guardados são instâncias ORM
+    desanexadas da sessão: apenas as colunas podem ser lidas, nunca os
+    relacionamentos.
+    """
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self._loaded = False
+        # Incrementada a cada invalidação; uma carga só vale se não mudou durante a leitura
+        self._generation = 0
+        self.categories: List[Category] = []
+        self.categories_by_id: Dict[int, Category] = {}
+        self.groups_by_id: Dict[int, Group] = {}
+        self.groups_by_category: Dict[int, List[Group]] = {}
+        self.cards_by_id: Dict[int, Card] = {}
+        self.cards_by_group: Dict[int, List[Card]] = {}
+        self.cards_by_group_rarity: Dict[int, Dict[str, List[Card]]] = {}
+        self.drop_rows: List[DropTable] = []
+        # Índices de busca por nome (trigramas), refeitos a cada carga
+        self.card_search = NameSearchIndex([])
+        self.group_search = NameSearchIndex([])
+        self.category_search = NameSearchIndex([])
+        # (group_id, ids das linhas de drop em vigor) -> amostrador de raridade
+        self._samplers: Dict[Tuple[int, Tuple[int, ...]], Optional[AliasSampler]] = {}
+
+    async def load(self) -> None:
+        """Carrega o catálogo completo do banco e substitui o conteúdo atual."""
+        generation = self._generation
+        async with get_session() as session:
+            categories = (await session.execute(
+                select(Category).order_by(Category.name)
+            )).scalars().all()
+            groups = (await session.execute(select(Group).order_by(Group.id))).scalars().all()
+            cards = (await session.execute(select(Card).order_by(Card.id))).scalars().all()
+            drop_rows = (await session.execute(select(DropTable).order_by(DropTable.id))).scalars().all()
+
+        groups_by_category: Dict[int, List[Group]] = {}
+        for group in groups:
+            groups_by_category.setdefault(group.category_id, []).append(group)
+
+        cards_by_group: Dict[int, List[Card]] = {}
+        cards_by_group_rarity: Dict[int, Dict[str, List[Card]]] = {}
+        for card in cards:
+            cards_by_group.setdefault(card.group_id, []).append(card)
+            cards_by_group_rarity.setdefault(card.group_id, {}).setdefault(card.rarity, []).append(card)
+
+        # Troca todas as estruturas de uma vez para que leitores nunca vejam um estado parcial
+        self.categories = list(categories)
+        self.categories_by_id = {c.id: c for c in categories}
+        self.groups_by_id = {g.id: g for g in groups}
+        self.groups_by_category = groups_by_category
+        self.cards_by_id = {c.id: c for c in cards}
+        self.cards_by_group = cards_by_group
+        self.cards_by_group_rarity = cards_by_group_rarity
+        self.drop_rows = list(drop_rows)
+        self.card_search = NameSearchIndex((c.id, c.name) for c in cards)
+        self.group_search = NameSearchIndex((g.id, g.name) for g in groups)
+        self.category_search = NameSearchIndex((c.id, c.name) for c in categories)
+        self._samplers = {}
+        # Uma invalidação durante a leitura pode não estar na foto: recarrega no próximo acesso
+        self._loaded = generation == self._generation
+
+        logger.info(
+            f"Catálogo carregado: {len(categories)} categorias, {len(groups)} grupos, {len(cards)} cards"
+        )
+
+    async def ensure_loaded(self) -> None:
+        """Recarrega o catálogo se ele ainda não foi carregado ou foi invalidado."""
+        if self._loaded:
+            return
+        async with self._lock:
+            if not self._loaded:
+                await self.load()
+
+    def invalidate(self) -> None:
+        """Marca o catálogo como desatualizado; o próximo acesso fará a recarga."""
+        self._generation += 1
+        self._loaded = False
+
+    def get_categories(self) -> List[Category]:
+        return self.categories
+
+    def get_category(self, category_id: int) -> Optional[Category]:
+        return self.categories_by_id.get(category_id)
+
+    def get_groups(self, category_id: int) -> List[Group]:
+        return self.groups_by_category.get(category_id, [])
+
+    def get_group(self, group_id: int) -> Optional[Group]:
+        return self.groups_by_id.get(group_id)
+
+    def get_card(self, card_id: int) -> Optional[Card]:
+        return self.cards_by_id.get(card_id)
+
+    def get_group_cards(self, group_id: int, rarity: Optional[str] = None) -> List[Card]:
+        if rarity is None:
+            return self.cards_by_group.get(group_id, [])
+        return self.cards_by_group_rarity.get(group_id, {}).get(rarity, [])
+
+    def search_cards(self, query: str, limit: int = 5) -> List[SearchMatch]:
+        return self.card_search.search(query, limit)
+
+    def search_groups(self, query: str, limit: int = 5) -> List[SearchMatch]:
+        return self.group_search.search(query, limit)
+
+    def search_categories(self, query: str, limit: int = 5) -> List[SearchMatch]:
+        return self.category_search.search(query, limit)
+
+    def get_group_sampler(self, group_id: int, now: Optional[datetime] = None) -> Optional[AliasSampler]:
+        """
+        Retorna o amostrador de raridade do grupo segundo a tabela de drop em
+        vigor (considerando eventos ativos). Os amostradores são compilados na
+        primeira vez que uma combinação grupo/tabela é usada e reaproveitados
+        até a próxima recarga do catálogo. Retorna None se o grupo não tiver cards.
+        """
+        group = self.groups_by_id.get(group_id)
+        if not group:
+            return None
+
+        rows = resolve_drop_rows(self.drop_rows, group.category_id, group_id, now)
+        key = (group_id, tuple(row.id for row in rows))
+        if key not in self._samplers:
+            if rows:
+                weights: Dict[str, int] = {}
+                for row in rows:
+                    weights[row.rarity] = weights.get(row.rarity, 0) + row.weight
+            else:
+                weights = DEFAULT_DROP_WEIGHTS
+            self._samplers[key] = build_rarity_sampler(
+                weights, list(self.cards_by_group_rarity.get(group_id, {}))
+            )
+        return self._samplers[key]
+
+
+# Instância única compartilhada por todo o processo
+catalog_cache = CatalogCache()
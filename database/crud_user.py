@@ -1,5 +1,6 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy import update, text
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import joinedload
 from .models import User
@@ -31,3 +32,65 @@ async def get_user_inventory(session, user_id):
         .options(joinedload(Inventory.card))  # Ensure relationships are loaded
     )
     return result.all()  # Returns a list of tuples (Inventory, Card)
+
+async def spend_pokeballs(session, user_id, amount=1):
+    """
+    Decrementa as pokébolas do usuário somente se ele tiver o suficiente.
+    Retorna o novo saldo, ou None se o usuário não existir ou não tiver pokébolas suficientes.
+    Não faz commit: deve ser chamada dentro da transação de quem a usa.
+    """
+    result = await session.execute(
+        update(User)
+        .where(User.id == user_id, User.pokeballs >= amount)
+        .values(pokeballs=User.pokeballs - amount)
+        .returning(User.pokeballs)
+    )
+    return result.scalar_one_or_none()
+
+async def spend_coins(session, user_id, amount):
+    """
+    Decrementa as pokecoins do usuário somente se ele tiver o suficiente.
+    Retorna o novo saldo, ou None se o usuário não existir ou não tiver pokecoins suficientes.
+    Não faz commit: deve ser chamada dentro da transação de quem a usa.
+    """
+    result = await session.execute(
+        update(User)
+        .where(User.id == user_id, User.coins >= amount)
+        .values(coins=User.coins - amount)
+        .returning(User.coins)
+    )
+    return result.scalar_one_or_none()
+
+async def credit_coins(session, amounts):
+    """
+    Credita pokecoins a vários usuários em um único UPDATE.
+    `amounts` é um dicionário {user_id: valor}.
+    Não faz commit: deve ser chamada dentro da transação de quem a usa.
+    """
+    # Em ordem de ID, como lock_users
+    amounts = {user_id: amount for user_id, amount in sorted(amounts.items()) if amount}
+    if not amounts:
+        return
+    await session.execute(
+        text(
+            "UPDATE users AS u SET coins = COALESCE(u.coins, 0) + v.amount "
+            "FROM unnest(CAST(:ids AS BIGINT[]), CAST(:amounts AS INTEGER[])) AS v(id, amount) "
+            "WHERE u.id = v.id"
+        ),
+        {"ids": list(amounts.keys()), "amounts": list(amounts.values())}
+    )
+
+async def lock_users(session, user_ids):
+    """
+    Trava (SELECT ... FOR UPDATE) as linhas dos usuários, sempre em ordem de ID,
+    para que operações entre os mesmos usuários não entrem em deadlock.
+    Retorna um dicionário {user_id: User} apenas com os usuários encontrados.
+    Não faz commit: as travas valem até o fim da transação de quem a usa.
+    """
+    result = await session.execute(
+        select(User)
+        .where(User.id.in_(sorted(set(user_ids))))
+        .order_by(User.id)
+        .with_for_update()
+    )
+    return {user.id: user for user in result.scalars().all()}
@@ -0,0 +1,118 @@
+import random
+from datetime import datetime
+from typing import Dict, Hashable, List, Optional, Sequence
+
+from database.models import DropTable
+
+# Chances padrão quando nenhuma tabela de drop configurada se aplica ao grupo
+DEFAULT_DROP_WEIGHTS: Dict[str, int] = {"🥉": 50, "🥈": 30, "🥇": 20}
+
+ALLOWED_RARITIES = ("🥉", "🥈", "🥇", "💎")
+
+
+class AliasSampler:
+    """
+    Amostrador pelo método de alias (Walker/Vose).
+
+    A construção é O(n) sobre os itens; cada sorteio é O(1): um índice
+    uniforme e uma comparação com a probabilidade da coluna sorteada.
+    """
+
+    def __init__(self, items: Sequence[Hashable], weights: Sequence[float]):
+        if len(items) != len(weights) or not items:
+            raise ValueError("items e weights precisam ter o mesmo tamanho (não vazio)")
+
+        total = float(sum(weights))
+        if total <= 0:
+            raise ValueError("a soma dos pesos precisa ser positiva")
+
+        n = len(items)
+        self.items = list(items)
+        self.prob = [0.0] * n
+        self.alias = [0] * n
+
+        scaled = [w * n / total for w in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+
+        while small and large:
+            s = small.pop()
+            g = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = g
+            scaled[g] = scaled[g] + scaled[s] - 1.0
+            if scaled[g] < 1.0:
+                small.append(g)
+            else:
+                large.append(g)
+
+        # Sobras (erro de arredondamento) ficam com probabilidade 1
+        for i in large + small:
+            self.prob[i] = 1.0
+
+    def sample(self, rng: random.Random = random) -> Hashable:
+        i = rng.randrange(len(self.items))
+        return self.items[i] if rng.random() < self.prob[i] else self.items[self.alias[i]]
+
+    def sample_many(self, k: int, rng: random.Random = random) -> List[Hashable]:
+        return [self.sample(rng) for _ in range(k)]
+
+
+def _is_active(row: DropTable, now: datetime) -> bool:
+    if row.starts_at is not None and now < row.starts_at:
+        return False
+    if row.ends_at is not None and now >= row.ends_at:
+        return False
+    return True
+
+
+def resolve_drop_rows(
+    rows: Sequence[DropTable],
+    category_id: Optional[int],
+    group_id: int,
+    now: Optional[datetime] = None
+) -> List[DropTable]:
+    """
+    Escolhe as linhas de tabela de drop que valem para um grupo agora.
+
+    Ordem de prioridade: eventos (linhas com janela de tempo) antes das
+    tabelas permanentes e, dentro de cada tipo, grupo > categoria > global.
+    Retorna lista vazia quando nada se aplica (usa-se DEFAULT_DROP_WEIGHTS).
+    """
+    now = now or datetime.utcnow()
+    active = [row for row in rows if _is_active(row, now)]
+
+    for is_event in (True, False):
+        for scope in ("group", "category", "global"):
+            matched = []
+            for row in active:
+                if (row.starts_at is not None or row.ends_at is not None) != is_event:
+                    continue
+                if scope == "group" and row.group_id == group_id:
+                    matched.append(row)
+                elif scope == "category" and row.group_id is None and row.category_id == category_id:
+                    matched.append(row)
+                elif scope == "global" and row.group_id is None and row.category_id is None:
+                    matched.append(row)
+            if matched:
+                return matched
+    return []
+
+
+def build_rarity_sampler(
+    weights: Dict[str, float],
+    available_rarities: Sequence[str]
+) -> Optional[AliasSampler]:
+    """
+    Compila os pesos de raridade em um AliasSampler, renormalizando sobre as
+    raridades que o grupo realmente possui. Se nenhuma raridade com peso
+    existir no grupo, sorteia uniformemente entre as raridades disponíveis.
+    Retorna None se o grupo não tiver cards.
+    """
+    if not available_rarities:
+        return None
+
+    items = [r for r in available_rarities if weights.get(r, 0) > 0]
+    if items:
+        return AliasSampler(items, [weights[r] for r in items])
+    return AliasSampler(list(available_rarities), [1] * len(available_rarities))
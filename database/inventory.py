@@ -0,0 +1,442 @@
+import logging
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.leaderboards import leaderboard_cache
+
+logger = logging.getLogger(__name__)
+
+
+class InventoryChange(NamedTuple):
+    """Resultado de uma alteração de inventário."""
+    quantities: Dict[int, int]      # {card_id: nova quantidade} dos cards alterados
+    total_before: Optional[int]     # users.cards_total antes da alteração
+    total_after: Optional[int]      # users.cards_total depois da alteração
+
+
+class InventoryTransfer(NamedTuple):
+    """Resultado de uma transferência do inventário inteiro entre dois usuários."""
+    moved: Dict[int, int]           # {card_id: quantidade transferida}
+    donor: InventoryChange          # quantities vazio: o doador fica sem cards
+    recipient: InventoryChange      # novas quantidades no destinatário
+
+
+# Contadores de coleção mantidos na tabela users (cópias por raridade)
+RARITY_COUNTER_COLUMNS = {
+    "🥇": "cards_gold",
+    "🥈": "cards_silver",
+    "🥉": "cards_bronze",
+    "💎": "cards_diamond",
+}
+
+
+# Ordem das raridades na mochila (🥇, 🥈, 🥉 e depois o resto), guardada em
+# inventory.rarity_weight para que as páginas saiam do índice
+# ix_inventory_user_rarity_card sem juntar com cards
+RARITY_SORT_WEIGHTS = {"🥇": 1, "🥈": 2, "🥉": 3}
+DEFAULT_RARITY_WEIGHT = 4
+
+
+def rarity_weight_sql(column: str) -> str:
+    """Expressão SQL com o peso de ordenação da raridade em `column`."""
+    cases = " ".join(f"WHEN '{rarity}' THEN {weight}" for rarity, weight in RARITY_SORT_WEIGHTS.items())
+    return f"CASE {column} {cases} ELSE {DEFAULT_RARITY_WEIGHT} END"
+
+
+def _counter_updates(sign: str, moved: str, distinct_condition: str) -> str:
+    """Monta o SET do UPDATE de users a partir da CTE `d` (card_id, quantity, moved, rarity)."""
+    sets = [
+        f"cards_total = cards_total {sign} (SELECT COALESCE(SUM({moved}), 0) FROM d)",
+        f"cards_distinct = cards_distinct {sign} (SELECT COUNT(*) FROM d WHERE {distinct_condition})",
+    ]
+    for rarity, column in RARITY_COUNTER_COLUMNS.items():
+        sets.append(
+            f"{column} = {column} {sign} "
+            f"(SELECT COALESCE(SUM({moved}), 0) FROM d WHERE rarity = '{rarity}')"
+        )
+    return ",\n            ".join(sets)
+
+
+# Os cards são passados como arrays (unnest) para que a quantidade de parâmetros
+# não cresça com o número de cards movimentados. O inventário e os contadores
+# do usuário são alterados no mesmo comando (CTEs que modificam dados).
+_ADD_CARDS_SQL = text(
+    f"""
+    WITH v AS (
+        SELECT * FROM unnest(CAST(:card_ids AS INTEGER[]), CAST(:quantities AS INTEGER[]))
+            AS v(card_id, quantity)
+    ),
+    up AS (
+        INSERT INTO inventory (user_id, card_id, quantity, rarity_weight)
+        SELECT :user_id, v.card_id, v.quantity, {rarity_weight_sql("c.rarity")}
+        FROM v
+        LEFT JOIN cards c ON c.id = v.card_id
+        ON CONFLICT (user_id, card_id)
+        DO UPDATE SET quantity = inventory.quantity + EXCLUDED.quantity
+        RETURNING card_id, quantity
+    ),
+    d AS (
+        SELECT up.card_id, up.quantity, v.quantity AS moved, c.rarity, c.group_id
+        FROM up
+        JOIN v ON v.card_id = up.card_id
+        JOIN cards c ON c.id = up.card_id
+    ),
+    u AS (
+        UPDATE users SET
+            {_counter_updates("+", "moved", "quantity = moved")}
+        WHERE id = :user_id
+        RETURNING cards_total
+    ),
+    gp AS (
+        INSERT INTO user_group_progress (user_id, group_id, owned_distinct, owned_total)
+        SELECT :user_id, group_id, COUNT(*) FILTER (WHERE quantity = moved), SUM(moved)
+        FROM d
+        GROUP BY group_id
+        ON CONFLICT (user_id, group_id) DO UPDATE SET
+            owned_distinct = user_group_progress.owned_distinct + EXCLUDED.owned_distinct,
+            owned_total = user_group_progress.owned_total + EXCLUDED.owned_total
+    )
+    SELECT card_id, quantity, (SELECT cards_total FROM u) AS cards_total FROM up
+    """
+)
+
+_REMOVE_CARDS_SQL = text(
+    f"""
+    WITH v AS (
+        SELECT * FROM unnest(CAST(:card_ids AS INTEGER[]), CAST(:quantities AS INTEGER[]))
+            AS v(card_id, quantity)
+    ),
+    dn AS (
+        UPDATE inventory AS i SET quantity = i.quantity - v.quantity
+        FROM v
+        WHERE i.user_id = :user_id AND i.card_id = v.card_id AND i.quantity >= v.quantity
+        RETURNING i.card_id, i.quantity, v.quantity AS moved
+    ),
+    d AS (
+        SELECT dn.card_id, dn.quantity, dn.moved, c.rarity, c.group_id
+        FROM dn
+        JOIN cards c ON c.id = dn.card_id
+    ),
+    u AS (
+        UPDATE users SET
+            {_counter_updates("-", "moved", "quantity = 0")}
+        WHERE id = :user_id
+        RETURNING cards_total
+    ),
+    gp AS (
+        UPDATE user_group_progress AS p SET
+            owned_distinct = p.owned_distinct - x.emptied,
+            owned_total = p.owned_total - x.moved
+        FROM (
+            SELECT group_id, COUNT(*) FILTER (WHERE quantity = 0) AS emptied, SUM(moved) AS moved
+            FROM d
+            GROUP BY group_id
+        ) AS x
+        WHERE p.user_id = :user_id AND p.group_id = x.group_id
+    )
+    SELECT card_id, quantity, (SELECT cards_total FROM u) AS cards_total FROM dn
+    """
+)
+
+# Transfere todo o inventário de um usuário para outro em um único comando:
+# apaga as linhas do doador, soma no destinatário (UPSERT), zera os contadores
+# e o progresso por grupo do doador e atualiza os do destinatário.
+_TRANSFER_ALL_SQL = text(
+    f"""
+    WITH moved AS (
+        DELETE FROM inventory
+        WHERE user_id = :from_user_id
+        RETURNING card_id, quantity, rarity_weight
+    ),
+    up AS (
+        INSERT INTO inventory (user_id, card_id, quantity, rarity_weight)
+        SELECT :to_user_id, card_id, quantity, rarity_weight FROM moved WHERE quantity > 0
+        ON CONFLICT (user_id, card_id)
+        DO UPDATE SET quantity = inventory.quantity + EXCLUDED.quantity
+        RETURNING card_id, quantity
+    ),
+    d AS (
+        SELECT up.card_id, up.quantity, moved.quantity AS moved, c.rarity, c.group_id
+        FROM up
+        JOIN moved ON moved.card_id = up.card_id
+        JOIN cards c ON c.id = up.card_id
+    ),
+    donor AS (
+        UPDATE users SET
+            cards_total = 0,
+            cards_distinct = 0,
+            {", ".join(f"{column} = 0" for column in RARITY_COUNTER_COLUMNS.values())}
+        WHERE id = :from_user_id
+    ),
+    u AS (
+        UPDATE users SET
+            {_counter_updates("+", "moved", "quantity = moved")}
+        WHERE id = :to_user_id
+        RETURNING cards_total
+    ),
+    gp_donor AS (
+        DELETE FROM user_group_progress WHERE user_id = :from_user_id
+    ),
+    gp AS (
+        INSERT INTO user_group_progress (user_id, group_id, owned_distinct, owned_total)
+        SELECT :to_user_id, group_id, COUNT(*) FILTER (WHERE quantity = moved), SUM(moved)
+        FROM d
+        GROUP BY group_id
+        ON CONFLICT (user_id, group_id) DO UPDATE SET
+            owned_distinct = user_group_progress.owned_distinct + EXCLUDED.owned_distinct,
+            owned_total = user_group_progress.owned_total + EXCLUDED.owned_total
+    )
+    SELECT card_id, quantity, moved, (SELECT cards_total FROM u) AS cards_total FROM d
+    """
+)
+
+_DELETE_EMPTY_SQL = text(
+    """
+    DELETE FROM inventory
+    WHERE user_id = :user_id AND card_id = ANY(CAST(:card_ids AS INTEGER[])) AND quantity <= 0
+    """
+)
+
+# Trava as linhas (user_id, card_id) pedidas, sempre na mesma ordem
+_LOCK_ROWS_SQL = text(
+    """
+    SELECT i.user_id, i.card_id, i.quantity
+    FROM inventory AS i
+    JOIN unnest(CAST(:user_ids AS BIGINT[]), CAST(:card_ids AS INTEGER[])) AS v(user_id, card_id)
+        ON i.user_id = v.user_id AND i.card_id = v.card_id
+    ORDER BY i.user_id, i.card_id
+    FOR UPDATE OF i
+    """
+)
+
+# Recria o progresso por grupo a partir do inventário (reparo em lote)
+_RECOMPUTE_GROUP_PROGRESS_SQL = [
+    text("DELETE FROM user_group_progress"),
+    text(
+        """
+        INSERT INTO user_group_progress (user_id, group_id, owned_distinct, owned_total)
+        SELECT i.user_id, c.group_id, COUNT(*), SUM(i.quantity)
+        FROM inventory AS i
+        JOIN cards AS c ON c.id = i.card_id
+        WHERE i.quantity > 0
+        GROUP BY i.user_id, c.group_id
+        """
+    ),
+]
+
+# Recalcula todos os contadores a partir do inventário (reparo em lote)
+_RECOMPUTE_COUNTERS_SQL = text(
+    f"""
+    UPDATE users AS usr SET
+        cards_total = COALESCE(t.total, 0),
+        cards_distinct = COALESCE(t.distinct_cards, 0),
+        {", ".join(f"{column} = COALESCE(t.{column}, 0)" for column in RARITY_COUNTER_COLUMNS.values())}
+    FROM users AS base
+    LEFT JOIN (
+        SELECT
+            i.user_id,
+            SUM(i.quantity) AS total,
+            COUNT(*) AS distinct_cards,
+            {", ".join(
+                f"SUM(i.quantity) FILTER (WHERE c.rarity = '{rarity}') AS {column}"
+                for rarity, column in RARITY_COUNTER_COLUMNS.items()
+            )}
+        FROM inventory AS i
+        JOIN cards AS c ON c.id = i.card_id
+        WHERE i.quantity > 0
+        GROUP BY i.user_id
+    ) AS t ON t.user_id = base.id
+    WHERE usr.id = base.id
+    """
+)
+
+
+async def add_cards(session: AsyncSession, user_id: int, items: Dict[int, int]) -> InventoryChange:
+    """
+    Adiciona cards ao inventário de um usuário com um único UPSERT,
+    atualizando os contadores de coleção e o progresso por grupo do
+    usuário no mesmo comando.
+
+    Não faz commit: deve ser chamada dentro da transação de quem a usa.
+
+    Args:
+        session: Sessão SQLAlchemy ativa
+        user_id: ID do usuário que recebe os cards
+        items: Mapa {card_id: quantidade a adicionar}
+
+    Returns:
+        InventoryChange: novas quantidades e o total de cards do usuário antes/depois
+    """
+    items = {card_id: qty for card_id, qty in items.items() if qty > 0}
+    if not items:
+        return InventoryChange({}, None, None)
+
+    result = await session.execute(
+        _ADD_CARDS_SQL,
+        {
+            "user_id": user_id,
+            "card_ids": list(items.keys()),
+            "quantities": list(items.values()),
+        }
+    )
+    rows = result.all()
+    quantities = {row.card_id: row.quantity for row in rows}
+    leaderboard_cache.invalidate(quantities)
+    total_after = rows[0].cards_total if rows else None
+    total_before = None
+    if total_after is not None:
+        total_before = total_after - sum(items[card_id] for card_id in quantities)
+    return InventoryChange(quantities, total_before, total_after)
+
+
+async def remove_cards(session: AsyncSession, user_id: int, items: Dict[int, int]) -> InventoryChange:
+    """
+    Retira cards do inventário de um usuário, atualizando os contadores de
+    coleção e o progresso por grupo no mesmo comando. Linhas que chegam a
+    zero são apagadas.
+
+    Cards sem quantidade suficiente não são alterados e ficam fora do
+    resultado; quem precisa de tudo-ou-nada deve comparar o resultado com
+    `items` e desfazer a transação.
+
+    Não faz commit: deve ser chamada dentro da transação de quem a usa.
+
+    Args:
+        session: Sessão SQLAlchemy ativa
+        user_id: ID do usuário que perde os cards
+        items: Mapa {card_id: quantidade a retirar}
+
+    Returns:
+        InventoryChange: novas quantidades dos cards retirados e o total de
+        cards do usuário antes/depois
+    """
+    items = {card_id: qty for card_id, qty in items.items() if qty > 0}
+    if not items:
+        return InventoryChange({}, None, None)
+
+    result = await session.execute(
+        _REMOVE_CARDS_SQL,
+        {
+            "user_id": user_id,
+            "card_ids": list(items.keys()),
+            "quantities": list(items.values()),
+        }
+    )
+    rows = result.all()
+    remaining = {row.card_id: row.quantity for row in rows}
+    leaderboard_cache.invalidate(remaining)
+
+    emptied = [card_id for card_id, qty in remaining.items() if qty <= 0]
+    if emptied:
+        await session.execute(_DELETE_EMPTY_SQL, {"user_id": user_id, "card_ids": emptied})
+
+    total_after = rows[0].cards_total if rows else None
+    total_before = None
+    if total_after is not None:
+        total_before = total_after + sum(items[card_id] for card_id in remaining)
+    return InventoryChange(remaining, total_before, total_after)
+
+
+async def transfer_all_cards(session: AsyncSession, from_user_id: int, to_user_id: int) -> InventoryTransfer:
+    """
+    Transfere todos os cards de um usuário para outro em um único comando,
+    com número constante de idas ao banco independentemente do tamanho da
+    coleção. Contadores de coleção e progresso por grupo dos dois usuários
+    são atualizados no mesmo comando.
+
+    Não faz commit: deve ser chamada dentro da transação de quem a usa.
+
+    Args:
+        session: Sessão SQLAlchemy ativa
+        from_user_id: ID do doador (fica sem nenhum card)
+        to_user_id: ID do destinatário
+
+    Returns:
+        InventoryTransfer: cards transferidos e os totais antes/depois de cada usuário
+    """
+    if from_user_id == to_user_id:
+        raise ValueError("from_user_id e to_user_id precisam ser diferentes")
+
+    result = await session.execute(
+        _TRANSFER_ALL_SQL,
+        {"from_user_id": from_user_id, "to_user_id": to_user_id}
+    )
+    rows = result.all()
+    moved = {row.card_id: row.moved for row in rows}
+    leaderboard_cache.invalidate(moved)
+
+    total = sum(moved.values())
+    recipient_after = rows[0].cards_total if rows else None
+    recipient_before = recipient_after - total if recipient_after is not None else None
+    return InventoryTransfer(
+        moved=moved,
+        donor=InventoryChange({}, total, 0),
+        recipient=InventoryChange(
+            {row.card_id: row.quantity for row in rows}, recipient_before, recipient_after
+        ),
+    )
+
+
+async def lock_inventory_rows(
+    session: AsyncSession,
+    keys: Iterable[Tuple[int, int]]
+) -> Dict[Tuple[int, int], int]:
+    """
+    Trava (SELECT ... FOR UPDATE) apenas as linhas de inventário envolvidas em
+    uma operação, em ordem (user_id, card_id) para evitar deadlocks entre
+    operações concorrentes sobre os mesmos cards.
+
+    Não faz commit: as travas valem até o fim da transação de quem a usa.
+
+    Args:
+        session: Sessão SQLAlchemy ativa
+        keys: Pares (user_id, card_id)
+
+    Returns:
+        Dict[Tuple[int, int], int]: Quantidade atual de cada par existente
+    """
+    keys = sorted(set(keys))
+    if not keys:
+        return {}
+
+    result = await session.execute(
+        _LOCK_ROWS_SQL,
+        {
+            "user_ids": [user_id for user_id, _ in keys],
+            "card_ids": [card_id for _, card_id in keys],
+        }
+    )
+    return {(row.user_id, row.card_id): row.quantity for row in result.all()}
+
+
+async def recompute_user_counters(session: AsyncSession) -> int:
+    """
+    Recalcula, em um único UPDATE, os contadores de coleção de todos os
+    usuários a partir do inventário. Usado como reparo caso os contadores
+    tenham divergido (ex.: alterações manuais no banco).
+
+    Não faz commit.
+
+    Returns:
+        int: Quantidade de usuários atualizados
+    """
+    result = await session.execute(_RECOMPUTE_COUNTERS_SQL)
+    return result.rowcount
+
+
+async def recompute_group_progress(session: AsyncSession) -> int:
+    """
+    Recria, a partir do inventário, a tabela user_group_progress de todos os
+    usuários. Usado como reparo, assim como recompute_user_counters.
+
+    Não faz commit.
+
+    Returns:
+        int: Quantidade de linhas (usuário, grupo) criadas
+    """
+    result = None
+    for statement in _RECOMPUTE_GROUP_PROGRESS_SQL:
+        result = await session.execute(statement)
+    return result.rowcount
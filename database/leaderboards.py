@@ -0,0 +1,135 @@
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Quanto tempo (em segundos) um ranking de card fica em cache
+LEADERBOARD_TTL = 30
+
+LEADERBOARD_SIZE = 10
+
+# Acima disso a posição do usuário é exibida como "N+" (não conta o resto do ranking)
+RANK_COUNT_LIMIT = 10000
+
+
+class LeaderboardEntry(NamedTuple):
+    user_id: int
+    nickname: str
+    quantity: int
+
+
+class UserRank(NamedTuple):
+    rank: int         # 1 + usuários com mais cópias (empates dividem a posição)
+    quantity: int
+    capped: bool      # True se a posição real é maior que `rank`
+
+
+# Os rankings usam o índice ix_inventory_card_quantity (card_id, quantity DESC, user_id)
+_TOP_SQL = text(
+    """
+    SELECT i.user_id, u.nickname, i.quantity
+    FROM inventory AS i
+    JOIN users AS u ON u.id = i.user_id
+    WHERE i.card_id = :card_id AND i.quantity > 0
+    ORDER BY i.quantity DESC, i.user_id
+    LIMIT :limit
+    """
+)
+
+_USER_RANK_SQL = text(
+    """
+    SELECT mine.quantity, (
+        SELECT COUNT(*) FROM (
+            SELECT 1 FROM inventory AS o
+            WHERE o.card_id = :card_id AND o.quantity > mine.quantity
+            LIMIT :count_limit
+        ) AS above
+    ) AS above
+    FROM inventory AS mine
+    WHERE mine.user_id = :user_id AND mine.card_id = :card_id AND mine.quantity > 0
+    """
+)
+
+
+class CardLeaderboardCache:
+    """
+    Cache dos Top N do /ginasio por card, com expiração curta.
+
+    Os rankings são invalidados por card pelos helpers de database/inventory.py
+    sempre que o inventário daquele card muda; o TTL só cobre alterações feitas
+    fora deles e mudanças de apelido.
+    """
+
+    def __init__(self, ttl: float = LEADERBOARD_TTL):
+        self.ttl = ttl
+        self._entries: Dict[int, Tuple[float, List[LeaderboardEntry]]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, card_id: int, now: Optional[float] = None) -> Optional[List[LeaderboardEntry]]:
+        now = time.time() if now is None else now
+        cached = self._entries.get(card_id)
+        if cached is None or cached[0] <= now:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return cached[1]
+
+    def put(self, card_id: int, entries: List[LeaderboardEntry], now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        self._entries[card_id] = (now + self.ttl, entries)
+
+    def invalidate(self, card_ids: Iterable[int]) -> None:
+        for card_id in card_ids:
+            self._entries.pop(card_id, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+# Instância única compartilhada por todo o processo
+leaderboard_cache = CardLeaderboardCache()
+
+
+async def get_card_leaderboard(session: AsyncSession, card_id: int) -> List[LeaderboardEntry]:
+    """
+    Retorna os Top N usuários com mais cópias do card, usando o cache quando possível.
+
+    Args:
+        session: Sessão SQLAlchemy ativa
+        card_id: ID do card
+
+    Returns:
+        List[LeaderboardEntry]: Ranking em ordem decrescente de quantidade
+    """
+    entries = leaderboard_cache.get(card_id)
+    if entries is None:
+        result = await session.execute(_TOP_SQL, {"card_id": card_id, "limit": LEADERBOARD_SIZE})
+        entries = [LeaderboardEntry(row.user_id, row.nickname, row.quantity) for row in result.all()]
+        leaderboard_cache.put(card_id, entries)
+    return entries
+
+
+async def get_user_card_rank(session: AsyncSession, card_id: int, user_id: int) -> Optional[UserRank]:
+    """
+    Calcula a posição do usuário no ranking de um card. A contagem de quem está
+    acima para no limite RANK_COUNT_LIMIT, então cards populares não são
+    varridos por inteiro.
+
+    Args:
+        session: Sessão SQLAlchemy ativa
+        card_id: ID do card
+        user_id: ID do usuário
+
+    Returns:
+        Optional[UserRank]: Posição e quantidade, ou None se o usuário não tiver o card
+    """
+    result = await session.execute(
+        _USER_RANK_SQL,
+        {"card_id": card_id, "user_id": user_id, "count_limit": RANK_COUNT_LIMIT}
+    )
+    row = result.first()
+    if row is None:
+        return None
+    return UserRank(row.above + 1, row.quantity, row.above >= RANK_COUNT_LIMIT)
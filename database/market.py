@@ -0,0 +1,215 @@
+import logging
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+# Preço pago pela loja (e cobrado no Pokémart) por unidade de cada raridade
+HOUSE_PRICES = {"🥇": 1000, "🥈": 500, "🥉": 250}
+
+
+class StockQuote(NamedTuple):
+    card_id: int
+    name: str
+    rarity: str
+    requested: int
+    available: int          # Estoque total do card, somando todos os preços
+    cost: Optional[int]     # Custo do pedido (do preço mais barato ao mais caro), ou None se faltar estoque
+
+
+class StockTake(NamedTuple):
+    card_id: int
+    price: int
+    quantity: int
+
+
+# Soma as unidades ao estoque de cada (card, preço) em um único comando
+_ADD_STOCK_SQL = text(
+    """
+    INSERT INTO market_stock (card_id, price, quantity)
+    SELECT * FROM unnest(
+        CAST(:card_ids AS INTEGER[]), CAST(:prices AS INTEGER[]), CAST(:quantities AS INTEGER[])
+    )
+    ON CONFLICT (card_id, price) DO UPDATE
+        SET quantity = market_stock.quantity + EXCLUDED.quantity
+    """
+)
+
+# Estoque de cada card pedido, do preço mais barato ao mais caro, com quantas
+# unidades os preços anteriores já cobrem (`before`): cada pedido é atendido
+# juntando as faixas de preço em ordem, pela mesma regra na cotação e na retirada
+_STOCK_LEVELS_CTE = """
+    v AS (
+        SELECT * FROM unnest(CAST(:card_ids AS INTEGER[]), CAST(:quantities AS INTEGER[]))
+            AS v(card_id, quantity)
+    ),
+    levels AS (
+        SELECT s.card_id, s.price, s.quantity, v.quantity AS requested,
+               SUM(s.quantity) OVER (PARTITION BY s.card_id ORDER BY s.price) - s.quantity AS before,
+               SUM(s.quantity) OVER (PARTITION BY s.card_id) AS available
+        FROM market_stock AS s
+        JOIN v ON v.card_id = s.card_id
+        WHERE s.quantity > 0
+    )
+"""
+
+# Cotação de um pedido inteiro: card, disponibilidade e custo de todos os itens
+# em uma única consulta agrupada
+_QUOTE_STOCK_SQL = text(
+    f"""
+    WITH {_STOCK_LEVELS_CTE}
+    SELECT c.id AS card_id, c.name, c.rarity, v.quantity AS requested,
+           COALESCE(MAX(l.available), 0) AS available,
+           CASE WHEN COALESCE(MAX(l.available), 0) >= v.quantity THEN
+               SUM(l.price * LEAST(l.quantity, v.quantity - l.before)) FILTER (WHERE l.before < v.quantity)
+           END AS cost
+    FROM v
+    JOIN cards AS c ON c.id = v.card_id
+    LEFT JOIN levels AS l ON l.card_id = v.card_id
+    GROUP BY c.id, c.name, c.rarity, v.quantity
+    """
+)
+
+# Conjunto de venda de um filtro do /venderc: as cópias acima de :keep de cada
+# card do usuário nas raridades (e, opcionalmente, no grupo) pedidas
+_SELLABLE_CARDS_SQL = text(
+    """
+    SELECT i.card_id, i.quantity - :keep AS quantity
+    FROM inventory AS i
+    JOIN cards AS c ON c.id = i.card_id
+    WHERE i.user_id = :user_id
+      AND i.quantity > :keep
+      AND c.rarity = ANY(CAST(:rarities AS VARCHAR[]))
+      AND (CAST(:group_id AS INTEGER) IS NULL OR c.group_id = :group_id)
+    ORDER BY i.card_id
+    """
+)
+
+# Trava o estoque dos cards pedidos, sempre na mesma ordem, antes de calcular a
+# retirada: compras concorrentes do mesmo card esperam em vez de se sobreporem
+_LOCK_STOCK_SQL = text(
+    """
+    SELECT card_id, price FROM market_stock
+    WHERE card_id = ANY(CAST(:card_ids AS INTEGER[]))
+    ORDER BY card_id, price
+    FOR UPDATE
+    """
+)
+
+# Cada pedido é atendido do preço mais barato ao mais caro, juntando faixas de
+# preço se preciso. Cards sem estoque total suficiente não são alterados.
+_TAKE_STOCK_SQL = text(
+    f"""
+    WITH {_STOCK_LEVELS_CTE},
+    pick AS (
+        SELECT card_id, price, LEAST(quantity, requested - before) AS quantity
+        FROM levels
+        WHERE available >= requested AND before < requested
+    )
+    UPDATE market_stock AS s SET quantity = s.quantity - pick.quantity
+    FROM pick
+    WHERE s.card_id = pick.card_id AND s.price = pick.price
+    RETURNING s.card_id, s.price, pick.quantity
+    """
+)
+
+
+def house_price(rarity: str) -> int:
+    """Preço unitário da loja para a raridade (0 para raridades que a loja não revende)."""
+    return HOUSE_PRICES.get(rarity, 0)
+
+
+async def add_stock(session: AsyncSession, items: Dict[Tuple[int, int], int]) -> None:
+    """
+    Adiciona unidades ao estoque do Pokémart. Não faz commit.
+
+    Args:
+        session: Sessão SQLAlchemy ativa
+        items: {(card_id, preço): quantidade}
+    """
+    items = {key: qty for key, qty in items.items() if qty > 0}
+    if not items:
+        return
+    await session.execute(
+        _ADD_STOCK_SQL,
+        {
+            "card_ids": [card_id for card_id, _ in items],
+            "prices": [price for _, price in items],
+            "quantities": list(items.values()),
+        }
+    )
+
+
+async def quote_stock(session: AsyncSession, items: Dict[int, int]) -> Dict[int, StockQuote]:
+    """
+    Verifica disponibilidade e custo de todos os itens de um pedido com uma
+    única consulta (sem travar o estoque).
+
+    Args:
+        session: Sessão SQLAlchemy ativa
+        items: {card_id: quantidade}
+
+    Returns:
+        Dict[int, StockQuote]: Cotação por card_id; cards inexistentes ficam de fora
+    """
+    if not items:
+        return {}
+    result = await session.execute(
+        _QUOTE_STOCK_SQL,
+        {"card_ids": list(items.keys()), "quantities": list(items.values())}
+    )
+    return {row.card_id: StockQuote(*row) for row in result.all()}
+
+
+async def find_sellable_cards(
+    session: AsyncSession,
+    user_id: int,
+    rarities: Sequence[str],
+    group_id: Optional[int] = None,
+    keep: int = 0
+) -> Dict[int, int]:
+    """
+    Calcula, com uma única consulta, quantas cópias de cada card o usuário
+    venderia com um filtro do /venderc.
+
+    Args:
+        session: Sessão SQLAlchemy ativa
+        user_id: Dono do inventário
+        rarities: Raridades incluídas
+        group_id: Restringe a um grupo, se informado
+        keep: Cópias de cada card que o usuário mantém
+
+    Returns:
+        Dict[int, int]: {card_id: quantidade a vender}, em ordem de card_id
+    """
+    result = await session.execute(
+        _SELLABLE_CARDS_SQL,
+        {"user_id": user_id, "rarities": list(rarities), "group_id": group_id, "keep": keep}
+    )
+    return {row.card_id: row.quantity for row in result.all()}
+
+
+async def take_stock(session: AsyncSession, items: Dict[int, int]) -> List[StockTake]:
+    """
+    Retira do estoque as unidades compradas: trava o estoque dos cards pedidos
+    e faz a retirada com um único UPDATE, do preço mais barato ao mais caro.
+    Não faz commit.
+
+    Args:
+        session: Sessão SQLAlchemy ativa
+        items: {card_id: quantidade}
+
+    Returns:
+        List[StockTake]: Unidades retiradas de cada (card, preço); um card pode
+        vir em mais de uma linha. Se algum card de `items` ficar de fora,
+        faltou estoque e a transação deve ser desfeita.
+    """
+    items = {card_id: qty for card_id, qty in items.items() if qty > 0}
+    if not items:
+        return []
+    params = {"card_ids": list(items.keys()), "quantities": list(items.values())}
+    await session.execute(_LOCK_STOCK_SQL, params)
+    result = await session.execute(_TAKE_STOCK_SQL, params)
+    return [StockTake(*row) for row in result.all()]
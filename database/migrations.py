@@ -0,0 +1,265 @@
+import logging
+from typing import Any, Awaitable, Callable, List, Tuple, Union
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from database.inventory import rarity_weight_sql, recompute_user_counters, recompute_group_progress
+
+logger = logging.getLogger(__name__)
+
+
+async def recompute_user_counters_migration(engine: AsyncEngine) -> None:
+    """Preenche os contadores de coleção dos usuários a partir do inventário."""
+    async with AsyncSession(engine) as session:
+        async with session.begin():
+            updated = await recompute_user_counters(session)
+    logger.info(f"Contadores de coleção recalculados para {updated} usuários")
+
+
+async def backfill_group_progress_migration(engine: AsyncEngine) -> None:
+    """Preenche o progresso por grupo (user_group_progress) a partir do inventário."""
+    async with AsyncSession(engine) as session:
+        async with session.begin():
+            created = await recompute_group_progress(session)
+    logger.info(f"Progresso por grupo recriado: {created} linhas")
+
+
+# Quantidade de pares (user_id, card_id) duplicados consolidados por transação
+DEDUP_BATCH_SIZE = 1000
+
+# Soma as quantidades duplicadas de um lote de pares (user_id, card_id) na linha
+# mais antiga de cada par e remove as demais, num único comando
+_DEDUP_INVENTORY_BATCH_SQL = text(
+    """
+    WITH dup AS (
+        SELECT user_id, card_id, MIN(id) AS keep_id, SUM(quantity) AS total
+        FROM inventory
+        GROUP BY user_id, card_id
+        HAVING COUNT(*) > 1
+        LIMIT :batch_size
+    ),
+    kept AS (
+        UPDATE inventory AS i SET quantity = dup.total
+        FROM dup
+        WHERE i.id = dup.keep_id
+        RETURNING i.id
+    ),
+    removed AS (
+        DELETE FROM inventory AS i
+        USING dup
+        WHERE i.user_id = dup.user_id AND i.card_id = dup.card_id AND i.id <> dup.keep_id
+        RETURNING i.id
+    )
+    SELECT (SELECT COUNT(*) FROM kept) AS merged, (SELECT COUNT(*) FROM removed) AS removed
+    """
+)
+
+
+async def deduplicate_inventory_migration(engine: AsyncEngine) -> None:
+    """
+    Consolida as linhas duplicadas de (user_id, card_id) do inventário em lotes
+    curtos (uma transação por lote, sem travar a tabela inteira) e depois cria
+    o índice único com CREATE INDEX CONCURRENTLY.
+
+    Se uma duplicata nova aparecer enquanto o índice é criado, o Postgres deixa
+    o índice inválido; ele é removido e o processo recomeça.
+    """
+    for attempt in range(1, 4):
+        merged = removed = 0
+        while True:
+            async with engine.begin() as conn:
+                row = (await conn.execute(
+                    _DEDUP_INVENTORY_BATCH_SQL, {"batch_size": DEDUP_BATCH_SIZE}
+                )).one()
+            if not row.merged:
+                break
+            merged += row.merged
+            removed += row.removed
+        logger.info(f"Inventário consolidado: {merged} pares duplicados, {removed} linhas removidas")
+
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            valid = (await conn.execute(text(
+                "SELECT indisvalid FROM pg_index"
+                " WHERE indexrelid = to_regclass('uq_inventory_user_card')"
+            ))).scalar_one_or_none()
+            if valid:
+                return
+            if valid is not None:
+                await conn.execute(text("DROP INDEX CONCURRENTLY IF EXISTS uq_inventory_user_card"))
+            try:
+                await conn.execute(text(
+                    "CREATE UNIQUE INDEX CONCURRENTLY uq_inventory_user_card ON inventory (user_id, card_id)"
+                ))
+                return
+            except Exception as e:
+                logger.warning(f"Falha ao criar uq_inventory_user_card (tentativa {attempt}): {str(e)}")
+                await conn.execute(text("DROP INDEX CONCURRENTLY IF EXISTS uq_inventory_user_card"))
+
+    raise RuntimeError("Não foi possível criar o índice único uq_inventory_user_card")
+
+
+# Linhas do inventário preenchidas com rarity_weight por transação
+RARITY_WEIGHT_BATCH_SIZE = 10000
+
+_BACKFILL_RARITY_WEIGHT_BATCH_SQL = text(
+    f"""
+    UPDATE inventory AS i SET rarity_weight = {rarity_weight_sql("c.rarity")}
+    FROM cards AS c
+    WHERE c.id = i.card_id AND i.id >= :start AND i.id < :end
+    """
+)
+
+
+async def inventory_rarity_weight_migration(engine: AsyncEngine) -> None:
+    """
+    Adiciona inventory.rarity_weight (ordem da /mochila), preenche a coluna
+    em lotes por faixa de id (uma transação por lote) e cria o índice
+    ix_inventory_user_rarity_card com CREATE INDEX CONCURRENTLY.
+    """
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "ALTER TABLE inventory ADD COLUMN IF NOT EXISTS rarity_weight SMALLINT NOT NULL DEFAULT 4"
+        ))
+        max_id = (await conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM inventory"))).scalar_one()
+
+    for start in range(0, max_id + 1, RARITY_WEIGHT_BATCH_SIZE):
+        async with engine.begin() as conn:
+            await conn.execute(
+                _BACKFILL_RARITY_WEIGHT_BATCH_SQL,
+                {"start": start, "end": start + RARITY_WEIGHT_BATCH_SIZE}
+            )
+    logger.info(f"inventory.rarity_weight preenchido até o id {max_id}")
+
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        valid = (await conn.execute(text(
+            "SELECT indisvalid FROM pg_index"
+            " WHERE indexrelid = to_regclass('ix_inventory_user_rarity_card')"
+        ))).scalar_one_or_none()
+        if valid:
+            return
+        if valid is not None:
+            await conn.execute(text("DROP INDEX CONCURRENTLY IF EXISTS ix_inventory_user_rarity_card"))
+        await conn.execute(text(
+            "CREATE INDEX CONCURRENTLY ix_inventory_user_rarity_card"
+            " ON inventory (user_id, rarity_weight, card_id) INCLUDE (quantity)"
+        ))
+
+
+# Cada migração é (nome, passos). Os passos são uma lista de comandos SQL,
+# executados numa única transação, ou uma função assíncrona que recebe o engine
+# e controla suas próprias transações (útil para migrações longas que precisam
+# rodar em lotes).
+#
+# `Base.metadata.create_all` cria tabelas novas, mas não altera tabelas
+# existentes; as migrações abaixo cobrem colunas e índices adicionados depois
+# que o banco de produção já existia. Todas precisam ser idempotentes, porque
+# num banco novo o `create_all` já terá criado o esquema final.
+MigrationSteps = Union[List[str], Callable[[AsyncEngine], Awaitable[Any]]]
+
+MIGRATIONS: List[Tuple[str, MigrationSteps]] = [
+    ("0001_card_image_state", [
+        "ALTER TABLE cards ADD COLUMN IF NOT EXISTS image_kind VARCHAR(10)",
+        "ALTER TABLE cards ADD COLUMN IF NOT EXISTS image_normalized INTEGER DEFAULT 0",
+    ]),
+    ("0002_inventory_unique_user_card", deduplicate_inventory_migration),
+    ("0003_user_collection_counters", [
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS cards_total INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS cards_distinct INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS cards_gold INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS cards_silver INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS cards_bronze INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS cards_diamond INTEGER NOT NULL DEFAULT 0",
+    ]),
+    # Preenche os contadores a partir do inventário existente
+    ("0004_backfill_user_collection_counters", recompute_user_counters_migration),
+    # A tabela user_group_progress é criada pelo create_all; aqui só é preenchida
+    ("0005_backfill_user_group_progress", backfill_group_progress_migration),
+    ("0006_inventory_card_quantity_index", [
+        "CREATE INDEX IF NOT EXISTS ix_inventory_card_quantity ON inventory (card_id, quantity DESC, user_id)",
+    ]),
+    ("0007_collector_rankings", [
+        "CREATE INDEX IF NOT EXISTS ix_users_cards_total ON users (cards_total DESC, id)",
+        "CREATE INDEX IF NOT EXISTS ix_users_cards_distinct ON users (cards_distinct DESC, id)",
+        # Totais por (categoria, usuário) para o /ranking <categoria>, atualizados
+        # periodicamente por database/rankings.py
+        """
+        CREATE MATERIALIZED VIEW IF NOT EXISTS category_rankings AS
+        SELECT g.category_id, p.user_id,
+               SUM(p.owned_total)::INTEGER AS owned_total,
+               SUM(p.owned_distinct)::INTEGER AS owned_distinct
+        FROM user_group_progress AS p
+        JOIN groups AS g ON g.id = p.group_id
+        WHERE p.owned_distinct > 0
+        GROUP BY g.category_id, p.user_id
+        """,
+        # Índice único exigido pelo REFRESH ... CONCURRENTLY
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_category_rankings ON category_rankings (category_id, user_id)",
+        "CREATE INDEX IF NOT EXISTS ix_category_rankings_total ON category_rankings (category_id, owned_total DESC, user_id)",
+        "CREATE INDEX IF NOT EXISTS ix_category_rankings_distinct ON category_rankings (category_id, owned_distinct DESC, user_id)",
+    ]),
+    ("0008_users_lower_name_indexes", [
+        "CREATE INDEX IF NOT EXISTS ix_users_username_lower ON users (lower(username) text_pattern_ops)",
+        "CREATE INDEX IF NOT EXISTS ix_users_nickname_lower ON users (lower(nickname) text_pattern_ops)",
+    ]),
+    # A tabela market_stock é criada pelo create_all; aqui as listagens antigas
+    # (uma linha de marketplace por unidade vendida) viram estoque agregado.
+    # Num banco novo a tabela marketplace não existe mais e não há o que migrar.
+    ("0009_market_stock", [
+        """
+        DO $$
+        BEGIN
+            IF to_regclass('marketplace') IS NOT NULL THEN
+                INSERT INTO market_stock (card_id, price, quantity)
+                SELECT card_id, price, COUNT(*) FROM marketplace GROUP BY card_id, price
+                ON CONFLICT (card_id, price) DO UPDATE SET quantity = market_stock.quantity + EXCLUDED.quantity;
+                DELETE FROM marketplace;
+            END IF;
+        END
+        $$
+        """,
+    ]),
+    ("0010_inventory_rarity_weight", inventory_rarity_weight_migration),
+    # Tabela legada, esvaziada pela 0009 e sem modelo desde então
+    ("0011_drop_marketplace", [
+        "DROP TABLE IF EXISTS marketplace",
+    ]),
+]
+
+
+async def run_migrations(engine: AsyncEngine) -> None:
+    """
+    Aplica, em ordem, as migrações que ainda não foram registradas em `schema_migrations`.
+
+    Args:
+        engine: Engine assíncrono do banco de dados
+    """
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            " name VARCHAR(100) PRIMARY KEY,"
+            " applied_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+        ))
+        result = await conn.execute(text("SELECT name FROM schema_migrations"))
+        applied = {row[0] for row in result}
+
+    for name, steps in MIGRATIONS:
+        if name in applied:
+            continue
+
+        logger.info(f"Aplicando migração {name}")
+        if callable(steps):
+            await steps(engine)
+        else:
+            async with engine.begin() as conn:
+                for statement in steps:
+                    await conn.execute(text(statement))
+
+        async with engine.begin() as conn:
+            await conn.execute(
+                text("INSERT INTO schema_migrations (name) VALUES (:name)"),
+                {"name": name}
+            )
+        logger.info(f"Migração {name} aplicada")
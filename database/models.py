@@ -1,4 +1,4 @@
-from sqlalchemy import Column, BigInteger, String, Integer, ForeignKey, Table
+from sqlalchemy import Column, BigInteger, String, Integer, SmallInteger, ForeignKey, Table, UniqueConstraint, DateTime, Index, JSON, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -6,6 +6,14 @@ Base = declarative_base()
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # /ranking global: topo e posição do usuário lidos pelos índices
+        Index("ix_users_cards_total", text("cards_total DESC"), "id"),
+        Index("ix_users_cards_distinct", text("cards_distinct DESC"), "id"),
+        # Resolução de @username / nickname (database/user_lookup.py): igualdade e prefixo
+        Index("ix_users_username_lower", text("lower(username) text_pattern_ops")),
+        Index("ix_users_nickname_lower", text("lower(nickname) text_pattern_ops")),
+    )
 
     id = Column(BigInteger, primary_key=True, index=True)  # Telegram ID
     username = Column(String(32), nullable=True)
@@ -16,17 +24,24 @@ class User(Base):
     fav_emoji = Column(String(10), nullable=True)
     is_admin = Column(Integer, default=0)  # 0 = Not Admin, 1 = Admin
 
+    # Contadores de coleção, mantidos por database/inventory.py junto com o inventário
+    cards_total = Column(Integer, default=0, nullable=False)     # Soma das quantidades
+    cards_distinct = Column(Integer, default=0, nullable=False)  # Cards diferentes
+    cards_gold = Column(Integer, default=0, nullable=False)      # Cópias 🥇
+    cards_silver = Column(Integer, default=0, nullable=False)    # Cópias 🥈
+    cards_bronze = Column(Integer, default=0, nullable=False)    # Cópias 🥉
+    cards_diamond = Column(Integer, default=0, nullable=False)   # Cópias 💎
+
     # Relationship to inventory
     inventory = relationship("Inventory", back_populates="user")
-    marketplace_listings = relationship("Marketplace", back_populates="seller")
 
     @property
     def captures(self):
         """
-        Dynamically calculate the total captures for the user.
-        This is the sum of all card quantities in the user's inventory.
+        Total captures for the user (sum of all card quantities in the inventory),
+        read from the maintained counter.
         """
-        return sum(item.quantity for item in self.inventory)
+        return self.cards_total
 
 class Category(Base):
     __tablename__ = "categories"
@@ -76,6 +91,8 @@ class Card(Base):
     name = Column(String(50), nullable=False)
     rarity = Column(String(10), nullable=False)  # Adjusted length for emojis
     image_file_id = Column(String(255), nullable=False)
+    image_kind = Column(String(10), nullable=True)  # "photo" ou "document"; None = ainda não verificado
+    image_normalized = Column(Integer, default=0)  # 1 = foto 3:4 verificada, pronta para envio
     group_id = Column(Integer, ForeignKey("groups.id"), nullable=False)
 
     # Relationships
@@ -86,26 +103,129 @@ class Card(Base):
 
 class Inventory(Base):
     __tablename__ = "inventory"
+    __table_args__ = (
+        # Uma única linha por (usuário, card); permite UPSERT com ON CONFLICT
+        UniqueConstraint("user_id", "card_id", name="uq_inventory_user_card"),
+        # Ranking do /ginasio: top N e posição do usuário lidos só do índice
+        Index("ix_inventory_card_quantity", "card_id", text("quantity DESC"), "user_id"),
+        # Páginas da /mochila (raridade, card) lidas só do índice
+        Index(
+            "ix_inventory_user_rarity_card", "user_id", "rarity_weight", "card_id",
+            postgresql_include=["quantity"],
+        ),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(BigInteger, ForeignKey("users.id"), nullable=False)
     card_id = Column(Integer, ForeignKey("cards.id"), nullable=False)
     quantity = Column(Integer, default=1)
+    # Ordem da raridade do card na mochila (database/inventory.py: RARITY_SORT_WEIGHTS)
+    rarity_weight = Column(SmallInteger, nullable=False, default=4, server_default="4")
 
     # Relationships
     user = relationship("User", back_populates="inventory")
     card = relationship("Card", back_populates="inventory")
 
-class Marketplace(Base):
-    __tablename__ = "marketplace"
+class UserGroupProgress(Base):
+    """
+    Progresso de cada usuário em cada grupo, mantido por database/inventory.py
+    junto com o inventário (usado pela /pokedex).
+    """
+    __tablename__ = "user_group_progress"
+
+    user_id = Column(BigInteger, ForeignKey("users.id"), primary_key=True)
+    group_id = Column(Integer, ForeignKey("groups.id"), primary_key=True)
+    owned_distinct = Column(Integer, default=0, nullable=False)  # Cards diferentes do grupo
+    owned_total = Column(Integer, default=0, nullable=False)     # Soma das quantidades
+
+class MarketStock(Base):
+    """
+    Estoque do Pokémart: cards vendidos à loja pelo /venderc, agregados por
+    (card, preço). Mantido por database/market.py.
+    """
+    __tablename__ = "market_stock"
+
+    card_id = Column(Integer, ForeignKey("cards.id"), primary_key=True)
+    price = Column(Integer, primary_key=True)
+    quantity = Column(Integer, default=0, nullable=False)
+
+    card = relationship("Card")
+
+class MarketOrder(Base):
+    """
+    Livro de ofertas entre jogadores: ordens de venda (cards em garantia) e de
+    compra (pokecoins em garantia). Mantido por database/order_book.py.
+    """
+    __tablename__ = "market_orders"
+    __table_args__ = (
+        # Melhor oferta de venda primeiro: menor preço, depois a mais antiga
+        Index("ix_market_orders_asks", "card_id", "price", "created_at", "id",
+              postgresql_where=text("side = 'sell'")),
+        # Melhor oferta de compra primeiro: maior preço, depois a mais antiga
+        Index("ix_market_orders_bids", "card_id", text("price DESC"), "created_at", "id",
+              postgresql_where=text("side = 'buy'")),
+        Index("ix_market_orders_user", "user_id", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(BigInteger, ForeignKey("users.id"), nullable=False)
+    card_id = Column(Integer, ForeignKey("cards.id"), nullable=False)
+    side = Column(String(4), nullable=False)        # "sell" ou "buy"
+    price = Column(Integer, nullable=False)         # Preço unitário em pokecoins
+    quantity = Column(Integer, nullable=False)      # Quantidade ainda em aberto
+    created_at = Column(DateTime, nullable=False)
+
+class Auction(Base):
+    """
+    Leilão de um card raro (/leilao). O card fica em garantia desde a abertura
+    e o maior lance fica com as pokecoins do licitante reservadas. Mantido por
+    database/auctions.py.
+    """
+    __tablename__ = "auctions"
+    __table_args__ = (
+        # Encerramento: só os leilões abertos, pela data de término
+        Index("ix_auctions_open_ends_at", "ends_at", postgresql_where=text("status = 'open'")),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     seller_id = Column(BigInteger, ForeignKey("users.id"), nullable=False)
     card_id = Column(Integer, ForeignKey("cards.id"), nullable=False)
-    price = Column(Integer, nullable=False)
+    start_price = Column(Integer, nullable=False)
+    current_bid = Column(Integer, nullable=True)                       # Maior lance, se houver
+    bidder_id = Column(BigInteger, ForeignKey("users.id"), nullable=True)
+    chat_id = Column(BigInteger, nullable=False)                        # Onde anunciar o resultado
+    status = Column(String(10), nullable=False)                         # "open" ou "closed"
+    created_at = Column(DateTime, nullable=False)
+    ends_at = Column(DateTime, nullable=False)
 
-    # Relationships
-    seller = relationship("User", back_populates="marketplace_listings")
-    card = relationship("Card")
+class DropTable(Base):
+    __tablename__ = "drop_tables"
 
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # Escopo: ambos nulos = global; só category_id = categoria; group_id = grupo
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
+    group_id = Column(Integer, ForeignKey("groups.id"), nullable=True)
+    rarity = Column(String(10), nullable=False)
+    weight = Column(Integer, nullable=False)
+    # Janela de evento (UTC); nulos = tabela permanente
+    starts_at = Column(DateTime, nullable=True)
+    ends_at = Column(DateTime, nullable=True)
+
+class Trade(Base):
+    """Proposta de troca do /roubar, persistida para sobreviver a reinícios do bot."""
+    __tablename__ = "trades"
+    __table_args__ = (
+        # Varredura de expiração: só as propostas pendentes, pela data de expiração
+        Index("ix_trades_status_expires", "status", "expires_at"),
+    )
 
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    chat_id = Column(BigInteger, nullable=False)
+    message_id = Column(BigInteger, nullable=True)  # Mensagem com os botões, preenchida após o envio
+    requester_id = Column(BigInteger, ForeignKey("users.id"), nullable=False)
+    target_id = Column(BigInteger, ForeignKey("users.id"), nullable=False)
+    requested_cards = Column(JSON, nullable=False)  # [[card_id, quantidade], ...] pedidos ao alvo
+    offered_cards = Column(JSON, nullable=False)    # [[card_id, quantidade], ...] oferecidos pelo solicitante
+    status = Column(String(10), nullable=False, default="pending")  # pending, accepted, rejected, expired
+    created_at = Column(DateTime, nullable=False)   # UTC
+    expires_at = Column(DateTime, nullable=False)   # UTC
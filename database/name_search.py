@@ -0,0 +1,87 @@
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Set, Tuple
+
+# Similaridade mínima (mesmo padrão do pg_trgm) para um nome entrar no resultado
+DEFAULT_MIN_SCORE = 0.3
+
+
+class SearchMatch(NamedTuple):
+    """Um resultado da busca por nome."""
+    id: int
+    name: str
+    score: float  # 1.0 = nome idêntico (ignorando maiúsculas e acentos)
+
+
+def normalize_name(name: str) -> str:
+    """Minúsculas, sem acentos e com espaços simples."""
+    decomposed = unicodedata.normalize("NFKD", name.casefold())
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(stripped.split())
+
+
+def trigrams(normalized: str) -> Set[str]:
+    """Trigramas de cada palavra, com o mesmo preenchimento do pg_trgm ("  ab", "ab ")."""
+    grams = set()
+    for word in normalized.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class NameSearchIndex:
+    """
+    Índice invertido de trigramas sobre nomes (cards, grupos ou categorias).
+
+    A busca só visita os nomes que compartilham ao menos um trigrama com o
+    termo buscado e os ordena pela similaridade (trigramas em comum sobre
+    trigramas totais, como o `similarity()` do pg_trgm). Nomes que contêm o
+    termo inteiro recebem uma pontuação mínima para que buscas por trechos
+    continuem funcionando como o antigo LIKE '%termo%'.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[int, str]]):
+        self._names: Dict[int, str] = {}
+        self._normalized: Dict[int, str] = {}
+        self._grams: Dict[int, Set[str]] = {}
+        self._postings: Dict[str, List[int]] = {}
+
+        for item_id, name in entries:
+            normalized = normalize_name(name)
+            grams = trigrams(normalized)
+            self._names[item_id] = name
+            self._normalized[item_id] = normalized
+            self._grams[item_id] = grams
+            for gram in grams:
+                self._postings.setdefault(gram, []).append(item_id)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def search(self, query: str, limit: int = 5, min_score: float = DEFAULT_MIN_SCORE) -> List[SearchMatch]:
+        """Retorna até `limit` resultados, do mais parecido para o menos parecido."""
+        normalized_query = normalize_name(query)
+        query_grams = trigrams(normalized_query)
+        if not query_grams:
+            return []
+
+        shared: Counter = Counter()
+        for gram in query_grams:
+            shared.update(self._postings.get(gram, ()))
+
+        matches = []
+        for item_id, common in shared.items():
+            normalized = self._normalized[item_id]
+            if normalized == normalized_query:
+                score = 1.0
+            else:
+                score = common / (len(query_grams) + len(self._grams[item_id]) - common)
+                if normalized_query in normalized:
+                    # Trecho do nome: quanto mais do nome o termo cobre, maior a nota
+                    score = max(score, 0.5 + 0.49 * len(normalized_query) / len(normalized))
+                score = min(score, 0.99)
+            if score >= min_score:
+                matches.append(SearchMatch(item_id, self._names[item_id], score))
+
+        matches.sort(key=lambda m: (-m.score, len(m.name), m.id))
+        return matches[:limit]
@@ -0,0 +1,349 @@
+import logging
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.crud_user import credit_coins, lock_users, spend_coins
+from database.inventory import add_cards, remove_cards
+from database.models import MarketOrder
+
+logger = logging.getLogger(__name__)
+
+SIDE_SELL = "sell"
+SIDE_BUY = "buy"
+
+# Quantas ordens opostas são travadas por vez durante o casamento
+MATCH_BATCH_SIZE = 50
+
+# Quantos níveis de preço mostrar de cada lado do livro
+BOOK_DEPTH = 5
+
+# Primeira chave do pg_advisory_xact_lock(chave, card_id) do livro de ofertas
+ORDER_BOOK_LOCK_KEY = 1
+
+
+class Fill(NamedTuple):
+    """Execução contra uma ordem que estava no livro (sempre ao preço dela)."""
+    order_id: int
+    counterparty_id: int
+    price: int
+    quantity: int
+
+
+class OrderPlacement(NamedTuple):
+    fills: List[Fill]
+    order_id: Optional[int]     # Ordem que ficou no livro com o restante, se houver
+    resting: int                # Quantidade que ficou no livro
+
+    @property
+    def filled(self) -> int:
+        return sum(fill.quantity for fill in self.fills)
+
+    @property
+    def filled_value(self) -> int:
+        return sum(fill.price * fill.quantity for fill in self.fills)
+
+
+class BookLevel(NamedTuple):
+    price: int
+    quantity: int
+    orders: int
+
+
+class OpenOrder(NamedTuple):
+    id: int
+    card_id: int
+    side: str
+    price: int
+    quantity: int
+    created_at: datetime
+
+
+# Serializa o casamento por card: com a trava, cada nova ordem vê o livro
+# inteiro (inclusive as ordens que acabaram de ser executadas ou registradas)
+# e sempre casa com o melhor preço, sem que duas ordens opostas fiquem
+# cruzadas no livro. Vale até o fim da transação.
+_LOCK_BOOK_SQL = text("SELECT pg_advisory_xact_lock(:key, :card_id)")
+
+# Melhores ordens opostas, em prioridade preço-tempo, lidas pelos índices
+# parciais ix_market_orders_asks / ix_market_orders_bids.
+_MATCH_SQL = {
+    SIDE_SELL: text(
+        """
+        SELECT id, user_id, price, quantity FROM market_orders
+        WHERE card_id = :card_id AND side = 'sell' AND price <= :price AND user_id <> :user_id
+        ORDER BY price, created_at, id
+        LIMIT :limit
+        FOR UPDATE
+        """
+    ),
+    SIDE_BUY: text(
+        """
+        SELECT id, user_id, price, quantity FROM market_orders
+        WHERE card_id = :card_id AND side = 'buy' AND price >= :price AND user_id <> :user_id
+        ORDER BY price DESC, created_at, id
+        LIMIT :limit
+        FOR UPDATE
+        """
+    ),
+}
+
+_CONSUME_SQL = text(
+    """
+    UPDATE market_orders AS o SET quantity = o.quantity - v.quantity
+    FROM unnest(CAST(:ids AS INTEGER[]), CAST(:quantities AS INTEGER[])) AS v(id, quantity)
+    WHERE o.id = v.id
+    """
+)
+
+_DELETE_FILLED_SQL = text(
+    "DELETE FROM market_orders WHERE id = ANY(CAST(:ids AS INTEGER[])) AND quantity <= 0"
+)
+
+_ORDER_CARD_SQL = text("SELECT card_id FROM market_orders WHERE id = :order_id AND user_id = :user_id")
+
+_CANCEL_SQL = text(
+    """
+    DELETE FROM market_orders WHERE id = :order_id AND user_id = :user_id
+    RETURNING id, card_id, side, price, quantity, created_at
+    """
+)
+
+_BOOK_SQL = {
+    SIDE_SELL: text(
+        """
+        SELECT price, SUM(quantity) AS quantity, COUNT(*) AS orders FROM market_orders
+        WHERE card_id = :card_id AND side = 'sell'
+        GROUP BY price ORDER BY price LIMIT :depth
+        """
+    ),
+    SIDE_BUY: text(
+        """
+        SELECT price, SUM(quantity) AS quantity, COUNT(*) AS orders FROM market_orders
+        WHERE card_id = :card_id AND side = 'buy'
+        GROUP BY price ORDER BY price DESC LIMIT :depth
+        """
+    ),
+}
+
+_USER_ORDERS_SQL = text(
+    """
+    SELECT id, card_id, side, price, quantity, created_at FROM market_orders
+    WHERE user_id = :user_id
+    ORDER BY id DESC
+    LIMIT :limit
+    """
+)
+
+
+async def _lock_book(session: AsyncSession, card_id: int) -> None:
+    await session.execute(_LOCK_BOOK_SQL, {"key": ORDER_BOOK_LOCK_KEY, "card_id": card_id})
+
+
+async def _match(
+    session: AsyncSession,
+    resting_side: str,
+    user_id: int,
+    card_id: int,
+    price: int,
+    quantity: int
+) -> List[Fill]:
+    """
+    Executa `quantity` contra as ordens do lado `resting_side`, travando-as em
+    lotes. Quem chama precisa ter travado o livro do card (_lock_book).
+    """
+    fills: List[Fill] = []
+    remaining = quantity
+    while remaining > 0:
+        rows = (await session.execute(
+            _MATCH_SQL[resting_side],
+            {"card_id": card_id, "price": price, "user_id": user_id, "limit": MATCH_BATCH_SIZE}
+        )).all()
+        if not rows:
+            break
+
+        batch: List[Fill] = []
+        for row in rows:
+            take = min(remaining, row.quantity)
+            batch.append(Fill(row.id, row.user_id, row.price, take))
+            remaining -= take
+            if remaining == 0:
+                break
+
+        ids = [fill.order_id for fill in batch]
+        await session.execute(_CONSUME_SQL, {"ids": ids, "quantities": [fill.quantity for fill in batch]})
+        await session.execute(_DELETE_FILLED_SQL, {"ids": ids})
+        fills.extend(batch)
+
+        if len(rows) < MATCH_BATCH_SIZE:
+            break
+    return fills
+
+
+async def _rest(
+    session: AsyncSession,
+    user_id: int,
+    card_id: int,
+    side: str,
+    price: int,
+    quantity: int
+) -> Optional[int]:
+    if quantity <= 0:
+        return None
+    order = MarketOrder(
+        user_id=user_id,
+        card_id=card_id,
+        side=side,
+        price=price,
+        quantity=quantity,
+        created_at=datetime.utcnow(),
+    )
+    session.add(order)
+    await session.flush()
+    return order.id
+
+
+def _sum_by_user(fills: List[Fill], value: bool) -> Dict[int, int]:
+    totals: Dict[int, int] = {}
+    for fill in fills:
+        amount = fill.price * fill.quantity if value else fill.quantity
+        totals[fill.counterparty_id] = totals.get(fill.counterparty_id, 0) + amount
+    return totals
+
+
+async def place_sell_order(
+    session: AsyncSession,
+    user_id: int,
+    card_id: int,
+    price: int,
+    quantity: int
+) -> Optional[OrderPlacement]:
+    """
+    Coloca uma ordem de venda. Os cards saem do inventário na hora (ficam em
+    garantia no livro); a parte que casar com ordens de compra é entregue aos
+    compradores e paga ao vendedor, e o restante fica no livro.
+
+    Não faz commit: casamento, entregas e pagamentos valem juntos quando a
+    transação de quem chamou for confirmada. Se retornar None, o vendedor não
+    tem os cards e a transação deve ser desfeita.
+
+    Args:
+        session: Sessão SQLAlchemy ativa
+        user_id: Vendedor
+        card_id: Card vendido
+        price: Preço mínimo por unidade
+        quantity: Quantidade
+
+    Returns:
+        Optional[OrderPlacement]: Resultado, ou None se o vendedor não tiver os cards
+    """
+    await _lock_book(session, card_id)
+    fills = await _match(session, SIDE_BUY, user_id, card_id, price, quantity)
+    # Usuários travados em ordem de ID antes de qualquer escrita em cards ou pokecoins
+    await lock_users(session, {user_id, *(fill.counterparty_id for fill in fills)})
+
+    removed = await remove_cards(session, user_id, {card_id: quantity})
+    if card_id not in removed.quantities:
+        return None
+
+    # As pokecoins dos compradores já estavam em garantia; eles só recebem os cards
+    for buyer_id, bought in sorted(_sum_by_user(fills, value=False).items()):
+        await add_cards(session, buyer_id, {card_id: bought})
+    placement = OrderPlacement(fills, None, 0)
+    await credit_coins(session, {user_id: placement.filled_value})
+
+    resting = quantity - placement.filled
+    order_id = await _rest(session, user_id, card_id, SIDE_SELL, price, resting)
+    return OrderPlacement(fills, order_id, resting)
+
+
+async def place_buy_order(
+    session: AsyncSession,
+    user_id: int,
+    card_id: int,
+    price: int,
+    quantity: int
+) -> Optional[OrderPlacement]:
+    """
+    Coloca uma ordem de compra. A parte que casar com ordens de venda é paga
+    ao preço de cada ordem e entregue na hora; o restante fica no livro com
+    as pokecoins correspondentes (preço x quantidade) em garantia.
+
+    Não faz commit. Se retornar None, faltaram pokecoins depois do casamento
+    e a transação deve ser desfeita.
+
+    Args:
+        session: Sessão SQLAlchemy ativa
+        user_id: Comprador
+        card_id: Card comprado
+        price: Preço máximo por unidade
+        quantity: Quantidade
+
+    Returns:
+        Optional[OrderPlacement]: Resultado, ou None se faltarem pokecoins
+    """
+    await _lock_book(session, card_id)
+    fills = await _match(session, SIDE_SELL, user_id, card_id, price, quantity)
+    # Usuários travados em ordem de ID antes de qualquer escrita em cards ou pokecoins
+    await lock_users(session, {user_id, *(fill.counterparty_id for fill in fills)})
+    placement = OrderPlacement(fills, None, 0)
+    resting = quantity - placement.filled
+
+    if await spend_coins(session, user_id, placement.filled_value + price * resting) is None:
+        return None
+    if placement.filled:
+        await add_cards(session, user_id, {card_id: placement.filled})
+    await credit_coins(session, _sum_by_user(fills, value=True))
+
+    order_id = await _rest(session, user_id, card_id, SIDE_BUY, price, resting)
+    return OrderPlacement(fills, order_id, resting)
+
+
+async def cancel_order(session: AsyncSession, user_id: int, order_id: int) -> Optional[OpenOrder]:
+    """
+    Cancela o que resta de uma ordem do usuário e devolve a garantia (cards
+    de uma venda, pokecoins de uma compra). Não faz commit.
+
+    Returns:
+        Optional[OpenOrder]: A ordem cancelada, ou None se não existir (ou já tiver sido executada)
+    """
+    params = {"order_id": order_id, "user_id": user_id}
+    card_id = (await session.execute(_ORDER_CARD_SQL, params)).scalar_one_or_none()
+    if card_id is None:
+        return None
+    # Não some do livro no meio de um casamento do mesmo card
+    await _lock_book(session, card_id)
+    row = (await session.execute(_CANCEL_SQL, params)).first()
+    if row is None:
+        return None
+    order = OpenOrder(*row)
+    if order.side == SIDE_SELL:
+        await add_cards(session, user_id, {order.card_id: order.quantity})
+    else:
+        await credit_coins(session, {user_id: order.price * order.quantity})
+    return order
+
+
+async def get_order_book(
+    session: AsyncSession,
+    card_id: int,
+    depth: int = BOOK_DEPTH
+) -> Tuple[List[BookLevel], List[BookLevel]]:
+    """
+    Melhores níveis de preço do card.
+
+    Returns:
+        Tuple[List[BookLevel], List[BookLevel]]: (vendas do menor preço, compras do maior preço)
+    """
+    params = {"card_id": card_id, "depth": depth}
+    asks = (await session.execute(_BOOK_SQL[SIDE_SELL], params)).all()
+    bids = (await session.execute(_BOOK_SQL[SIDE_BUY], params)).all()
+    return [BookLevel(*row) for row in asks], [BookLevel(*row) for row in bids]
+
+
+async def get_user_orders(session: AsyncSession, user_id: int, limit: int = 20) -> List[OpenOrder]:
+    """Ordens em aberto do usuário, das mais recentes para as mais antigas."""
+    rows = (await session.execute(_USER_ORDERS_SQL, {"user_id": user_id, "limit": limit})).all()
+    return [OpenOrder(*row) for row in rows]
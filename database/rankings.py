@@ -0,0 +1,142 @@
+import asyncio
+import logging
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.leaderboards import RANK_COUNT_LIMIT, UserRank
+from database.session import get_session
+
+logger = logging.getLogger(__name__)
+
+RANKING_PAGE_SIZE = 50
+
+# Intervalo (em segundos) entre atualizações da view category_rankings
+RANKING_REFRESH_INTERVAL = 300
+
+# Modo do ranking -> (coluna em users, coluna em category_rankings). "completo"
+# ordena pelos cards diferentes, que é a mesma ordem da porcentagem de conclusão.
+RANKING_MODES = {
+    "total": ("cards_total", "owned_total"),
+    "completo": ("cards_distinct", "owned_distinct"),
+}
+
+
+class RankingEntry(NamedTuple):
+    user_id: int
+    nickname: str
+    total: int
+    distinct_cards: int
+
+
+# Ranking global: lido direto dos contadores de users, pelos índices
+# ix_users_cards_total / ix_users_cards_distinct
+_GLOBAL_SOURCE = """
+    SELECT id AS user_id, nickname, cards_total AS total, cards_distinct AS distinct_cards
+    FROM users
+"""
+
+# Ranking por categoria: view materializada category_rankings (migração 0007),
+# montada a partir de user_group_progress e atualizada periodicamente
+_CATEGORY_SOURCE = """
+    SELECT r.user_id, u.nickname, r.owned_total AS total, r.owned_distinct AS distinct_cards
+    FROM category_rankings AS r
+    JOIN users AS u ON u.id = r.user_id
+"""
+
+
+async def get_ranking(
+    session: AsyncSession,
+    mode: str = "total",
+    category_id: Optional[int] = None,
+    limit: int = RANKING_PAGE_SIZE
+) -> List[RankingEntry]:
+    """
+    Retorna o topo do ranking global (category_id=None) ou de uma categoria.
+
+    Args:
+        session: Sessão SQLAlchemy ativa
+        mode: Chave de RANKING_MODES
+        category_id: Categoria do ranking, ou None para o global
+        limit: Quantidade de posições
+
+    Returns:
+        List[RankingEntry]: Ranking em ordem decrescente
+    """
+    user_column, category_column = RANKING_MODES[mode]
+    if category_id is None:
+        sql = f"{_GLOBAL_SOURCE} WHERE {user_column} > 0 ORDER BY {user_column} DESC, id LIMIT :limit"
+    else:
+        sql = (
+            f"{_CATEGORY_SOURCE} WHERE r.category_id = :category_id AND r.{category_column} > 0 "
+            f"ORDER BY r.{category_column} DESC, r.user_id LIMIT :limit"
+        )
+    result = await session.execute(text(sql), {"limit": limit, "category_id": category_id})
+    return [RankingEntry(*row) for row in result.all()]
+
+
+async def get_user_rank(
+    session: AsyncSession,
+    user_id: int,
+    mode: str = "total",
+    category_id: Optional[int] = None
+) -> Optional[UserRank]:
+    """
+    Calcula a posição do usuário no ranking, contando (até RANK_COUNT_LIMIT)
+    quantos usuários estão à frente dele.
+
+    Returns:
+        Optional[UserRank]: Posição e valor do usuário, ou None se ele não pontuar
+    """
+    user_column, category_column = RANKING_MODES[mode]
+    if category_id is None:
+        sql = f"""
+            SELECT mine.{user_column} AS value, (
+                SELECT COUNT(*) FROM (
+                    SELECT 1 FROM users WHERE {user_column} > mine.{user_column} LIMIT :count_limit
+                ) AS above
+            ) AS above
+            FROM users AS mine
+            WHERE mine.id = :user_id AND mine.{user_column} > 0
+        """
+    else:
+        sql = f"""
+            SELECT mine.{category_column} AS value, (
+                SELECT COUNT(*) FROM (
+                    SELECT 1 FROM category_rankings AS r
+                    WHERE r.category_id = :category_id AND r.{category_column} > mine.{category_column}
+                    LIMIT :count_limit
+                ) AS above
+            ) AS above
+            FROM category_rankings AS mine
+            WHERE mine.category_id = :category_id AND mine.user_id = :user_id AND mine.{category_column} > 0
+        """
+    result = await session.execute(
+        text(sql),
+        {"user_id": user_id, "category_id": category_id, "count_limit": RANK_COUNT_LIMIT}
+    )
+    row = result.first()
+    if row is None:
+        return None
+    return UserRank(row.above + 1, row.value, row.above >= RANK_COUNT_LIMIT)
+
+
+async def refresh_category_rankings(session: AsyncSession) -> None:
+    """
+    Atualiza a view materializada category_rankings sem bloquear leituras
+    (REFRESH CONCURRENTLY, que usa o índice único da view). Não faz commit.
+    """
+    await session.execute(text("REFRESH MATERIALIZED VIEW CONCURRENTLY category_rankings"))
+
+
+async def scheduled_ranking_refresh():
+    """Atualiza periodicamente os rankings por categoria"""
+    while True:
+        await asyncio.sleep(RANKING_REFRESH_INTERVAL)
+        try:
+            async with get_session() as session:
+                await refresh_category_rankings(session)
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Erro ao atualizar os rankings por categoria: {str(e)}")
@@ -0,0 +1,174 @@
+import asyncio
+import logging
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select
+
+from database.catalog_cache import catalog_cache
+from database.models import MarketStock
+from database.session import get_session
+
+logger = logging.getLogger(__name__)
+
+# Raridades exibidas em "Capturas" no Pokémart
+SHOP_RARITIES = ("🥇", "🥈", "🥉")
+
+STOREFRONT_PAGE_SIZE = 5
+
+# Listagem da vitrine: (card_id, preço), na mesma ordem de exibição
+StorefrontKey = Tuple[int, int]
+
+
+class StorefrontEntry(NamedTuple):
+    card_id: int
+    name: str
+    rarity: str
+    price: int
+    available: int
+
+
+class StorefrontPage(NamedTuple):
+    entries: List[StorefrontEntry]
+    prev_key: Optional[StorefrontKey]   # Primeira listagem da página, se houver outras antes
+    next_key: Optional[StorefrontKey]   # Última listagem da página, se houver outras depois
+    total: int                          # Total de listagens na vitrine
+
+
+class StorefrontCache:
+    """
+    Vitrine do Pokémart ("Capturas") em memória: as listagens (card, preço)
+    com estoque, já ordenadas, e a quantidade disponível de cada uma.
+
+    É carregada uma vez a partir de market_stock e depois mantida com os
+    deltas de cada venda e compra (`apply`, chamado após o commit), então
+    navegar pelas páginas não consulta o banco. Nome e raridade vêm do
+    catalog_cache.
+    """
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self._loaded = False
+        self._loading = False
+        self._changed_while_loading = False
+        self._keys: List[StorefrontKey] = []
+        self._quantities: Dict[StorefrontKey, int] = {}
+
+    @staticmethod
+    def _listed(card_id: int) -> bool:
+        card = catalog_cache.get_card(card_id)
+        return card is not None and card.rarity in SHOP_RARITIES
+
+    async def load(self) -> None:
+        """Lê o estoque inteiro do banco e substitui a vitrine atual."""
+        await catalog_cache.ensure_loaded()
+        self._loading = True
+        self._changed_while_loading = False
+        try:
+            async with get_session() as session:
+                rows = (await session.execute(
+                    select(MarketStock.card_id, MarketStock.price, MarketStock.quantity)
+                    .where(MarketStock.quantity > 0)
+                )).all()
+        finally:
+            self._loading = False
+
+        quantities = {
+            (row.card_id, row.price): row.quantity for row in rows if self._listed(row.card_id)
+        }
+        self._quantities = quantities
+        self._keys = sorted(quantities)
+        # Um delta aplicado durante a leitura pode não estar na foto: recarrega no próximo acesso
+        self._loaded = not self._changed_while_loading
+
+        logger.info(f"Vitrine do Pokémart carregada: {len(self._keys)} listagens")
+
+    async def ensure_loaded(self) -> None:
+        """Carrega a vitrine se ela ainda não foi carregada ou foi invalidada."""
+        if self._loaded:
+            return
+        async with self._lock:
+            if not self._loaded:
+                await self.load()
+
+    def invalidate(self) -> None:
+        """Marca a vitrine como desatualizada; o próximo acesso fará a recarga."""
+        self._loaded = False
+
+    def _stale_catalog(self) -> None:
+        """A vitrine conhece um card que o catálogo não tem: invalida os dois."""
+        catalog_cache.invalidate()
+        self.invalidate()
+
+    def apply(self, deltas: Dict[StorefrontKey, int]) -> None:
+        """
+        Aplica variações de estoque já gravadas no banco.
+
+        Args:
+            deltas: {(card_id, preço): variação} (positiva na venda, negativa na compra)
+        """
+        if self._loading:
+            self._changed_while_loading = True
+        if not self._loaded:
+            return
+
+        for key, delta in deltas.items():
+            if not delta:
+                continue
+            if catalog_cache.get_card(key[0]) is None:
+                # Card novo que o catálogo em memória ainda não conhece: recarrega
+                # os dois em vez de perder o delta
+                self._stale_catalog()
+                return
+            if not self._listed(key[0]):
+                continue
+            quantity = self._quantities.get(key, 0) + delta
+            if quantity > 0:
+                if key not in self._quantities:
+                    insort(self._keys, key)
+                self._quantities[key] = quantity
+            elif key in self._quantities:
+                del self._quantities[key]
+                del self._keys[bisect_left(self._keys, key)]
+
+    def page(
+        self,
+        after: Optional[StorefrontKey] = None,
+        before: Optional[StorefrontKey] = None,
+        size: int = STOREFRONT_PAGE_SIZE
+    ) -> StorefrontPage:
+        """
+        Página da vitrine por chave (keyset): as listagens seguintes a `after`
+        ou as anteriores a `before`; sem nenhuma das duas, a primeira página.
+        """
+        keys = self._keys
+        if before is not None:
+            end = bisect_left(keys, before)
+            start = max(0, end - size)
+            if start == 0:
+                end = min(len(keys), size)
+        else:
+            start = bisect_right(keys, after) if after is not None else 0
+            end = min(len(keys), start + size)
+
+        entries = []
+        for card_id, price in keys[start:end]:
+            card = catalog_cache.get_card(card_id)
+            if card is None:
+                # Catálogo recarregado sem o card: pula a listagem e recarrega a vitrine
+                self._stale_catalog()
+                continue
+            entries.append(StorefrontEntry(
+                card_id, card.name, card.rarity, price, self._quantities[(card_id, price)]
+            ))
+
+        return StorefrontPage(
+            entries=entries,
+            prev_key=keys[start] if start > 0 else None,
+            next_key=keys[end - 1] if end < len(keys) else None,
+            total=len(keys),
+        )
+
+
+# Instância única compartilhada por todo o processo
+storefront_cache = StorefrontCache()
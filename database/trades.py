@@ -0,0 +1,121 @@
+import logging
+from datetime import datetime, timedelta
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Trade
+
+logger = logging.getLogger(__name__)
+
+TRADE_PENDING = "pending"
+TRADE_ACCEPTED = "accepted"
+TRADE_REJECTED = "rejected"
+TRADE_EXPIRED = "expired"
+
+# Propostas encerradas são apagadas depois desse tempo
+FINISHED_TRADE_RETENTION = timedelta(days=1)
+
+
+class ExpiredTrade(NamedTuple):
+    id: int
+    chat_id: int
+    message_id: Optional[int]
+
+
+async def create_trade(
+    session: AsyncSession,
+    chat_id: int,
+    requester_id: int,
+    target_id: int,
+    requested_cards: Sequence[Tuple[int, int]],
+    offered_cards: Sequence[Tuple[int, int]],
+    timeout: float
+) -> Trade:
+    """
+    Registra uma nova proposta de troca pendente. Não faz commit.
+
+    Args:
+        session: Sessão SQLAlchemy ativa
+        chat_id: Chat onde a proposta foi feita
+        requester_id: Quem propôs a troca
+        target_id: Único usuário que pode aceitar ou recusar
+        requested_cards: [(card_id, quantidade)] pedidos ao alvo
+        offered_cards: [(card_id, quantidade)] oferecidos pelo solicitante
+        timeout: Validade da proposta, em segundos
+
+    Returns:
+        Trade: Proposta criada (com id preenchido)
+    """
+    now = datetime.utcnow()
+    trade = Trade(
+        chat_id=chat_id,
+        requester_id=requester_id,
+        target_id=target_id,
+        requested_cards=[list(pair) for pair in requested_cards],
+        offered_cards=[list(pair) for pair in offered_cards],
+        status=TRADE_PENDING,
+        created_at=now,
+        expires_at=now + timedelta(seconds=timeout),
+    )
+    session.add(trade)
+    await session.flush()
+    return trade
+
+
+async def close_trade(session: AsyncSession, trade_id: int, target_id: int, status: str) -> bool:
+    """
+    Encerra uma proposta pendente e ainda válida com uma única transição
+    atômica de status (UPDATE condicional). Se dois cliques chegarem ao mesmo
+    tempo, só um deles consegue a transição. Não faz commit: se a transação
+    for desfeita, a proposta volta a ficar pendente.
+
+    Args:
+        session: Sessão SQLAlchemy ativa
+        trade_id: ID da proposta
+        target_id: Usuário que está respondendo (precisa ser o alvo)
+        status: TRADE_ACCEPTED ou TRADE_REJECTED
+
+    Returns:
+        bool: True se esta chamada encerrou a proposta
+    """
+    result = await session.execute(
+        update(Trade)
+        .where(
+            Trade.id == trade_id,
+            Trade.target_id == target_id,
+            Trade.status == TRADE_PENDING,
+            Trade.expires_at > datetime.utcnow(),
+        )
+        .values(status=status)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+async def expire_pending_trades(session: AsyncSession, now: Optional[datetime] = None) -> List[ExpiredTrade]:
+    """
+    Marca como expiradas, de uma vez, todas as propostas pendentes vencidas e
+    apaga as propostas encerradas há mais de FINISHED_TRADE_RETENTION.
+    Não faz commit.
+
+    Returns:
+        List[ExpiredTrade]: Propostas que expiraram agora (para editar as mensagens)
+    """
+    now = now or datetime.utcnow()
+    result = await session.execute(
+        update(Trade)
+        .where(Trade.status == TRADE_PENDING, Trade.expires_at <= now)
+        .values(status=TRADE_EXPIRED)
+        .returning(Trade.id, Trade.chat_id, Trade.message_id)
+        .execution_options(synchronize_session=False)
+    )
+    expired = [ExpiredTrade(*row) for row in result.all()]
+
+    await session.execute(
+        delete(Trade)
+        .where(Trade.status != TRADE_PENDING, Trade.expires_at <= now - FINISHED_TRADE_RETENTION)
+        .execution_options(synchronize_session=False)
+    )
+    return expired
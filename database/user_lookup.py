@@ -0,0 +1,171 @@
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Set
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import User
+
+logger = logging.getLogger(__name__)
+
+# Quantidade de referências (@username / nickname) guardadas no LRU
+USER_LOOKUP_CACHE_SIZE = 4096
+
+# Busca exata; o índice funcional usado é o de lower(username) / lower(nickname)
+# (migração 0008). Um @username tem prioridade sobre um nickname igual.
+_EXACT_SQL = text(
+    """
+    SELECT id FROM (
+        SELECT id, 0 AS priority FROM users WHERE lower(username) = :ref
+        UNION ALL
+        SELECT id, 1 AS priority FROM users WHERE lower(nickname) = :ref
+    ) AS m
+    ORDER BY priority, id
+    LIMIT 1
+    """
+)
+
+# Busca por prefixo: só resolve se houver um único usuário candidato
+_PREFIX_SQL = text(
+    """
+    SELECT DISTINCT id FROM (
+        SELECT id FROM users WHERE lower(username) LIKE :pattern
+        UNION ALL
+        SELECT id FROM users WHERE lower(nickname) LIKE :pattern
+    ) AS m
+    LIMIT 2
+    """
+)
+
+
+def normalize_reference(reference: str) -> str:
+    """Remove o @ e espaços e passa para minúsculas."""
+    return reference.strip().lstrip("@").strip().lower()
+
+
+def _like_prefix(value: str) -> str:
+    escaped = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"{escaped}%"
+
+
+class UserLookupCache:
+    """
+    LRU de referência normalizada -> ID do usuário.
+
+    Só resultados positivos são guardados. Como um nome novo pode tornar uma
+    referência exata ou ambígua, `invalidate_names` descarta toda referência
+    que seja prefixo de um nome alterado, e `invalidate_user` descarta as
+    referências que apontavam para o usuário.
+    """
+
+    def __init__(self, max_size: int = USER_LOOKUP_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._refs_by_user: Dict[int, Set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, ref: str) -> Optional[int]:
+        user_id = self._entries.get(ref)
+        if user_id is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(ref)
+        self.hits += 1
+        return user_id
+
+    def put(self, ref: str, user_id: int) -> None:
+        self._discard(ref)
+        self._entries[ref] = user_id
+        self._refs_by_user.setdefault(user_id, set()).add(ref)
+        while len(self._entries) > self.max_size:
+            oldest, _ = next(iter(self._entries.items()))
+            self._discard(oldest)
+
+    def _discard(self, ref: str) -> None:
+        user_id = self._entries.pop(ref, None)
+        if user_id is not None:
+            refs = self._refs_by_user.get(user_id)
+            if refs is not None:
+                refs.discard(ref)
+                if not refs:
+                    del self._refs_by_user[user_id]
+
+    def invalidate_user(self, user_id: int) -> None:
+        for ref in list(self._refs_by_user.get(user_id, ())):
+            self._discard(ref)
+
+    def invalidate_names(self, *names: Optional[str]) -> None:
+        normalized = [normalize_reference(name) for name in names if name]
+        if not normalized:
+            return
+        for ref in [r for r in self._entries if any(name.startswith(r) for name in normalized)]:
+            self._discard(ref)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._refs_by_user.clear()
+
+
+# Instância única compartilhada por todo o processo
+user_lookup_cache = UserLookupCache()
+
+
+def invalidate_user_names(user_id: Optional[int], *names: Optional[str]) -> None:
+    """
+    Deve ser chamada sempre que um usuário é criado ou muda de @username ou
+    nickname, passando os nomes antigos e novos.
+    """
+    if user_id is not None:
+        user_lookup_cache.invalidate_user(user_id)
+    user_lookup_cache.invalidate_names(*names)
+
+
+async def resolve_user_id(session: AsyncSession, reference: str) -> Optional[int]:
+    """
+    Resolve um @username, nickname ou ID do Telegram para o ID do usuário.
+
+    Ordem: @username ou nickname exato (sem diferenciar maiúsculas), depois
+    prefixo único de @username ou nickname e, por fim, o ID numérico.
+
+    Args:
+        session: Sessão SQLAlchemy ativa
+        reference: Texto informado no comando
+
+    Returns:
+        Optional[int]: ID do usuário, ou None se não encontrado ou ambíguo
+    """
+    ref = normalize_reference(reference)
+    if not ref:
+        return None
+
+    user_id = user_lookup_cache.get(ref)
+    if user_id is not None:
+        return user_id
+
+    user_id = (await session.execute(_EXACT_SQL, {"ref": ref})).scalar_one_or_none()
+    if user_id is None:
+        rows = (await session.execute(_PREFIX_SQL, {"pattern": _like_prefix(ref)})).scalars().all()
+        if len(rows) == 1:
+            user_id = rows[0]
+    if user_id is None and ref.isdigit():
+        user_id = (await session.execute(
+            text("SELECT id FROM users WHERE id = :id"), {"id": int(ref)}
+        )).scalar_one_or_none()
+
+    if user_id is not None:
+        user_lookup_cache.put(ref, user_id)
+    return user_id
+
+
+async def resolve_user(session: AsyncSession, reference: str) -> Optional[User]:
+    """Como resolve_user_id, mas carrega o usuário (pela chave primária)."""
+    user_id = await resolve_user_id(session, reference)
+    if user_id is None:
+        return None
+    user = await session.get(User, user_id)
+    if user is None:
+        # Usuário removido depois de entrar no cache
+        user_lookup_cache.invalidate_user(user_id)
+    return user
@@ -0,0 +1,113 @@
+"""
+Username Sync Middleware for Aiogram v3
+
+Observes `from_user.username` on every update and keeps `users.username`
+up to date without touching the database on the hot path: changed usernames
+are queued in memory and written in a single batched UPDATE every few seconds.
+
+Usage:
+  1) username_sync = UsernameSyncMiddleware(flush_interval=5)
+  2) dp.update.outer_middleware(username_sync)
+  3) asyncio.create_task(username_sync.run())
+"""
+
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+from sqlalchemy import text
+
+from database.session import get_session
+from database.user_lookup import invalidate_user_names
+
+logger = logging.getLogger("bot.middleware.username_sync")
+
+# O self-join com `old` lê o username anterior (snapshot de antes do UPDATE),
+# usado para invalidar o cache de resolução de usuários
+_SYNC_USERNAMES_SQL = text(
+    """
+    UPDATE users AS u SET username = v.username
+    FROM unnest(CAST(:ids AS BIGINT[]), CAST(:usernames AS VARCHAR[])) AS v(id, username),
+         users AS old
+    WHERE u.id = v.id AND old.id = u.id AND u.username IS DISTINCT FROM v.username
+    RETURNING u.id, old.username AS old_username, u.username
+    """
+)
+
+
+class UsernameSyncMiddleware(BaseMiddleware):
+    def __init__(self, flush_interval: float = 5, max_known: int = 100_000):
+        """
+        :param flush_interval: Seconds between batched writes
+        :param max_known:      Max number of users whose last username is remembered
+        """
+        super().__init__()
+        self.flush_interval = flush_interval
+        self.max_known = max_known
+
+        # Último username visto por usuário: { user_id: username }
+        self.known: "OrderedDict[int, str]" = OrderedDict()
+        # Usernames alterados aguardando a próxima escrita: { user_id: username }
+        self.pending: Dict[int, str] = {}
+        self.synced_total = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is not None and user.username:
+            self.observe(user.id, user.username)
+        return await handler(event, data)
+
+    def observe(self, user_id: int, username: str) -> None:
+        """Registra o username visto; só enfileira se ele mudou desde a última vez."""
+        if self.known.get(user_id) == username:
+            self.known.move_to_end(user_id)
+            return
+        self.known[user_id] = username
+        self.known.move_to_end(user_id)
+        if len(self.known) > self.max_known:
+            self.known.popitem(last=False)
+        self.pending[user_id] = username
+
+    async def flush(self) -> int:
+        """Grava os usernames pendentes em um único UPDATE; retorna quantos mudaram."""
+        if not self.pending:
+            return 0
+        batch, self.pending = self.pending, {}
+
+        try:
+            async with get_session() as session:
+                result = await session.execute(
+                    _SYNC_USERNAMES_SQL,
+                    {"ids": list(batch.keys()), "usernames": list(batch.values())}
+                )
+                changed = result.all()
+                await session.commit()
+        except Exception:
+            # Devolve à fila o que não foi sobrescrito por um username mais novo
+            for user_id, username in batch.items():
+                self.pending.setdefault(user_id, username)
+            raise
+
+        for row in changed:
+            invalidate_user_names(row.id, row.old_username, row.username)
+        if changed:
+            logger.info(f"[UsernameSync] {len(changed)} usernames atualizados")
+        self.synced_total += len(changed)
+        return len(changed)
+
+    async def run(self) -> None:
+        """Laço de escrita periódica; iniciar com asyncio.create_task."""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"[UsernameSync] Erro ao gravar usernames: {str(e)}")